@@ -0,0 +1,402 @@
+import os
+import glob
+import time
+import threading
+import itertools
+from collections import deque
+
+# Preview renditions from best to worst. Each remote viewer is moved between
+# these independently, based on the throughput its own connection achieves.
+TIERS = [
+    {"name": "high", "quality": 80, "width": 1280, "fps": 10},
+    {"name": "medium", "quality": 65, "width": 960, "fps": 6},
+    {"name": "low", "quality": 50, "width": 640, "fps": 4},
+    {"name": "min", "quality": 35, "width": 320, "fps": 2},
+]
+
+# Rough bytes-per-pixel of a JPEG at a given quality, used to guess the
+# size of a tier before we have encoded anything for it
+_BYTES_PER_PIXEL = {80: 0.20, 65: 0.14, 50: 0.10, 35: 0.07}
+
+
+# Camera folder -> (folder mtime, newest frame index) from the last lookup
+_latest_index = {}
+# Thinned or static stretches leave gaps in the indices; a longer run of
+# missing files than this falls back to scanning the folder
+_MAX_GAP = 16
+
+
+def _frame_path(folder, idx):
+    return os.path.join(folder, f"opencv{idx}.jpg")
+
+
+def _scan_latest_index(folder):
+    """Highest opencv<idx>.jpg index in a folder (None if there are none)"""
+    latest = None
+    with os.scandir(folder) as it:
+        for entry in it:
+            name = entry.name
+            if name.startswith("opencv") and name.endswith(".jpg"):
+                try:
+                    idx = int(name[6:-4])
+                except ValueError:
+                    continue
+                if latest is None or idx > latest:
+                    latest = idx
+    return latest
+
+
+def latest_camera_image(camera_id, root="."):
+    """
+    Path of the newest JPEG in the newest Images/cam<N>_* folder.
+
+    The folder is scanned once; after that the cached index is reused while
+    the folder's mtime is unchanged (no file added), and otherwise advanced
+    by checking the next few frame names, so a 100k-frame session costs a
+    couple of stat() calls per preview frame.
+    """
+    dirs = glob.glob(os.path.join(root, "Images", f"cam{camera_id}_*"))
+    if not dirs:
+        return None
+    latest_dir = max(dirs, key=os.path.getmtime)
+    try:
+        mtime = os.stat(latest_dir).st_mtime_ns
+    except OSError:
+        return None
+    cached_mtime, idx = _latest_index.get(latest_dir, (None, None))
+    if mtime != cached_mtime:
+        found = False
+        if idx is not None:
+            probe, missing = idx + 1, 0
+            while missing < _MAX_GAP:
+                if os.path.exists(_frame_path(latest_dir, probe)):
+                    idx, missing, found = probe, 0, True
+                else:
+                    missing += 1
+                probe += 1
+        if not found:
+            # First look, a long gap, or files were removed
+            try:
+                idx = _scan_latest_index(latest_dir)
+            except OSError:
+                return None
+        _latest_index[latest_dir] = (mtime, idx)
+    return _frame_path(latest_dir, idx) if idx is not None else None
+
+
+class ThroughputEstimator:
+    """
+    Sliding-window view of what one client connection actually absorbs.
+
+    A frame that fits into the socket buffer "sends" instantly, so a single
+    send time says little about the link. Over a window, though, the share of
+    wall time spent blocked in send (busy ratio) shows whether the link keeps
+    up, and bytes per blocked second estimates its capacity once it is busy.
+    """
+    def __init__(self, window=2.0, initial_bps=250_000):
+        self.window = window
+        self.samples = deque()
+        self.bps = initial_bps
+        self.busy_ratio = 0.0
+
+    def update(self, nbytes, seconds, now=None):
+        now = time.monotonic() if now is None else now
+        self.samples.append((now, nbytes, seconds))
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+        span = max(now - self.samples[0][0] + self.samples[0][2], 1e-3)
+        sent = sum(s[1] for s in self.samples)
+        busy = sum(s[2] for s in self.samples)
+        self.busy_ratio = min(busy / span, 1.0)
+        goodput = sent / span
+        # While the link is saturated goodput is its capacity; while it idles
+        # the capacity is at least goodput scaled by how little it was busy
+        self.bps = goodput / max(self.busy_ratio, 0.02)
+        return self.bps
+
+
+class TierController:
+    """
+    Pick the preview tier for one client from its measured throughput.
+
+    Downgrades happen as soon as the client spends most of its time blocked
+    in send. Upgrades need an idle link with headroom that holds for
+    `upgrade_hold` seconds; a tier that had to be abandoned doubles its hold
+    time so a client on marginal Wi-Fi does not flap between two tiers. While
+    the link idles with twice the headroom the better tier needs, that extra
+    hold decays with a `hold_half_life`, so a link that came back is used
+    again within seconds rather than after `max_hold`.
+    """
+    def __init__(self, tiers=TIERS, frame_size=None, start_tier=2,
+                 upgrade_margin=1.5, busy_high=0.6, busy_low=0.25,
+                 upgrade_hold=3.0, max_hold=60.0, hold_half_life=6.0):
+        self.tiers = tiers
+        self.frame_size = frame_size or self._guess_frame_size
+        self.tier_index = start_tier
+        self.upgrade_margin = upgrade_margin
+        self.busy_high = busy_high
+        self.busy_low = busy_low
+        self.upgrade_hold = upgrade_hold
+        self.max_hold = max_hold
+        self.hold_half_life = hold_half_life
+        self.hold = [upgrade_hold] * len(tiers)
+        self.estimator = ThroughputEstimator()
+        self._upgrade_since = None
+        self._tier_since = time.monotonic()
+        self._last_send = None
+        self.changes = 0
+
+    @property
+    def tier(self):
+        return self.tiers[self.tier_index]
+
+    @staticmethod
+    def _guess_frame_size(tier):
+        height = tier["width"] * 9 // 16
+        return tier["width"] * height * _BYTES_PER_PIXEL.get(tier["quality"], 0.15)
+
+    def required_bps(self, tier):
+        return self.frame_size(tier) * tier["fps"]
+
+    def _switch(self, index, now):
+        self.tier_index = index
+        self.changes += 1
+        self._upgrade_since = None
+        self._tier_since = now
+        self.estimator.samples.clear()
+
+    def record_send(self, nbytes, seconds, now=None):
+        """Feed one completed frame send; returns the tier for the next frame"""
+        now = time.monotonic() if now is None else now
+        bps = self.estimator.update(nbytes, seconds, now)
+        busy = self.estimator.busy_ratio
+        elapsed = now - self._last_send if self._last_send is not None else 0.0
+        self._last_send = now
+
+        # One send that takes longer than the frame interval is congestion
+        # even before the window has filled
+        stalled = seconds > 1.0 / self.tier["fps"]
+        settled = now - self._tier_since > 0.5
+        if now - self._tier_since > self.max_hold:
+            # Held this tier for a long time, so forgive its earlier failures
+            self.hold[self.tier_index] = self.upgrade_hold
+
+        if self.tier_index < len(self.tiers) - 1 and (stalled or (settled and busy > self.busy_high)):
+            # Leaving this tier: wait longer before trying it again
+            self.hold[self.tier_index] = min(self.hold[self.tier_index] * 2, self.max_hold)
+            self._switch(self.tier_index + 1, now)
+            return self.tier
+
+        if self.tier_index > 0 and settled:
+            better = self.tiers[self.tier_index - 1]
+            need = self.required_bps(better) * self.upgrade_margin
+            if busy < self.busy_low and bps > need:
+                if bps > 2 * need:
+                    # Plenty of room: an earlier failure of the better tier fades
+                    extra = self.hold[self.tier_index - 1] - self.upgrade_hold
+                    decay = 0.5 ** (elapsed / self.hold_half_life)
+                    self.hold[self.tier_index - 1] = self.upgrade_hold + extra * decay
+                if self._upgrade_since is None:
+                    self._upgrade_since = now
+                elif now - self._upgrade_since >= self.hold[self.tier_index - 1]:
+                    self._switch(self.tier_index - 1, now)
+            else:
+                self._upgrade_since = None
+        return self.tier
+
+
+class RenditionCache:
+    """
+    Encoded preview frames shared by every client on the same tier.
+
+    Only the newest source frame per camera is kept; the first client to ask
+    for a tier encodes it and the others wait for that result instead of
+    encoding the same rendition again.
+    """
+    def __init__(self, tiers=TIERS):
+        self.tiers = {t["name"]: t for t in tiers}
+        self.lock = threading.Lock()
+        self.entries = {}   # (camera_id, tier name) -> (source key, jpeg bytes)
+        self.pending = {}   # (camera_id, tier name, source key) -> Event
+        self.sizes = {}     # tier name -> EWMA of encoded bytes
+        self.encodes = 0
+        self.hits = 0
+
+    def frame_size(self, tier):
+        return self.sizes.get(tier["name"]) or TierController._guess_frame_size(tier)
+
+    def get(self, camera_id, tier, source_key, source_path):
+        key = (camera_id, tier["name"])
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry and entry[0] == source_key:
+                    self.hits += 1
+                    return entry[1]
+                pending_key = key + (source_key,)
+                event = self.pending.get(pending_key)
+                if event is None:
+                    event = threading.Event()
+                    self.pending[pending_key] = event
+                    break
+            event.wait(timeout=2.0)
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry and entry[0] == source_key:
+                    self.hits += 1
+                    return entry[1]
+            # The encoder failed or timed out; fall back to the last good frame
+            return entry[1] if entry else None
+
+        try:
+            data = self._encode(source_path, tier)
+            with self.lock:
+                if data is not None:
+                    self.entries[key] = (source_key, data)
+                    self.encodes += 1
+                    old = self.sizes.get(tier["name"])
+                    self.sizes[tier["name"]] = len(data) if old is None else 0.8 * old + 0.2 * len(data)
+                else:
+                    entry = self.entries.get(key)
+                    data = entry[1] if entry else None
+            return data
+        finally:
+            with self.lock:
+                self.pending.pop(pending_key, None)
+            event.set()
+
+    @staticmethod
+    def _encode(source_path, tier):
+        import cv2
+        frame = cv2.imread(source_path)
+        if frame is None:
+            # Usually the writer is still in the middle of this file
+            return None
+        height, width = frame.shape[:2]
+        if width > tier["width"]:
+            new_height = int(height * tier["width"] / width)
+            frame = cv2.resize(frame, (tier["width"], new_height), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, tier["quality"]])
+        return buf.tobytes() if ok else None
+
+
+class PreviewClient:
+    """Per-connection state: its controller and the frames it has been sent"""
+    _ids = itertools.count(1)
+
+    def __init__(self, camera_id, cache, remote=None):
+        self.id = next(self._ids)
+        self.camera_id = camera_id
+        self.remote = remote
+        self.controller = TierController(frame_size=cache.frame_size)
+        self.frames = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-3)
+        return {
+            "id": self.id,
+            "camera": self.camera_id,
+            "remote": self.remote,
+            "tier": self.controller.tier["name"],
+            "estimated_kbps": round(self.controller.estimator.bps * 8 / 1000, 1),
+            "busy_ratio": round(self.controller.estimator.busy_ratio, 2),
+            "sent_frames": self.frames,
+            "avg_fps": round(self.frames / elapsed, 2),
+            "tier_changes": self.controller.changes,
+        }
+
+
+class AdaptivePreview:
+    """MJPEG preview stream that adapts quality, size and rate per client"""
+    BOUNDARY = "frame"
+
+    def __init__(self, root=".", tiers=TIERS):
+        self.root = root
+        self.cache = RenditionCache(tiers)
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def stream(self, camera_id, remote=None):
+        """Generator of multipart/x-mixed-replace chunks for one client"""
+        client = PreviewClient(camera_id, self.cache, remote)
+        with self.lock:
+            self.clients[client.id] = client
+        last_source = None
+        try:
+            while True:
+                tier = client.controller.tier
+                frame_start = time.monotonic()
+
+                path = latest_camera_image(camera_id, self.root)
+                if path is None:
+                    time.sleep(1.0)
+                    continue
+                try:
+                    source_key = (path, os.stat(path).st_mtime_ns)
+                except OSError:
+                    continue
+                if source_key == last_source:
+                    # Nothing new from the camera yet
+                    time.sleep(0.5 / tier["fps"])
+                    continue
+
+                data = self.cache.get(camera_id, tier, source_key, path)
+                if data is None:
+                    time.sleep(0.05)
+                    continue
+                last_source = source_key
+
+                chunk = (f"--{self.BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                         f"Content-Length: {len(data)}\r\n\r\n").encode() + data + b"\r\n"
+                # The WSGI server writes the chunk to the socket before it asks
+                # the generator for the next one, so the time spent suspended in
+                # yield is the time the client's connection took to absorb it
+                send_start = time.monotonic()
+                yield chunk
+                send_time = time.monotonic() - send_start
+
+                client.frames += 1
+                client.bytes += len(chunk)
+                client.controller.record_send(len(chunk), send_time)
+
+                remaining = 1.0 / tier["fps"] - (time.monotonic() - frame_start)
+                if remaining > 0:
+                    time.sleep(remaining)
+        finally:
+            with self.lock:
+                self.clients.pop(client.id, None)
+
+    def stats(self):
+        with self.lock:
+            clients = [c.stats() for c in self.clients.values()]
+        return {
+            "clients": clients,
+            "encodes": self.cache.encodes,
+            "cache_hits": self.cache.hits,
+            "tier_frame_bytes": {name: int(size) for name, size in self.cache.sizes.items()},
+        }
+
+
+def register_preview_routes(app, root="."):
+    """Add the adaptive preview stream endpoints to the image server Flask app"""
+    from flask import Response, jsonify, request
+
+    preview = AdaptivePreview(root)
+
+    @app.route('/camera<int:camera_id>_stream')
+    def camera_stream(camera_id):
+        """Adaptive MJPEG stream; open it directly in a browser or VLC"""
+        return Response(preview.stream(camera_id, request.remote_addr),
+                        mimetype=f"multipart/x-mixed-replace; boundary={AdaptivePreview.BOUNDARY}",
+                        headers={"Cache-Control": "no-cache"},
+                        direct_passthrough=True)
+
+    @app.route('/preview/stats')
+    def preview_stats():
+        """Current tier and measured throughput of each preview client"""
+        return jsonify(preview.stats())
+
+    return preview
@@ -0,0 +1,121 @@
+"""
+Encode time, size and fidelity of the JPEG backends at different settings.
+
+Encodes the same 1920x1080 frames with every backend, quality, chroma
+subsampling and DCT combination and prints, per setting, the CPU time per
+frame, the share of one core two cameras at 20 fps would need, the size per
+frame and the PSNR against the source frame. Settings marked * are on the
+Pareto front: no other setting is at least as good on all of PSNR, size and
+CPU time. Frames come from a recorded session folder or a video file when
+given, otherwise they are synthetic.
+
+    python3 bench_jpeg.py --input Images/cam0_20250421_101500
+    python3 bench_jpeg.py --input flight.mp4 --quality 95 90 80 --subsampling 420 444
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from jpeg_encoder import BACKENDS, get_encoder
+
+
+def load_frames(path, count, width=1920, height=1080):
+    if not path:
+        # Smooth gradients plus noise, closer to a cockpit than pure noise
+        rng = np.random.default_rng(0)
+        y, x = np.mgrid[0:height, 0:width]
+        frames = []
+        for i in range(min(count, 10)):
+            base = np.dstack([(x + 7 * i) % 256, (y + 3 * i) % 256, ((x + y) // 2) % 256]).astype(np.int16)
+            frames.append(np.clip(base + rng.normal(0, 6, base.shape), 0, 255).astype(np.uint8))
+        return frames
+    if os.path.isdir(path):
+        paths = sorted(glob.glob(os.path.join(path, "opencv*.jpg")))
+        # Spread the sample over the whole session
+        paths = paths[::max(1, len(paths) // count)][:count]
+        frames = [cv2.imread(p) for p in paths]
+    else:
+        cap = cv2.VideoCapture(path)
+        frames = []
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    frames = [cv2.resize(f, (width, height)) for f in frames if f is not None]
+    if not frames:
+        raise SystemExit(f"Could not read frames from {path}")
+    return frames
+
+
+def bench(encoder, frames, repeat):
+    """(CPU ms per frame, KB per frame, mean PSNR) of one encoder"""
+    cpu = 0.0
+    size = 0
+    psnr = 0.0
+    for frame in frames:
+        t0 = time.thread_time()
+        for _ in range(repeat):
+            data = encoder.encode(frame)
+        cpu += (time.thread_time() - t0) / repeat
+        size += len(data)
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        psnr += cv2.PSNR(frame, decoded)
+    n = len(frames)
+    return 1000 * cpu / n, size / n / 1024, psnr / n
+
+
+def pareto(results):
+    """Indices of the results no other result beats or equals on every axis"""
+    front = []
+    for i, (_, ms, kb, db) in enumerate(results):
+        dominated = any(
+            o_ms <= ms and o_kb <= kb and o_db >= db and (o_ms, o_kb, o_db) != (ms, kb, db)
+            for j, (_, o_ms, o_kb, o_db) in enumerate(results) if j != i
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input", help="session folder or video file to take frames from (default: synthetic)")
+    parser.add_argument("--frames", type=int, default=20, help="frames to encode per setting")
+    parser.add_argument("--repeat", type=int, default=3, help="encodes per frame (the mean is timed)")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--quality", nargs="+", type=int, default=[95, 90, 85, 80, 70])
+    parser.add_argument("--subsampling", nargs="+", default=["420", "422"], choices=["420", "422", "444"])
+    parser.add_argument("--fps", type=float, default=20.0, help="per camera, for the CPU share column")
+    args = parser.parse_args()
+
+    frames = load_frames(args.input, args.frames)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    results = []
+    for backend in args.backends:
+        probe = get_encoder(backend)
+        if probe.name != backend:
+            continue  # library not installed, get_encoder already said so
+        # OpenCV cannot switch the DCT, so only the TurboJPEG backend tries both
+        dct_options = (False, True) if backend == "turbojpeg" else (False,)
+        for subsampling in args.subsampling:
+            for quality in args.quality:
+                for fast_dct in dct_options:
+                    encoder = get_encoder(backend, quality=quality, subsampling=subsampling, fast_dct=fast_dct)
+                    results.append((repr(encoder), *bench(encoder, frames, args.repeat)))
+
+    front = set(pareto(results))
+    print(f"  {'setting':<36}{'CPU ms':>8}{'core %':>8}{'KB':>8}{'PSNR dB':>9}")
+    for i, (name, ms, kb, db) in sorted(enumerate(results), key=lambda item: item[1][2]):
+        # Two cameras at args.fps
+        core = ms * 2 * args.fps / 10
+        print(f"{'*' if i in front else ' '} {name:<36}{ms:>8.2f}{core:>8.1f}{kb:>8.0f}{db:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Before/after timing of the frame overlay.
+
+Draws the six stamp_video lines onto 1920x1080 frames with the legacy
+per-line cv2.getTextSize plus two cv2.putText calls, then with the cached
+OverlayRenderer, and prints the cost per frame of each. Frames come from a
+video file when one is given, otherwise they are synthetic noise.
+
+    python3 bench_overlay.py
+    python3 bench_overlay.py --input Images/cam0_3/output.mp4 --frames 500
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from overlay import OverlayRenderer
+
+COLORS = [(0, 0, 255), (0, 255, 0), (0, 200, 200), (255, 0, 0), (255, 0, 0), (255, 255, 0)]
+
+
+def load_frames(path, count, width=1920, height=1080):
+    if not path:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(min(count, 30))]
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < min(count, 30):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (width, height)))
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read frames from {path}")
+    return frames
+
+
+def frame_texts(i, start):
+    """The same strings process_frame draws, advancing like a 20 fps recording"""
+    t = start + i / 20.0
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) + f".{int(t * 1000) % 1000:03d}"
+    return [
+        f"Frame {i + 1}",
+        f"GPS Time: {stamp}",
+        f"Sys Time: {stamp}",
+        # The GPS fix only updates once a second
+        f"Lat: {47.6205 + (i // 20) * 1e-6:.7f}",
+        f"Lon: {-122.3493 - (i // 20) * 1e-6:.7f}",
+        f"FPS: {20 + (i % 7) * 0.01:.2f}",
+    ]
+
+
+def draw_legacy(frame, texts):
+    width = frame.shape[1]
+    for i, (text, color) in enumerate(zip(texts, COLORS)):
+        (text_width, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)
+        x = width - text_width - 20
+        y = 40 + i * 35
+        cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 3)
+        cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+
+def bench(name, draw, frames, count, start):
+    # Copy each frame first (stamp_video draws into fresh frames too) and
+    # time only the drawing
+    total = 0.0
+    for i in range(count):
+        frame = frames[i % len(frames)].copy()
+        texts = frame_texts(i, start)
+        t0 = time.perf_counter()
+        draw(frame, texts)
+        total += time.perf_counter() - t0
+    ms = 1000 * total / count
+    print(f"{name:8s} {ms:7.3f} ms/frame")
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input", help="video file to take frames from (default: synthetic)")
+    parser.add_argument("--frames", type=int, default=1000, help="frames to draw per method")
+    args = parser.parse_args()
+
+    frames = load_frames(args.input, args.frames)
+    start = time.time()
+    legacy = bench("putText", draw_legacy, frames, args.frames, start)
+    renderer = OverlayRenderer(COLORS, font_size=0.8, font_thickness=2, line_height=35,
+                               margin=20, top=40, align="right")
+    cached = bench("cached", renderer.draw, frames, args.frames, start)
+    print(f"overlay {legacy / max(cached, 1e-9):.1f}x faster, "
+          f"saves {legacy - cached:.2f} ms per frame per camera")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import os
+import json
+import socket
+import tempfile
+
+# stamp_video listens here for commands from the image server and the shell
+DEFAULT_CONTROL_PATH = "/tmp/aerobatic_capture.sock"
+
+
+class CaptureControl:
+    """
+    Non-blocking command socket polled from the stamp_video capture loop.
+
+    Commands are JSON datagrams ({"cmd": "trigger", ...}) on a Unix socket,
+    so polling costs one failed recv per loop when nobody is talking and
+    the capture loop never blocks on a slow client.
+    """
+    def __init__(self, path=DEFAULT_CONTROL_PATH):
+        self.path = path
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+        self.sock.setblocking(False)
+
+    def poll(self):
+        """Pending (command dict, reply address) pairs"""
+        commands = []
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return commands
+            try:
+                command = json.loads(data)
+            except ValueError:
+                self.reply(addr, {"ok": False, "error": "invalid JSON"})
+                continue
+            commands.append((command, addr))
+
+    def reply(self, addr, response):
+        if not addr:
+            return  # the client did not bind a socket to hear back on
+        try:
+            self.sock.sendto(json.dumps(response).encode(), addr)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def send_command(cmd, path=DEFAULT_CONTROL_PATH, timeout=1.0, **args):
+    """Send a command to stamp_video and wait for its reply (None if it is not running)"""
+    reply_path = os.path.join(tempfile.gettempdir(), f"aerobatic_capture_client_{os.getpid()}_{id(args)}.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.bind(reply_path)
+        sock.settimeout(timeout)
+        sock.sendto(json.dumps({"cmd": cmd, **args}).encode(), path)
+        return json.loads(sock.recv(4096))
+    except (OSError, ValueError):
+        return None
+    finally:
+        sock.close()
+        try:
+            os.unlink(reply_path)
+        except FileNotFoundError:
+            pass
+
+
+def register_control_routes(app, path=DEFAULT_CONTROL_PATH):
+    """
+    POST /trigger: record the last few seconds and the next window at full rate.
+    GET /session, POST /session/start, /session/stop, /session/rotate: switch
+    recording sessions without restarting stamp_video.
+    POST /capture/trace: dump the per-frame latency trace and return its summary.
+    """
+    from flask import jsonify, request
+
+    def forward(cmd, **args):
+        response = send_command(cmd, path, **args)
+        if response is None:
+            return jsonify({"ok": False, "error": "stamp_video is not running"}), 503
+        return jsonify(response), (200 if response.get("ok") else 409)
+
+    @app.route('/session')
+    def session_status():
+        return forward("status")
+
+    @app.route('/session/<action>', methods=['POST'])
+    def session_action(action):
+        if action not in ("start", "stop", "rotate"):
+            return jsonify({"ok": False, "error": f"unknown action {action!r}"}), 404
+        return forward(action)
+
+    @app.route('/capture/trace', methods=['POST'])
+    def capture_trace():
+        return forward("trace")
+
+    @app.route('/trigger', methods=['POST'])
+    def trigger():
+        args = {"reason": request.values.get("reason", "manual")}
+        if "duration" in request.values:
+            args["duration"] = request.values.get("duration", type=float)
+        response = send_command("trigger", path, **args)
+        if response is None:
+            return jsonify({"ok": False, "error": "stamp_video is not running"}), 503
+        return jsonify(response), (200 if response.get("ok") else 400)
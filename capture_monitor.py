@@ -0,0 +1,137 @@
+import os
+import json
+import time
+from collections import deque
+
+DEFAULT_STATUS_PATH = "capture_status.json"
+
+
+class CaptureMonitor:
+    """
+    Measure what a camera really delivers, from V4L2 buffer timestamps.
+
+    With the V4L2 backend, CAP_PROP_POS_MSEC is the kernel timestamp of the
+    dequeued buffer (CLOCK_MONOTONIC, set when the driver filled it), not
+    the time we got around to reading it. A gap of more than `tolerance`
+    frame periods between consecutive buffers means the driver dropped
+    frames, typically because every buffer was full while stamp_video was
+    busy. OpenCV does not expose the buffer sequence number and owns the
+    buffers, so the sequence has to be inferred from the timestamps.
+
+    When a backend gives no timestamps the time of the read is used
+    instead, which still catches long stalls. Gaps in the first
+    `warmup_frames` are ignored: those buffers were queued before recording
+    started (while stamp_video waited for the other camera and a GPS fix).
+    """
+    def __init__(self, name, nominal_fps=20.0, tolerance=1.5, window=5.0, warmup_frames=10):
+        import cv2
+        self._pos_msec = cv2.CAP_PROP_POS_MSEC
+        self.name = name
+        self.nominal_period = 1.0 / nominal_fps
+        self.period = self.nominal_period
+        self.tolerance = tolerance
+        self.window = window
+        self.warmup_frames = warmup_frames
+        self.last_ts = None
+        self.frames = 0
+        self.dropped = 0
+        self.gaps = 0
+        self.max_gap = 0.0
+        self.kernel_timestamps = None
+        self.recent = deque()           # (timestamp, frames delivered) in the window
+        self.latency = 0.0
+
+    def observe(self, camera, read_time=None):
+        """
+        Call right after camera.read(); returns (buffer timestamp, frames
+        dropped just before this one). The timestamp is in seconds on the
+        time.monotonic() clock.
+        """
+        read_time = time.monotonic() if read_time is None else read_time
+        pos_msec = camera.get(self._pos_msec)
+        if self.kernel_timestamps is None:
+            # Some backends report 0, -1 or the position in a file instead
+            self.kernel_timestamps = pos_msec > 0 and abs(pos_msec / 1000.0 - read_time) < 10.0
+            if not self.kernel_timestamps:
+                print(f"[{self.name}] no V4L2 buffer timestamps, measuring gaps at read time")
+        ts = pos_msec / 1000.0 if self.kernel_timestamps else read_time
+        return ts, self.update(ts, read_time)
+
+    def update(self, ts, read_time=None):
+        """Account for one delivered frame with buffer timestamp ts"""
+        dropped = 0
+        if self.last_ts is not None:
+            delta = ts - self.last_ts
+            if self.frames < self.warmup_frames:
+                pass
+            elif delta > self.tolerance * self.period:
+                dropped = max(int(round(delta / self.period)) - 1, 1)
+                self.dropped += dropped
+                self.gaps += 1
+                self.max_gap = max(self.max_gap, delta)
+            elif delta > 0:
+                # Track the real frame period (cameras slow down in low light
+                # when exposure gets long), but never below the nominal one
+                self.period = max(0.9 * self.period + 0.1 * delta, self.nominal_period)
+        self.last_ts = ts
+        self.frames += 1
+        if read_time is not None:
+            # How long the frame sat in the driver queue before we read it
+            self.latency = read_time - ts
+
+        self.recent.append((ts, dropped))
+        while self.recent and ts - self.recent[0][0] > self.window:
+            self.recent.popleft()
+        return dropped
+
+    @property
+    def fps(self):
+        """Frames actually delivered per second over the recent window"""
+        if len(self.recent) < 2:
+            return 0.0
+        span = self.recent[-1][0] - self.recent[0][0]
+        return (len(self.recent) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        recent_dropped = sum(d for _, d in self.recent)
+        recent_total = len(self.recent) + recent_dropped
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "gaps": self.gaps,
+            "drop_percent": round(100.0 * self.dropped / max(self.frames + self.dropped, 1), 2),
+            "recent_drop_percent": round(100.0 * recent_dropped / max(recent_total, 1), 2),
+            "fps": round(self.fps, 2),
+            "frame_period_ms": round(1000 * self.period, 2),
+            "max_gap_ms": round(1000 * self.max_gap, 1),
+            "queue_latency_ms": round(1000 * self.latency, 1),
+            "kernel_timestamps": self.kernel_timestamps,
+        }
+
+
+def write_capture_status(monitors, path=DEFAULT_STATUS_PATH, storage=None, analyzers=None):
+    """Write every monitor's counters (and the staged write and frame bus stats) to a JSON file for the image server"""
+    status = {"time": time.time(), "cameras": {m.name: m.stats() for m in monitors}}
+    if storage is not None:
+        status["storage"] = storage
+    if analyzers is not None:
+        status["analyzers"] = analyzers
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def register_capture_routes(app, status_path=DEFAULT_STATUS_PATH):
+    """GET /capture/stats: the live counters written by stamp_video"""
+    from flask import jsonify
+
+    @app.route('/capture/stats')
+    def capture_stats():
+        try:
+            with open(status_path) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return jsonify({"error": "stamp_video is not running"}), 503
+        status["age_s"] = round(time.time() - status.get("time", 0), 1)
+        return jsonify(status)
@@ -0,0 +1,320 @@
+"""
+Convert finished camera sessions from JPEG sequences to segmented video.
+
+Each Images/cam*_<ts> folder (and its proxy/ and roi/<name>/ subfolders)
+is encoded in frame index order into video/segment_NNN.mp4 with ffmpeg,
+under nice and ionice. Every frame's timing comes from frames.bin, so
+skipped frames and lower full-frame rates keep real time. The frame index,
+presentation time and EXIF timestamp of every frame go into
+video/frames.csv. A segment's JPEGs are only deleted after ffprobe confirms
+it holds every frame. Work stops (the encoder is SIGSTOPped) while
+stamp_video is recording, and resumes where it left off.
+
+    python3 compact_sessions.py                # compact everything finished, then exit
+    python3 compact_sessions.py --watch        # keep compacting as sessions finish
+    python3 compact_sessions.py --codec libx265 --dry-run
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import time
+
+FRAME_PATTERN = re.compile(r"opencv(\d+)\.jpg$")
+RECORDING_MARKER = ".recording"
+VIDEO_DIR = "video"
+
+
+def recording_dirs(root="Images"):
+    """Folders stamp_video is writing to right now (empty set if it is not running)"""
+    try:
+        with open(os.path.join(root, RECORDING_MARKER)) as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    try:
+        os.kill(marker["pid"], 0)
+    except (OSError, KeyError, TypeError):
+        return set()  # stale marker from a crashed recorder
+    return {os.path.abspath(d) for d in marker.get("dirs", [])}
+
+
+def is_recording(root="Images"):
+    return bool(recording_dirs(root))
+
+
+def mark_recording(dirs, root="Images"):
+    """Called by stamp_video when it starts writing to dirs"""
+    path = os.path.join(root, RECORDING_MARKER)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"pid": os.getpid(), "dirs": [os.path.abspath(d) for d in dirs], "since": time.time()}, f)
+    os.replace(path + ".tmp", path)
+
+
+def clear_recording(root="Images"):
+    try:
+        os.unlink(os.path.join(root, RECORDING_MARKER))
+    except FileNotFoundError:
+        pass
+
+
+def list_frames(folder):
+    """(index, filename) of the JPEGs in a folder, in frame order"""
+    frames = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            match = FRAME_PATTERN.match(entry.name)
+            if match:
+                frames.append((int(match.group(1)), entry.name))
+    frames.sort()
+    return frames
+
+
+def sequence_dirs(session):
+    """The session folder plus every subfolder holding a JPEG sequence"""
+    dirs = []
+    for dirpath, dirnames, filenames in os.walk(session):
+        dirnames[:] = [d for d in dirnames if d != VIDEO_DIR]
+        if any(FRAME_PATTERN.match(name) for name in filenames):
+            dirs.append(dirpath)
+    return dirs
+
+
+def frame_times(session):
+    """Frame index -> capture time (s) from the session's frames.bin, or {}"""
+    try:
+        from frame_log import open_frame_log
+        log = open_frame_log(session)
+    except (OSError, ValueError, ImportError):
+        return {}
+    if not len(log):
+        # Header only: the session stopped before its first frame was logged
+        return {}
+    # t_kernel is the most accurate capture time, when the camera provided it
+    field = "t_kernel" if "t_kernel" in log.dtype.names and log["t_kernel"][-1] > 0 else "t_mono"
+    return dict(zip(log["idx"].tolist(), log[field].tolist()))
+
+
+def exif_time(path):
+    """EXIF DateTime of a JPEG written by AsyncFrameWriter ('' if none)"""
+    try:
+        import piexif
+        exif = piexif.load(path)
+        value = exif.get("0th", {}).get(piexif.ImageIFD.DateTime, b"")
+        return value.decode(errors="replace") if isinstance(value, bytes) else str(value)
+    except Exception:
+        return ""
+
+
+class SessionCompactor:
+    def __init__(self, root="Images", codec="libx264", crf=20, preset="veryfast", segment_frames=6000,
+                 default_fps=20.0, settle_seconds=120.0, dry_run=False):
+        self.root = root
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.segment_frames = segment_frames
+        self.default_fps = default_fps
+        self.settle_seconds = settle_seconds
+        self.dry_run = dry_run
+        self.stats = {"segments": 0, "frames": 0, "bytes_in": 0, "bytes_out": 0, "failures": 0}
+
+    def finished_sessions(self):
+        """Camera sessions not being recorded and untouched for settle_seconds"""
+        active = recording_dirs(self.root)
+        now = time.time()
+        sessions = []
+        for session in sorted(glob.glob(os.path.join(self.root, "cam*_*"))):
+            if not os.path.isdir(session) or os.path.abspath(session) in active:
+                continue
+            if now - os.path.getmtime(session) < self.settle_seconds:
+                continue
+            if sequence_dirs(session):
+                sessions.append(session)
+        return sessions
+
+    def compact_session(self, session):
+        times = frame_times(session)
+        for folder in sequence_dirs(session):
+            if not self.compact_folder(folder, times):
+                return False
+        return True
+
+    def compact_folder(self, folder, times):
+        out_dir = os.path.join(folder, VIDEO_DIR)
+        frames = list_frames(folder)
+        while frames:
+            segment = frames[:self.segment_frames]
+            if not self._encode_segment(folder, out_dir, segment, times):
+                return False
+            frames = frames[len(segment):]
+        return True
+
+    def _next_segment(self, out_dir):
+        existing = glob.glob(os.path.join(out_dir, "segment_*.mp4"))
+        return max((int(re.search(r"segment_(\d+)", p).group(1)) for p in existing), default=-1) + 1
+
+    def _durations(self, segment, times):
+        """Display time of each frame: until the next saved frame"""
+        period = 1.0 / self.default_fps
+        durations = []
+        for (idx, _), (next_idx, _) in zip(segment, segment[1:] + [(None, None)]):
+            duration = None
+            if next_idx is not None and idx in times and next_idx in times:
+                duration = times[next_idx] - times[idx]
+            elif next_idx is not None:
+                duration = (next_idx - idx) * period
+            durations.append(duration if duration and duration > 0 else period)
+        return durations
+
+    def _encode_segment(self, folder, out_dir, segment, times):
+        number = self._next_segment(out_dir) if os.path.isdir(out_dir) else 0
+        output = os.path.join(out_dir, f"segment_{number:03d}.mp4")
+        durations = self._durations(segment, times)
+        bytes_in = sum(os.path.getsize(os.path.join(folder, name)) for _, name in segment)
+        print(f"[compact] {folder}: frames {segment[0][0]}-{segment[-1][0]} ({len(segment)}, "
+              f"{bytes_in / 1e6:.0f} MB) -> {output}")
+        if self.dry_run:
+            return True
+
+        os.makedirs(out_dir, exist_ok=True)
+        list_path = os.path.join(out_dir, f".segment_{number:03d}.ffconcat")
+        partial = output + ".partial.mp4"
+        with open(list_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            for (_, name), duration in zip(segment, durations):
+                f.write(f"file '../{name}'\nduration {duration:.6f}\n")
+
+        cmd = ["nice", "-n", "19", "ionice", "-c", "3",
+               "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+               "-f", "concat", "-safe", "0", "-i", list_path,
+               "-vsync", "vfr", "-c:v", self.codec, "-crf", str(self.crf), "-preset", self.preset,
+               "-pix_fmt", "yuv420p", "-movflags", "+faststart", partial]
+        if not self._run_pausable(cmd):
+            self._fail(partial, list_path, f"ffmpeg failed on {folder}")
+            return False
+
+        count = self._probe_frames(partial)
+        if count != len(segment):
+            self._fail(partial, list_path, f"{partial} has {count} frames, expected {len(segment)}")
+            return False
+        os.replace(partial, output)
+        os.unlink(list_path)
+
+        # Sidecar first, then delete: a crash in between leaves JPEGs that
+        # are simply encoded again into the next segment
+        sidecar = os.path.join(out_dir, "frames.csv")
+        new = not os.path.exists(sidecar)
+        with open(sidecar, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(["idx", "segment", "segment_frame", "pts", "exif_datetime"])
+            pts = 0.0
+            for n, ((idx, name), duration) in enumerate(zip(segment, durations)):
+                writer.writerow([idx, number, n, f"{pts:.6f}", exif_time(os.path.join(folder, name))])
+                pts += duration
+        for _, name in segment:
+            os.unlink(os.path.join(folder, name))
+
+        bytes_out = os.path.getsize(output)
+        self.stats["segments"] += 1
+        self.stats["frames"] += len(segment)
+        self.stats["bytes_in"] += bytes_in
+        self.stats["bytes_out"] += bytes_out
+        print(f"[compact] wrote {output}: {bytes_out / 1e6:.0f} MB ({bytes_in / max(bytes_out, 1):.1f}x smaller)")
+        return True
+
+    def _fail(self, partial, list_path, message):
+        print(f"[compact] {message}, keeping the JPEGs")
+        self.stats["failures"] += 1
+        for path in (partial, list_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _run_pausable(self, cmd):
+        """Run the encoder, stopping it with SIGSTOP while a recording is in progress"""
+        from process_supervisor import heartbeat
+        proc = subprocess.Popen(cmd)
+        paused = False
+        try:
+            while proc.poll() is None:
+                recording = is_recording(self.root)
+                if recording and not paused:
+                    print("[compact] recording started, pausing encoder")
+                    proc.send_signal(signal.SIGSTOP)
+                    paused = True
+                elif not recording and paused:
+                    print("[compact] recording stopped, resuming encoder")
+                    proc.send_signal(signal.SIGCONT)
+                    paused = False
+                heartbeat()
+                time.sleep(1.0)
+        finally:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGCONT)
+                proc.terminate()
+                proc.wait()
+        return proc.returncode == 0
+
+    @staticmethod
+    def _probe_frames(path):
+        try:
+            out = subprocess.run(
+                ["ffprobe", "-v", "error", "-count_packets", "-select_streams", "v:0",
+                 "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", path],
+                capture_output=True, text=True, timeout=600).stdout
+            return int(out.strip().splitlines()[0])
+        except (OSError, ValueError, IndexError, subprocess.TimeoutExpired):
+            return None
+
+    def run_once(self):
+        for session in self.finished_sessions():
+            if is_recording(self.root):
+                break
+            self.compact_session(session)
+
+    def watch(self, interval=60.0):
+        from process_supervisor import heartbeat
+        while True:
+            if not is_recording(self.root):
+                self.run_once()
+            deadline = time.monotonic() + interval
+            while time.monotonic() < deadline:
+                heartbeat()
+                time.sleep(min(5.0, interval))
+
+
+def compact_sessions(watch=False, **kwargs):
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        print("[compact] ffmpeg/ffprobe not found (sudo apt install ffmpeg)")
+        return
+    compactor = SessionCompactor(**kwargs)
+    if watch:
+        compactor.watch()
+    else:
+        compactor.run_once()
+    print(f"[compact] {compactor.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--root", default="Images")
+    parser.add_argument("--watch", action="store_true", help="keep running and compact sessions as they finish")
+    parser.add_argument("--codec", default="libx264", help="libx264, libx265 or h264_v4l2m2m (Pi hardware)")
+    parser.add_argument("--crf", type=int, default=20)
+    parser.add_argument("--segment-frames", type=int, default=6000, help="frames per segment (6000 = 5 min at 20 fps)")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be encoded")
+    args = parser.parse_args()
+    compact_sessions(watch=args.watch, root=args.root, codec=args.codec, crf=args.crf,
+                     segment_frames=args.segment_frames, dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
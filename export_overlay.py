@@ -0,0 +1,116 @@
+"""
+Burn the stamp and telemetry overlay into a recording made in deferred mode.
+
+In deferred mode (OVERLAY_MODE=deferred) stamp_video saves clean frames and
+writes the overlay text fields to overlay.jsonl in each camera folder. This
+tool reads them back and writes a review video with the text drawn in,
+decoding and drawing frames on a thread pool. The original frames are not
+modified, so the trackers keep working on clean pixels.
+
+    python3 export_overlay.py Images/cam0_20250421_101500
+    python3 export_overlay.py Images/cam0_* --fps 20 --workers 4
+"""
+import argparse
+import glob
+import os
+import re
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import cv2
+
+from overlay import TelemetryOverlay, read_overlay_log, stamp_lines, stamp_renderer
+from static_scene import read_repeats
+
+FRAME_PATTERN = re.compile(r"opencv(\d+)\.jpg$")
+
+
+def list_frames(folder):
+    """(index, path) of every saved frame, in recording order"""
+    frames = []
+    for path in glob.glob(os.path.join(folder, "opencv*.jpg")):
+        match = FRAME_PATTERN.search(path)
+        if match:
+            frames.append((int(match.group(1)), path))
+    frames.sort()
+    return frames
+
+
+class OverlayBurner:
+    """Draws recorded overlay fields into frames; safe to call from a thread pool"""
+    def __init__(self, fields):
+        self.fields = fields
+        self.telemetry = TelemetryOverlay()
+        self._local = threading.local()
+
+    def __call__(self, item):
+        idx, path = item
+        frame = cv2.imread(path)
+        if frame is None:
+            return idx, None
+        fields = self.fields.get(idx)
+        if fields is not None:
+            renderer = getattr(self._local, "renderer", None)
+            if renderer is None:
+                renderer = self._local.renderer = stamp_renderer()
+            renderer.draw(frame, stamp_lines(fields))
+            if "telemetry" in fields:
+                self.telemetry.draw_sample(frame, fields["telemetry"])
+        return idx, frame
+
+
+def export(folder, output=None, fps=20.0, workers=None):
+    frames = list_frames(folder)
+    if not frames:
+        print(f"No frames in {folder}")
+        return None
+    fields = read_overlay_log(folder)
+    # Frames skipped as static-scene repeats are written again so the video
+    # keeps real time
+    repeats = read_repeats(folder)
+    if not fields:
+        print(f"Warning: no overlay.jsonl in {folder}, exporting without overlay")
+    output = output or os.path.join(folder, "overlay.mp4")
+
+    burner = OverlayBurner(fields)
+    writer = None
+    missing = 0
+    start = time.time()
+    with ThreadPool(processes=workers or cv2.getNumberOfCPUs()) as pool:
+        # imap keeps frame order while the pool decodes and draws ahead
+        for idx, frame in pool.imap(burner, frames, chunksize=4):
+            if frame is None:
+                print(f"Could not read frame {idx}, skipping")
+                continue
+            if idx not in fields:
+                missing += 1
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            for _ in range(1 + repeats.get(idx, 0)):
+                writer.write(frame)
+    if writer is not None:
+        writer.release()
+
+    elapsed = time.time() - start
+    print(f"Wrote {output}: {len(frames)} frames in {elapsed:.1f}s ({len(frames) / max(elapsed, 1e-6):.1f} fps)"
+          + (f", {missing} without overlay fields" if missing else ""))
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("folders", nargs="+", help="camera folders (Images/cam0_...)")
+    parser.add_argument("--output", help="output file (only with a single folder)")
+    parser.add_argument("--fps", type=float, default=20.0, help="frame rate of the exported video")
+    parser.add_argument("--workers", type=int, default=None, help="decode/draw threads (default: CPU count)")
+    args = parser.parse_args()
+    if args.output and len(args.folders) > 1:
+        parser.error("--output can only be used with a single folder")
+    for folder in args.folders:
+        export(folder, args.output, args.fps, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import time
+from threading import Event, Lock, Thread
+
+from roi_profile import ROI, roi_pixels
+
+
+class Subscription:
+    """
+    One analyzer on the FrameBus: a worker thread fed through a mailbox
+    holding one frame per camera.
+
+    A frame due while the previous one is still waiting replaces it (the
+    analyzer always gets the newest frame) and counts as a miss. After
+    `max_misses` misses in a row, or `max_errors` exceptions, the analyzer
+    is dropped so it cannot keep a core busy for nothing.
+    """
+    def __init__(self, bus, name, callback, rate_hz, roi=None, cameras=None, max_misses=5, max_errors=10):
+        self.bus = bus
+        self.name = name
+        self.callback = callback
+        self.period = 1.0 / rate_hz
+        self.rate_hz = rate_hz
+        if roi is not None and not hasattr(roi, "x"):
+            roi = ROI(name, *roi, None, 95)  # (x, y, w, h) in fractions of the frame
+        self.roi = roi
+        self.cameras = cameras
+        self.max_misses = max_misses
+        self.max_errors = max_errors
+        self.last_offer = {}           # camera -> capture time of the last frame handed over
+        self.mailbox = {}              # camera -> (view, capture time) not yet picked up
+        self.lock = Lock()
+        self.wake = Event()
+        self.active = True
+        self.dropped_reason = None
+        self.delivered = 0
+        self.processed = 0
+        self.misses = 0
+        self.consecutive_misses = 0
+        self.errors = 0
+        self.last_ms = 0.0
+        self.result = {}               # camera -> last value the callback returned
+        self.thread = Thread(target=self._run, name=f"analyzer-{name}", daemon=True)
+        self.thread.start()
+
+    def offer(self, camera, frame, capture_time):
+        """Called on the capture thread: never blocks and never copies"""
+        if self.cameras is not None and camera not in self.cameras:
+            return
+        if capture_time - self.last_offer.get(camera, float("-inf")) < self.period:
+            return
+        self.last_offer[camera] = capture_time
+        if self.roi is not None:
+            x0, y0, x1, y1 = roi_pixels(self.roi, frame.shape[1], frame.shape[0])
+            view = frame[y0:y1, x0:x1]
+        else:
+            view = frame[:]
+        view.flags.writeable = False
+        with self.lock:
+            missed = camera in self.mailbox
+            self.mailbox[camera] = (view, capture_time)
+        self.delivered += 1
+        if missed:
+            self.misses += 1
+            self.consecutive_misses += 1
+            if self.consecutive_misses >= self.max_misses:
+                self.drop(f"fell behind ({self.max_misses} frames in a row waited)")
+                return
+        else:
+            self.consecutive_misses = 0
+        self.wake.set()
+
+    def _run(self):
+        while self.active:
+            self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                items, self.mailbox = self.mailbox, {}
+            for camera, (view, capture_time) in items.items():
+                if not self.active:
+                    break
+                t0 = time.perf_counter()
+                try:
+                    self.result[camera] = self.callback(camera, view, capture_time)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Analyzer {self.name} failed: {e}")
+                    if self.errors >= self.max_errors:
+                        self.drop(f"{self.errors} errors")
+                self.last_ms = (time.perf_counter() - t0) * 1000
+                self.processed += 1
+
+    def drop(self, reason):
+        if not self.active:
+            return
+        self.active = False
+        self.dropped_reason = reason
+        self.wake.set()
+        self.bus.unsubscribe(self)
+        print(f"Analyzer {self.name} dropped: {reason}")
+
+    def stats(self):
+        return {
+            "rate_hz": self.rate_hz,
+            "active": self.active,
+            "dropped": self.dropped_reason,
+            "delivered": self.delivered,
+            "processed": self.processed,
+            "misses": self.misses,
+            "errors": self.errors,
+            "last_ms": round(self.last_ms, 2),
+            "result": {f"cam{camera}": value for camera, value in self.result.items()},
+        }
+
+
+class FrameBus:
+    """
+    Share captured frames with analyzers inside the capture process.
+
+    publish() is called on the capture thread for every frame. Each
+    subscriber gets, at its own rate, a read-only view of its region of the
+    frame (no copy: camera.read() returns a new array every time and the
+    processing pool works on its own copy, so nothing writes to it) and
+    runs on its own thread. Capture never waits for an analyzer.
+
+        bus.subscribe("exposure", meter, rate_hz=2, roi=(0, 0.5, 1, 0.5))
+    """
+    def __init__(self):
+        self.subscribers = []
+        self.dropped = []
+        self.lock = Lock()
+
+    def subscribe(self, name, callback, rate_hz, roi=None, cameras=None, **options):
+        """callback(camera, view, capture_time) runs on the analyzer's thread; returns the Subscription"""
+        subscription = Subscription(self, name, callback, rate_hz, roi=roi, cameras=cameras, **options)
+        with self.lock:
+            self.subscribers = self.subscribers + [subscription]
+        print(f"Analyzer {name} subscribed at {rate_hz:g} Hz")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                # Copy on write, so publish() can iterate without the lock
+                self.subscribers = [s for s in self.subscribers if s is not subscription]
+                self.dropped.append(subscription)
+
+    def publish(self, camera, frame, capture_time):
+        for subscription in self.subscribers:
+            subscription.offer(camera, frame, capture_time)
+
+    def stats(self):
+        return {s.name: s.stats() for s in self.subscribers + self.dropped}
+
+    def close(self):
+        for subscription in list(self.subscribers):
+            subscription.active = False
+            subscription.wake.set()
+        for subscription in self.subscribers:
+            subscription.thread.join(timeout=1.0)
@@ -0,0 +1,225 @@
+"""
+Fixed-size binary record per saved frame, next to the JPEGs of a session.
+
+Finding the frame at a given GPS time used to mean opening thousands of
+JPEGs for their EXIF. frames.bin instead holds one packed record per frame
+and can be memory-mapped as a NumPy structured array, so time lookups are a
+binary search:
+
+    python3 frame_log.py Images/cam0_20250421_101500
+    python3 frame_log.py Images/cam0_20250421_101500 --between "2025-04-21 10:15:00" "2025-04-21 10:15:05"
+
+The file starts with a small JSON header describing the record layout, so
+older logs stay readable when fields are added.
+"""
+import argparse
+import json
+import os
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+FILENAME = "frames.bin"
+MAGIC = b"AFRMLOG1"
+HEADER_SIZE = 512
+
+# Record flags
+FLAG_DROPPED = 1 << 0   # the camera lost frames between the previous record and this one
+FLAG_NO_GPS = 1 << 1    # no GPS fix, t_gps/lat/lon/alt are NaN
+FLAG_SKIPPED = 1 << 2   # full frame captured but not written to disk (triggered recording, ROI or degrade thinning)
+FLAG_REPEAT = 1 << 3    # static scene, same as the last saved frame and not written (see repeats.csv)
+
+FRAME_DTYPE = np.dtype([
+    ("idx", "<u4"),         # frame index, matches opencv<idx>.jpg
+    ("flags", "<u4"),
+    ("t_mono", "<f8"),      # time.monotonic() when the frame was read
+    ("t_sys", "<f8"),       # system clock (unix time) when the frame was read
+    ("t_gps", "<f8"),       # GPS time of the latest fix (unix time, UTC)
+    ("lat", "<f8"),         # decimal degrees, south negative
+    ("lon", "<f8"),         # decimal degrees, west negative
+    ("alt", "<f4"),         # GPS altitude (m)
+    ("t_kernel", "<f8"),    # V4L2 buffer timestamp (time.monotonic() clock)
+    ("dropped", "<u4"),     # frames the driver dropped just before this one
+])
+
+
+def _struct_for(dtype):
+    codes = {"<u4": "I", "<f8": "d", "<f4": "f", "<u8": "Q", "<i4": "i", "<u2": "H"}
+    return struct.Struct("<" + "".join(codes[dtype.fields[name][0].str] for name in dtype.names))
+
+
+def _parse_coordinate(value):
+    """'47.620500 N' (GPSReader format) -> 47.6205, None/garbage -> NaN"""
+    if not value:
+        return float("nan")
+    try:
+        number, hemisphere = value.split()
+        number = float(number)
+    except ValueError:
+        return float("nan")
+    return -number if hemisphere in ("S", "W") else number
+
+
+def gps_values(gps_data, t_sys):
+    """(t_gps, lat, lon, alt) from GPSReader.get_latest_data(), NaN where unknown"""
+    nan = float("nan")
+    if not gps_data:
+        return nan, nan, nan, nan
+    t_gps = nan
+    gps_time = gps_data.get("gps_time")
+    if gps_time:
+        # NMEA only carries the time of day (UTC); take the date from the
+        # system clock and correct for a fix from just across midnight
+        try:
+            hours, minutes, seconds = gps_time.split(":")
+            day = datetime.fromtimestamp(t_sys, timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            t_gps = (day + timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))).timestamp()
+            if t_gps - t_sys > 43200:
+                t_gps -= 86400
+            elif t_sys - t_gps > 43200:
+                t_gps += 86400
+        except ValueError:
+            pass
+    alt = gps_data.get("altitude")
+    try:
+        alt = float(alt) if alt is not None else nan
+    except (TypeError, ValueError):
+        alt = nan
+    return t_gps, _parse_coordinate(gps_data.get("latitude")), _parse_coordinate(gps_data.get("longitude")), alt
+
+
+class FrameLog:
+    """
+    Appends one FRAME_DTYPE record per saved frame to <folder>/frames.bin.
+
+    Records go through a buffered file that is flushed about once a second,
+    so a power cut loses at most the last second (and a torn final record
+    is ignored by the reader).
+    """
+    def __init__(self, folder, camera=None, dtype=FRAME_DTYPE, flush_interval=1.0):
+        self.path = os.path.join(folder, FILENAME)
+        self.dtype = dtype
+        self.record = _struct_for(dtype)
+        self.flush_interval = flush_interval
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, "ab")
+        if new:
+            self.file.write(self._header(camera))
+        self.last_flush = time.monotonic()
+        self.count = 0
+
+    def _header(self, camera):
+        meta = json.dumps({"fields": [(name, self.dtype.fields[name][0].str) for name in self.dtype.names],
+                           "camera": camera, "created": time.time()}).encode()
+        if len(MAGIC) + 4 + len(meta) > HEADER_SIZE:
+            raise ValueError("frame log header too large")
+        return (MAGIC + struct.pack("<I", len(meta)) + meta).ljust(HEADER_SIZE, b"\0")
+
+    def write(self, *values):
+        """Append one record; values in FRAME_DTYPE field order"""
+        self.file.write(self.record.pack(*values))
+        self.count += 1
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.last_flush = now
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SIZE)
+    if not head.startswith(MAGIC):
+        raise ValueError(f"{path} is not a frame log")
+    (length,) = struct.unpack_from("<I", head, len(MAGIC))
+    meta = json.loads(head[len(MAGIC) + 4:len(MAGIC) + 4 + length])
+    meta["dtype"] = np.dtype([tuple(field) for field in meta["fields"]])
+    return meta
+
+
+def open_frame_log(path):
+    """Memory-map a frames.bin (or the folder holding it) as a structured array"""
+    if os.path.isdir(path):
+        path = os.path.join(path, FILENAME)
+    dtype = read_header(path)["dtype"]
+    count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def frames_between(log, t1, t2, field="t_gps"):
+    """
+    Records with t1 <= log[field] <= t2, found by binary search.
+
+    The times only ever increase within a session, except that t_gps is NaN
+    until the first fix; that leading run is skipped first.
+    """
+    times = log[field]
+    start = 0
+    if len(times) and times[0] != times[0]:
+        valid = np.flatnonzero(~np.isnan(times))
+        if not len(valid):
+            return log[:0]
+        start = valid[0]
+    lo = start + np.searchsorted(times[start:], t1, side="left")
+    hi = start + np.searchsorted(times[start:], t2, side="right")
+    return log[lo:hi]
+
+
+def _parse_time(value, utc):
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None and utc:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a frame log or find the frames in a time range")
+    parser.add_argument("path", help="camera folder or frames.bin")
+    parser.add_argument("--between", nargs=2, metavar=("T1", "T2"),
+                        help="unix times or ISO date-times (UTC for t_gps, local otherwise)")
+    parser.add_argument("--field", default="t_gps", choices=["t_gps", "t_sys", "t_mono"])
+    args = parser.parse_args()
+
+    log = open_frame_log(args.path)
+    if not len(log):
+        print("empty frame log")
+        return
+    if args.between:
+        utc = args.field == "t_gps"
+        t1, t2 = (_parse_time(t, utc) for t in args.between)
+        for record in frames_between(log, t1, t2, args.field):
+            print(f"opencv{record['idx']}.jpg  t_gps={record['t_gps']:.3f}  t_sys={record['t_sys']:.3f}  "
+                  f"lat={record['lat']:.6f} lon={record['lon']:.6f} alt={record['alt']:.1f}")
+        return
+
+    span = log["t_mono"][-1] - log["t_mono"][0]
+    gaps = int(np.count_nonzero(log["flags"] & FLAG_DROPPED))
+    no_gps = int(np.count_nonzero(log["flags"] & FLAG_NO_GPS))
+    print(f"{len(log)} frames over {span:.1f}s ({(len(log) - 1) / max(span, 1e-6):.2f} fps)")
+    print(f"first {datetime.fromtimestamp(log['t_sys'][0])}, last {datetime.fromtimestamp(log['t_sys'][-1])}")
+    if "dropped" in log.dtype.names:
+        dropped = int(log["dropped"].sum())
+        print(f"{dropped} frames dropped by the camera driver in {gaps} gaps "
+              f"({100.0 * dropped / (len(log) + dropped):.2f}%)")
+    else:
+        print(f"{gaps} records after dropped frames")
+    print(f"{no_gps} without GPS fix")
+    repeats = int(np.count_nonzero(log["flags"] & FLAG_REPEAT))
+    if repeats:
+        print(f"{repeats} static-scene repeats not saved")
+    skipped = int(np.count_nonzero(log["flags"] & FLAG_SKIPPED))
+    if skipped:
+        print(f"{len(log) - skipped} full frames saved, {skipped} skipped (triggered recording or thinning)")
+
+
+if __name__ == '__main__':
+    main()
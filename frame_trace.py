@@ -0,0 +1,209 @@
+"""
+Per-frame latency tracing for stamp_video, from camera read to disk.
+
+Every frame gets a sequence id when it is read, and each stage it passes
+through records a span (start and end on the time.monotonic() clock)
+under that id: the camera read, the wait for a pool thread, process_frame,
+the wait to be collected in order, the writer queue, JPEG encoding, EXIF
+insertion and the file write. Queue depths are sampled from the capture
+loop. Recording a span costs a deque append and a histogram increment.
+
+Histograms cover the whole run; the spans and queue samples behind the
+Chrome trace are the most recent ones only. dump() writes
+
+    <prefix>.json   Chrome trace (open in chrome://tracing or ui.perfetto.dev)
+    <prefix>.csv    count, mean, p50, p95, p99 and max per stage and queue
+"""
+import csv
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from itertools import count
+from threading import Lock, Thread
+
+# Stages in the order a frame passes through them
+STAGES = ("read", "pool_queue", "process", "collect", "writer_queue", "encode", "exif", "write", "extras")
+
+# Quarter-octave bins of the duration in microseconds, 1 us to ~4.7 h
+_BINS_PER_OCTAVE = 4
+_NUM_BINS = 34 * _BINS_PER_OCTAVE
+
+
+class Histogram:
+    """Log-spaced latency histogram: constant memory, percentiles to within ~9%"""
+    def __init__(self):
+        self.bins = [0] * _NUM_BINS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        b = int(math.log2(us) * _BINS_PER_OCTAVE) if us > 1 else 0
+        self.bins[min(b, _NUM_BINS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Seconds below which a fraction q of the samples fall (bin centre)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for b, n in enumerate(self.bins):
+            seen += n
+            if seen >= target:
+                return min(2 ** ((b + 0.5) / _BINS_PER_OCTAVE) / 1e6, self.max)
+        return self.max
+
+    def summary(self, scale=1000.0):
+        """count, mean, p50, p95, p99 and max (in ms by default)"""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count * scale, 3),
+            "p50": round(self.percentile(0.50) * scale, 3),
+            "p95": round(self.percentile(0.95) * scale, 3),
+            "p99": round(self.percentile(0.99) * scale, 3),
+            "max": round(self.max * scale, 3),
+        }
+
+
+class FrameTracer:
+    """
+    Spans and queue depths of the frames going through stamp_video.
+
+    new_frame() hands out sequence ids, span() records a finished stage,
+    call() wraps a call made on another thread (waiting time and run time),
+    and depth() samples a queue. Every method is safe to call from any
+    thread.
+    """
+    def __init__(self, keep_spans=50000, keep_depths=20000):
+        self._seq = count()
+        self.frames = 0
+        self.spans = deque(maxlen=keep_spans)     # (seq, camera, stage, start, end, thread id)
+        self.depths = deque(maxlen=keep_depths)   # (time, queue, depth)
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.queue_depths = {}                    # queue -> [samples, sum, max]
+        self.thread_names = {}
+        self.lock = Lock()
+        self.started = time.monotonic()
+
+    def new_frame(self):
+        seq = next(self._seq)
+        self.frames = seq + 1
+        return seq
+
+    def span(self, seq, camera, stage, start, end):
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.spans.append((seq, camera, stage, start, end, tid))
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.add(end - start)
+
+    def call(self, seq, camera, wait_stage, stage, queued, fn, *args):
+        """
+        Call fn(*args) (on a pool thread), recording the time since `queued`
+        as wait_stage and the call itself as stage; returns (result, end time)
+        """
+        start = time.monotonic()
+        self.span(seq, camera, wait_stage, queued, start)
+        result = fn(*args)
+        end = time.monotonic()
+        self.span(seq, camera, stage, start, end)
+        return result, end
+
+    def depth(self, queue, value, now=None):
+        now = time.monotonic() if now is None else now
+        self.depths.append((now, queue, value))
+        with self.lock:
+            stats = self.queue_depths.setdefault(queue, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += value
+            stats[2] = max(stats[2], value)
+
+    def stats(self):
+        """Per-stage latency summary in ms and mean/max queue depths"""
+        with self.lock:
+            stages = {stage: h.summary() for stage, h in self.histograms.items() if h.count}
+            queues = {queue: {"samples": n, "mean": round(total / n, 2), "max": peak}
+                      for queue, (n, total, peak) in self.queue_depths.items() if n}
+        return {"frames": self.frames, "stages": stages, "queues": queues}
+
+    def chrome_trace(self, spans=None, depths=None):
+        """The recent spans and depths as a Chrome trace event dict"""
+        spans = list(self.spans) if spans is None else spans
+        depths = list(self.depths) if depths is None else depths
+        t0 = min([s[3] for s in spans] + [d[0] for d in depths] + [self.started])
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "stamp_video"}}]
+        for tid, name in list(self.thread_names.items()):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        for seq, camera, stage, start, end, tid in spans:
+            events.append({
+                "name": stage, "cat": f"cam{camera}", "ph": "X", "pid": pid, "tid": tid,
+                "ts": round((start - t0) * 1e6, 1), "dur": round((end - start) * 1e6, 1),
+                "args": {"seq": seq, "camera": camera},
+            })
+        for t, queue, value in depths:
+            events.append({"name": queue, "ph": "C", "pid": pid, "ts": round((t - t0) * 1e6, 1),
+                           "args": {"depth": value}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_csv(self, path, stats=None):
+        stats = stats or self.stats()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "name", "count", "mean", "p50", "p95", "p99", "max"])
+            for stage, s in stats["stages"].items():
+                writer.writerow(["stage_ms", stage, s["count"], s["mean"], s["p50"], s["p95"], s["p99"], s["max"]])
+            for queue, s in stats["queues"].items():
+                writer.writerow(["queue_depth", queue, s["samples"], s["mean"], "", "", "", s["max"]])
+
+    def dump(self, prefix, background=False):
+        """
+        Write <prefix>.json and <prefix>.csv; returns the paths. With
+        background, only the snapshot is taken on the calling thread.
+        """
+        folder = os.path.dirname(prefix)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        spans, depths, stats = list(self.spans), list(self.depths), self.stats()
+        paths = (prefix + ".json", prefix + ".csv")
+
+        def write():
+            try:
+                with open(paths[0], "w") as f:
+                    json.dump(self.chrome_trace(spans, depths), f)
+                self.write_csv(paths[1], stats)
+                print(f"Frame trace: {len(spans)} spans written to {paths[0]} and {paths[1]}")
+            except OSError as e:
+                print(f"Could not write frame trace {prefix}: {e}")
+
+        if background:
+            Thread(target=write, name="trace-dump", daemon=True).start()
+        else:
+            write()
+        return paths
+
+    def print_summary(self):
+        stats = self.stats()
+        print(f"Frame latency over {stats['frames']} frames (ms):")
+        print(f"  {'stage':<14}{'count':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for stage in STAGES:
+            s = stats["stages"].get(stage)
+            if s:
+                print(f"  {stage:<14}{s['count']:>8}{s['mean']:>9.2f}{s['p50']:>9.2f}{s['p95']:>9.2f}"
+                      f"{s['p99']:>9.2f}{s['max']:>9.2f}")
+        for queue, s in stats["queues"].items():
+            print(f"  queue {queue:<8} mean {s['mean']:.1f} max {s['max']}")
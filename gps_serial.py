@@ -32,6 +32,8 @@ class GPSReader:
             "raw_gnrmc": None,
             "last_update": 0
         }
+        # Set on the first sentence that carries a valid fix
+        self.fix_event = threading.Event()
         
         # Try to open the first available GPS device
         self._open_gps_device()
@@ -155,6 +157,8 @@ class GPSReader:
             self.latest_data["quality"] = msg.gps_qual
             self.latest_data["hdop"] = msg.horizontal_dil
             self.latest_data["last_update"] = time.time()
+            if msg.gps_qual:
+                self.fix_event.set()
         except Exception as e:
             print(f"Error parsing GNGGA: {e}")
     
@@ -178,6 +182,7 @@ class GPSReader:
                 self.latest_data["speed"] = msg.spd_over_grnd
                 self.latest_data["course"] = msg.true_course
                 self.latest_data["last_update"] = time.time()
+                self.fix_event.set()
         except Exception as e:
             print(f"Error parsing GNRMC: {e}")
     
@@ -191,6 +196,12 @@ class GPSReader:
         """Get the latest GPS data"""
         return self.latest_data
     
+    def wait_for_fix(self, timeout=None):
+        """Block until the receiver has reported a valid fix; False on timeout or without a device"""
+        if not self.running:
+            return False
+        return self.fix_event.wait(timeout)
+
     def get_latest_raw_sentence(self, sentence_type='GNGGA'):
         """Get the latest raw NMEA sentence of specified type"""
         if sentence_type == 'GNGGA':
@@ -0,0 +1,117 @@
+import copy
+import os
+
+import cv2
+import numpy as np
+
+SUBSAMPLINGS = ("444", "422", "420")
+
+
+class OpenCVEncoder:
+    """
+    JPEG encoding with cv2.imencode (OpenCV's bundled libjpeg, usually
+    libjpeg-turbo as well). OpenCV does not expose the DCT method, so
+    fast_dct is accepted but has no effect.
+    """
+    name = "opencv"
+    _SAMPLING = {
+        "444": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+        "422": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+        "420": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+    }
+
+    def __init__(self, quality=95, subsampling="420", fast_dct=False):
+        if subsampling not in SUBSAMPLINGS:
+            raise ValueError(f"subsampling must be one of {SUBSAMPLINGS}, not {subsampling!r}")
+        self.quality = quality
+        self.subsampling = subsampling
+        self.fast_dct = fast_dct
+
+    def encode(self, frame):
+        """BGR frame -> JPEG bytes"""
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(self.quality),
+                  cv2.IMWRITE_JPEG_SAMPLING_FACTOR, self._SAMPLING[self.subsampling]]
+        ok, data = cv2.imencode(".jpg", frame, params)
+        if not ok:
+            raise RuntimeError("cv2.imencode failed")
+        return data.tobytes()
+
+    def __repr__(self):
+        return f"{self.name}(q={self.quality}, {self.subsampling})"
+
+
+class TurboJPEGEncoder:
+    """
+    JPEG encoding through libjpeg-turbo's TurboJPEG API (pip install
+    PyTurboJPEG, sudo apt install libturbojpeg0). Encodes straight from BGR
+    and can use the fast integer DCT, which is noticeably quicker on the Pi
+    for a small loss at high quality settings.
+    """
+    name = "turbojpeg"
+
+    def __init__(self, quality=95, subsampling="420", fast_dct=False):
+        if subsampling not in SUBSAMPLINGS:
+            raise ValueError(f"subsampling must be one of {SUBSAMPLINGS}, not {subsampling!r}")
+        import turbojpeg
+        self._tj = turbojpeg
+        self._jpeg = turbojpeg.TurboJPEG()
+        self._sampling = {"444": turbojpeg.TJSAMP_444, "422": turbojpeg.TJSAMP_422,
+                          "420": turbojpeg.TJSAMP_420}
+        self.quality = quality
+        self.subsampling = subsampling
+        self.fast_dct = fast_dct
+
+    def encode(self, frame):
+        flags = self._tj.TJFLAG_FASTDCT if self.fast_dct else 0
+        return self._jpeg.encode(np.ascontiguousarray(frame), quality=int(self.quality),
+                                 pixel_format=self._tj.TJPF_BGR,
+                                 jpeg_subsample=self._sampling[self.subsampling], flags=flags)
+
+    def __repr__(self):
+        return f"{self.name}(q={self.quality}, {self.subsampling}{', fast DCT' if self.fast_dct else ''})"
+
+
+BACKENDS = {
+    "opencv": OpenCVEncoder,
+    "turbojpeg": TurboJPEGEncoder,
+}
+
+
+def get_encoder(backend="opencv", quality=95, subsampling="420", fast_dct=False):
+    """An encoder for the named backend; falls back to OpenCV if the library is missing"""
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown JPEG backend {backend!r} (choose from {', '.join(BACKENDS)})")
+    try:
+        return cls(quality=quality, subsampling=subsampling, fast_dct=fast_dct)
+    except (ImportError, OSError, RuntimeError) as e:
+        # ImportError without PyTurboJPEG, RuntimeError/OSError without libturbojpeg
+        print(f"JPEG backend {backend} unavailable ({e}), using OpenCV")
+        return OpenCVEncoder(quality=quality, subsampling=subsampling, fast_dct=fast_dct)
+
+
+def with_quality(encoder, quality):
+    """
+    The encoder at another quality: a copy, since the original may be
+    encoding on other threads (None or the same quality returns it as is)
+    """
+    if quality is None or quality == encoder.quality:
+        return encoder
+    other = copy.copy(encoder)
+    other.quality = quality
+    return other
+
+
+def encoder_from_env(quality=None):
+    """
+    The encoder chosen by JPEG_BACKEND, JPEG_QUALITY, JPEG_SUBSAMPLING and
+    JPEG_FAST_DCT. An explicit quality (e.g. from an ROI profile) wins over
+    JPEG_QUALITY.
+    """
+    return get_encoder(
+        backend=os.getenv("JPEG_BACKEND", "opencv"),
+        quality=quality or int(os.getenv("JPEG_QUALITY", "95")),
+        subsampling=os.getenv("JPEG_SUBSAMPLING", "420"),
+        fast_dct=os.getenv("JPEG_FAST_DCT", "0") not in ("", "0"),
+    )
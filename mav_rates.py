@@ -0,0 +1,230 @@
+import json
+import time
+from collections import defaultdict
+
+# Message -> rate (Hz) we want from the autopilot. 0 turns a message off so
+# its share of the 921600 baud link goes to the IMU data instead.
+DEFAULT_RATE_PROFILE = {
+    "RAW_IMU": 100,
+    "SCALED_IMU2": 100,
+    "SCALED_IMU3": 100,
+    "ATTITUDE": 50,
+    "VFR_HUD": 10,
+    "GLOBAL_POSITION_INT": 10,
+    "RC_CHANNELS": 10,
+    "SCALED_PRESSURE": 10,
+    "GPS_RAW_INT": 5,
+    "SYS_STATUS": 1,
+    "SYSTEM_TIME": 1,
+}
+
+# Which legacy REQUEST_DATA_STREAM group carries each message on ArduPilot,
+# used when the autopilot does not accept SET_MESSAGE_INTERVAL
+STREAM_GROUPS = {
+    "RAW_IMU": "MAV_DATA_STREAM_RAW_SENSORS",
+    "SCALED_IMU2": "MAV_DATA_STREAM_RAW_SENSORS",
+    "SCALED_IMU3": "MAV_DATA_STREAM_RAW_SENSORS",
+    "SCALED_PRESSURE": "MAV_DATA_STREAM_RAW_SENSORS",
+    "SYS_STATUS": "MAV_DATA_STREAM_EXTENDED_STATUS",
+    "GPS_RAW_INT": "MAV_DATA_STREAM_EXTENDED_STATUS",
+    "RC_CHANNELS": "MAV_DATA_STREAM_RC_CHANNELS",
+    "GLOBAL_POSITION_INT": "MAV_DATA_STREAM_POSITION",
+    "ATTITUDE": "MAV_DATA_STREAM_EXTRA1",
+    "VFR_HUD": "MAV_DATA_STREAM_EXTRA2",
+    "SYSTEM_TIME": "MAV_DATA_STREAM_EXTRA3",
+}
+
+
+def load_rate_profile(path=None):
+    """
+    Load a rate profile from JSON ({"RAW_IMU": 100, "27": 100, ...}).
+
+    Keys may be message names or numeric message ids. Without a path the
+    built-in DEFAULT_RATE_PROFILE is used.
+    """
+    if not path:
+        return dict(DEFAULT_RATE_PROFILE)
+    with open(path) as f:
+        profile = json.load(f)
+    return {(int(k) if str(k).isdigit() else str(k).upper()): float(v) for k, v in profile.items()}
+
+
+class MessageRateManager:
+    """
+    Apply a message-rate profile to the autopilot and keep it applied.
+
+    Rates are set with MAV_CMD_SET_MESSAGE_INTERVAL; if the autopilot rejects
+    the command or never acknowledges it, the message's REQUEST_DATA_STREAM
+    group is used instead. Achieved rates are measured from the incoming
+    stream, and the whole profile is re-sent when the autopilot reboots
+    (its boot time goes backwards) or comes back after a link gap.
+    """
+    def __init__(self, master, profile=None, verify_window=5.0, tolerance=0.8,
+                 ack_timeout=1.0, retries=3, link_timeout=3.0):
+        from pymavlink import mavutil
+        self.mavutil = mavutil
+        self.mavlink = mavutil.mavlink
+        self.master = master
+        self.verify_window = verify_window
+        self.tolerance = tolerance
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.link_timeout = link_timeout
+
+        self.profile = {}
+        for key, hz in (profile or DEFAULT_RATE_PROFILE).items():
+            msg_id, name = self._resolve(key)
+            if msg_id is not None:
+                self.profile[msg_id] = (name, float(hz))
+
+        self.target = None
+        self.pending = {}          # msg id -> (sent at, attempts)
+        self.status = {}           # msg id -> "interval", "stream", "pending"
+        self.counts = defaultdict(int)
+        self.window_start = time.monotonic()
+        self.achieved = {}
+        self.last_boot_s = None
+        self.last_heard = None
+        self.applies = 0
+
+    def _resolve(self, key):
+        """Map a message name or id to (id, name)"""
+        if isinstance(key, int):
+            cls = self.mavlink.mavlink_map.get(key)
+            return key, cls.msgname if cls else str(key)
+        msg_id = getattr(self.mavlink, f"MAVLINK_MSG_ID_{key}", None)
+        if msg_id is None:
+            print(f"Unknown MAVLink message in rate profile: {key}")
+        return msg_id, key
+
+    def apply(self):
+        """Send the whole profile (called on first heartbeat and after a reboot)"""
+        if self.target is None:
+            return
+        self.applies += 1
+        print(f"Applying MAVLink rate profile ({len(self.profile)} messages, attempt {self.applies})")
+        now = time.monotonic()
+        for msg_id in self.profile:
+            self._send_interval(msg_id)
+            self.pending[msg_id] = (now, 1)
+            self.status[msg_id] = "pending"
+        self._reset_window(now)
+
+    def _send_interval(self, msg_id):
+        name, hz = self.profile[msg_id]
+        interval_us = -1 if hz <= 0 else int(1e6 / hz)
+        self.master.mav.command_long_send(
+            self.target[0], self.target[1],
+            self.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, 0,
+            msg_id, interval_us, 0, 0, 0, 0, 0)
+
+    def _fallback_to_streams(self, msg_ids):
+        """Request the legacy stream groups at the fastest rate any member wants"""
+        group_rates = {}
+        for msg_id in msg_ids:
+            name, hz = self.profile[msg_id]
+            group = STREAM_GROUPS.get(name)
+            if group is None:
+                print(f"No data stream fallback for {name}")
+                continue
+            group_rates[group] = max(group_rates.get(group, 0), hz)
+            self.status[msg_id] = "stream"
+        for group, hz in group_rates.items():
+            stream_id = getattr(self.mavlink, group)
+            print(f"Falling back to REQUEST_DATA_STREAM {group} at {hz:g} Hz")
+            self.master.mav.request_data_stream_send(
+                self.target[0], self.target[1], stream_id, int(round(hz)), 1 if hz > 0 else 0)
+
+    def _reset_window(self, now):
+        self.counts.clear()
+        self.window_start = now
+
+    def observe(self, msg):
+        """Feed every message received from the autopilot (router message hook)"""
+        msg_type = msg.get_type()
+        now = time.monotonic()
+        src = (msg.get_srcSystem(), msg.get_srcComponent())
+
+        if msg_type == "HEARTBEAT":
+            if msg.autopilot == self.mavlink.MAV_AUTOPILOT_INVALID:
+                return  # a GCS or companion, not the flight controller
+            link_was_lost = self.last_heard is not None and now - self.last_heard > self.link_timeout
+            self.last_heard = now
+            if self.target is None or link_was_lost:
+                self.target = src
+                if link_was_lost:
+                    print("Autopilot heartbeat back after a gap, reapplying rates")
+                self.apply()
+            return
+
+        if self.target is None or src[0] != self.target[0]:
+            return
+        self.last_heard = now
+        self.counts[msg.get_msgId()] += 1
+
+        if msg_type == "COMMAND_ACK" and msg.command == self.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL:
+            self._handle_ack(msg)
+        elif msg_type in ("ATTITUDE", "SYSTEM_TIME"):
+            boot_s = msg.time_boot_ms / 1000.0
+            if self.last_boot_s is not None and boot_s + 1.0 < self.last_boot_s:
+                print("Autopilot rebooted (boot time went backwards), reapplying rates")
+                self.last_boot_s = boot_s
+                self.apply()
+                return
+            self.last_boot_s = max(boot_s, self.last_boot_s or 0.0)
+
+    def _handle_ack(self, msg):
+        # COMMAND_ACK does not say which message id it is for, so it answers
+        # the oldest outstanding request
+        if not self.pending:
+            return
+        msg_id = min(self.pending, key=lambda k: self.pending[k][0])
+        del self.pending[msg_id]
+        if msg.result == self.mavlink.MAV_RESULT_ACCEPTED:
+            self.status[msg_id] = "interval"
+        else:
+            self._fallback_to_streams([msg_id])
+
+    def tick(self, now=None):
+        """Retry unacknowledged requests and check achieved rates (router tick hook)"""
+        now = time.monotonic() if now is None else now
+        if self.target is None:
+            return
+
+        timed_out = []
+        for msg_id, (sent_at, attempts) in list(self.pending.items()):
+            if now - sent_at < self.ack_timeout:
+                continue
+            if attempts >= self.retries:
+                del self.pending[msg_id]
+                timed_out.append(msg_id)
+            else:
+                self._send_interval(msg_id)
+                self.pending[msg_id] = (now, attempts + 1)
+        if timed_out:
+            self._fallback_to_streams(timed_out)
+
+        if now - self.window_start >= self.verify_window:
+            self.verify(now)
+
+    def verify(self, now=None):
+        """Compare achieved rates with the profile over the last window"""
+        now = time.monotonic() if now is None else now
+        elapsed = max(now - self.window_start, 1e-3)
+        self.achieved = {msg_id: self.counts.get(msg_id, 0) / elapsed for msg_id in self.profile}
+        short = []
+        for msg_id, (name, hz) in self.profile.items():
+            got = self.achieved[msg_id]
+            if hz > 0 and got < hz * self.tolerance:
+                short.append(f"{name} {got:.1f}/{hz:g} Hz")
+            elif hz <= 0 and got > 0.5:
+                short.append(f"{name} still at {got:.1f} Hz (wanted off)")
+        if short and not self.pending:
+            print("MAVLink rates below profile: " + ", ".join(short))
+        self._reset_window(now)
+        return self.achieved
+
+    def report(self):
+        return {name: {"requested_hz": hz, "achieved_hz": round(self.achieved.get(msg_id, 0.0), 1),
+                       "method": self.status.get(msg_id)}
+                for msg_id, (name, hz) in self.profile.items()}
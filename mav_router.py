@@ -0,0 +1,285 @@
+import os
+import time
+import mmap
+import struct
+import select
+import socket
+import datetime
+from collections import namedtuple
+
+# Latest flight state shared with other local processes (stamp_video overlay,
+# triggers, ...) through a small memory-mapped file
+DEFAULT_STATE_PATH = "/dev/shm/aerobatic_mav_state"
+
+STATE_FIELDS = [
+    "t_mono",                   # time.monotonic() when the state was last updated
+    "time_boot_s",              # autopilot boot time of the last ATTITUDE
+    "roll", "pitch", "yaw",     # rad
+    "rollspeed", "pitchspeed", "yawspeed",  # rad/s
+    "alt",                      # VFR_HUD altitude (m, baro)
+    "relative_alt",             # GLOBAL_POSITION_INT relative altitude (m)
+    "airspeed", "groundspeed", "climb",     # m/s
+    "heading",                  # deg
+    "throttle",                 # %
+    "rc1", "rc2", "rc3", "rc4", "rc5", "rc6", "rc7", "rc8",  # us
+    "xacc", "yacc", "zacc",     # body-frame acceleration (g), about -1 on zacc in level flight
+]
+MavState = namedtuple("MavState", STATE_FIELDS)
+
+# Layout: uint32 sequence counter followed by one float64 per field. The
+# writer makes the counter odd while it is updating (a seqlock), so readers
+# in other processes never see a half-written state.
+_SEQ = struct.Struct("<I")
+_PAYLOAD = struct.Struct("<" + "d" * len(STATE_FIELDS))
+_STATE_SIZE = _SEQ.size + _PAYLOAD.size
+
+
+class MavStatePublisher:
+    """Write the latest attitude/altitude/RC values into shared memory"""
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, _STATE_SIZE)
+            self.map = mmap.mmap(fd, _STATE_SIZE)
+        finally:
+            os.close(fd)
+        self.values = dict.fromkeys(STATE_FIELDS, float("nan"))
+        self.have_imu2 = False
+        self.seq = 0
+        self._write()
+
+    def update(self, msg):
+        """Fold one MAVLink message into the state; returns True if it changed"""
+        msg_type = msg.get_type()
+        v = self.values
+        if msg_type == "ATTITUDE":
+            v["time_boot_s"] = msg.time_boot_ms / 1000.0
+            v["roll"], v["pitch"], v["yaw"] = msg.roll, msg.pitch, msg.yaw
+            v["rollspeed"], v["pitchspeed"], v["yawspeed"] = msg.rollspeed, msg.pitchspeed, msg.yawspeed
+        elif msg_type == "VFR_HUD":
+            v["alt"], v["airspeed"], v["groundspeed"] = msg.alt, msg.airspeed, msg.groundspeed
+            v["climb"], v["heading"], v["throttle"] = msg.climb, msg.heading, msg.throttle
+        elif msg_type == "GLOBAL_POSITION_INT":
+            v["relative_alt"] = msg.relative_alt / 1000.0
+        elif msg_type == "RC_CHANNELS":
+            for i in range(1, 9):
+                v[f"rc{i}"] = getattr(msg, f"chan{i}_raw")
+        elif msg_type in ("SCALED_IMU2", "SCALED_IMU"):
+            # Both are in milli-g; prefer the second IMU when it is streamed
+            if msg_type == "SCALED_IMU2":
+                self.have_imu2 = True
+            elif self.have_imu2:
+                return False
+            v["xacc"], v["yacc"], v["zacc"] = msg.xacc / 1000.0, msg.yacc / 1000.0, msg.zacc / 1000.0
+        else:
+            return False
+        v["t_mono"] = time.monotonic()
+        self._write()
+        return True
+
+    def _write(self):
+        self.seq += 1
+        self.map[0:_SEQ.size] = _SEQ.pack(self.seq | 1)
+        self.map[_SEQ.size:_STATE_SIZE] = _PAYLOAD.pack(*(self.values[f] for f in STATE_FIELDS))
+        self.seq += 1
+        self.map[0:_SEQ.size] = _SEQ.pack(self.seq)
+
+    def close(self):
+        self.map.close()
+
+
+class MavStateReader:
+    """Read the state published by MavStatePublisher from any local process"""
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        self.map = None
+
+    def _open(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            if os.fstat(fd).st_size < _STATE_SIZE:
+                return False
+            self.map = mmap.mmap(fd, _STATE_SIZE, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        return True
+
+    def read(self):
+        """Latest MavState, or None if the router is not running yet"""
+        if self.map is None and not self._open():
+            return None
+        for _ in range(100):
+            seq1 = _SEQ.unpack_from(self.map, 0)[0]
+            if seq1 & 1:
+                continue
+            values = _PAYLOAD.unpack_from(self.map, _SEQ.size)
+            if _SEQ.unpack_from(self.map, 0)[0] == seq1:
+                return MavState(*values)
+        return None
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+def find_autopilot_device():
+    """Serial device of the flight controller, skipping the GPS on the same USB hub"""
+    from pymavlink import mavutil
+    ports = mavutil.auto_detect_serial(preferred_list=[
+        "*CubeBlack*", "*Hex_ProfiCNC*", "*ArduPilot*", "*PX4*", "*FMU*"])
+    if ports:
+        return ports[0].device
+    return "/dev/ttyACM0"
+
+
+class MavRouter:
+    """
+    Read the autopilot link, write a tlog and forward packets to UDP endpoints.
+
+    This replaces running a separate mavproxy.py interpreter: packets are
+    forwarded as raw bytes, the tlog is written through a large buffer that is
+    flushed once a second, and GCS packets coming back from any endpoint are
+    written to the autopilot so Mission Planner can still send commands.
+    """
+    def __init__(self, device=None, baud=921600, endpoints=(("127.0.0.1", 14550),),
+                 tlog_path=None, state_path=DEFAULT_STATE_PATH, flush_interval=1.0,
+                 tlog_buffer=256 * 1024):
+        self.device = device
+        self.baud = baud
+        self.endpoints = [(host, int(port)) for host, port in endpoints]
+        self.tlog_path = tlog_path
+        self.state_path = state_path
+        self.flush_interval = flush_interval
+        self.tlog_buffer = tlog_buffer
+        self.master = None
+        self.tlog = None
+        self.udp = None
+        self.state = None
+        self.running = False
+        self.message_hooks = []
+        self.tick_hooks = []
+        self.stats = {"rx_msgs": 0, "rx_bad": 0, "tx_udp": 0, "rx_udp": 0, "tlog_bytes": 0}
+
+    def open(self):
+        from pymavlink import mavutil
+        device = self.device or find_autopilot_device()
+        print(f"Opening autopilot link {device} at {self.baud} baud")
+        self.master = mavutil.mavlink_connection(device, baud=self.baud, source_system=255)
+        if self.tlog_path:
+            os.makedirs(os.path.dirname(self.tlog_path) or ".", exist_ok=True)
+            self.tlog = open(self.tlog_path, "ab", buffering=self.tlog_buffer)
+            print(f"Writing tlog to {self.tlog_path}")
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.setblocking(False)
+        self.udp.bind(("0.0.0.0", 0))
+        if self.state_path:
+            self.state = MavStatePublisher(self.state_path)
+        for host, port in self.endpoints:
+            print(f"Forwarding MAVLink to udp:{host}:{port}")
+
+    def add_message_hook(self, hook):
+        """Call hook(msg) for every message received from the autopilot"""
+        self.message_hooks.append(hook)
+
+    def add_tick_hook(self, hook):
+        """Call hook(now) about once a second from the router loop"""
+        self.tick_hooks.append(hook)
+
+    def _handle_message(self, msg):
+        if msg.get_type() == "BAD_DATA":
+            self.stats["rx_bad"] += 1
+            return
+        self.stats["rx_msgs"] += 1
+        buf = msg.get_msgbuf()
+
+        if self.tlog:
+            # tlog records are a big-endian microsecond timestamp plus the packet
+            usec = int(time.time() * 1e6)
+            self.tlog.write(struct.pack(">Q", usec))
+            self.tlog.write(buf)
+            self.stats["tlog_bytes"] += 8 + len(buf)
+
+        for endpoint in self.endpoints:
+            try:
+                self.udp.sendto(buf, endpoint)
+                self.stats["tx_udp"] += 1
+            except (BlockingIOError, OSError):
+                # A GCS that went away must not stall the serial link
+                pass
+
+        if self.state:
+            self.state.update(msg)
+        for hook in self.message_hooks:
+            hook(msg)
+
+    def _forward_from_udp(self):
+        while True:
+            try:
+                data, addr = self.udp.recvfrom(4096)
+            except (BlockingIOError, OSError):
+                return
+            self.stats["rx_udp"] += 1
+            self.master.write(data)
+
+    def run(self):
+        """Route until stop() is called or the autopilot link fails"""
+        from process_supervisor import heartbeat
+        if self.master is None:
+            self.open()
+        self.running = True
+        last_tick = time.monotonic()
+        try:
+            while self.running:
+                fds = [self.udp]
+                master_fd = getattr(self.master, "fd", None)
+                if master_fd is not None:
+                    fds.append(master_fd)
+                readable, _, _ = select.select(fds, [], [], 0.1)
+
+                if master_fd is None or master_fd in readable:
+                    while True:
+                        msg = self.master.recv_msg()
+                        if msg is None:
+                            break
+                        self._handle_message(msg)
+                if self.udp in readable:
+                    self._forward_from_udp()
+
+                now = time.monotonic()
+                if now - last_tick >= self.flush_interval:
+                    last_tick = now
+                    if self.tlog:
+                        self.tlog.flush()
+                    for hook in self.tick_hooks:
+                        hook(now)
+                    heartbeat()
+        finally:
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        if self.tlog:
+            self.tlog.flush()
+            self.tlog.close()
+            self.tlog = None
+        if self.udp:
+            self.udp.close()
+            self.udp = None
+        if self.master:
+            self.master.close()
+            self.master = None
+        if self.state:
+            self.state.close()
+            self.state = None
+
+
+def default_tlog_path(folder):
+    mission = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return os.path.join(folder, f"{mission}.tlog")
@@ -0,0 +1,367 @@
+import os
+import json
+import math
+import time
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+GLYPH_CHARS = "".join(chr(c) for c in range(32, 127))
+
+
+class GlyphAtlas:
+    """
+    Every printable character pre-rendered once for one font, size and color.
+
+    Drawing text is then a per-character copy of a small patch into the frame
+    instead of a cv2.getTextSize plus two cv2.putText calls (shadow and
+    color) over the full-resolution frame.
+    """
+    def __init__(self, color, font_size=0.8, font_thickness=2, shadow=(0, 0, 0)):
+        self.color = color
+        (_, self.ascent), self.descent = cv2.getTextSize("Ag", FONT, font_size, font_thickness + 1)
+        self.height = self.ascent + self.descent + 2
+        # getTextSize pads every string by a constant for the stroke
+        # thickness, so the pen advance of a glyph is width("cc") - width("c")
+        self.glyphs = {}
+        for ch in GLYPH_CHARS:
+            (width, _), _ = cv2.getTextSize(ch, FONT, font_size, font_thickness)
+            (double, _), _ = cv2.getTextSize(ch * 2, FONT, font_size, font_thickness)
+            advance = double - width
+            # The shadow is one pixel thicker, so leave a pixel either side
+            canvas_w = width + 2
+            patch = np.zeros((self.height, canvas_w, 3), dtype=np.uint8)
+            mask = np.zeros((self.height, canvas_w), dtype=np.uint8)
+            org = (1, self.ascent + 1)
+            # Hard-edged strokes (OpenCV 4's putText default) so the mask is
+            # exact; builds that antialias anyway are thresholded below
+            if ch != " ":
+                cv2.putText(patch, ch, org, FONT, font_size, shadow, font_thickness + 1, cv2.LINE_8)
+                cv2.putText(mask, ch, org, FONT, font_size, 255, font_thickness + 1, cv2.LINE_8)
+                cv2.putText(patch, ch, org, FONT, font_size, color, font_thickness, cv2.LINE_8)
+            # uint8 0/255 masks so cv2.copyTo can composite with SIMD
+            self.glyphs[ch] = (patch, np.where(mask >= 128, 255, 0).astype(np.uint8), advance)
+        self.advances = {ch: glyph[2] for ch, glyph in self.glyphs.items()}
+        self.pad = cv2.getTextSize("0", FONT, font_size, font_thickness)[0][0] - self.advances["0"]
+
+    def advance(self, text):
+        """Pen movement for text, i.e. where the next character would start"""
+        advances = self.advances
+        default = advances["?"]
+        return sum([advances.get(ch, default) for ch in text])
+
+    def text_width(self, text):
+        """Same as cv2.getTextSize(text)[0][0] for this font"""
+        return self.advance(text) + self.pad
+
+
+@lru_cache(maxsize=None)
+def get_atlas(color, font_size=0.8, font_thickness=2):
+    """Shared, read-only atlas per (color, size, thickness)"""
+    return GlyphAtlas(color, font_size, font_thickness)
+
+
+class OverlayRenderer:
+    """
+    Composite a block of text lines into frames through a small cached ROI.
+
+    The lines are kept rendered in a block buffer just big enough to hold
+    them. When a line changes, only the characters from the first difference
+    onwards are re-rendered, so static labels ("GPS Time: ") and unchanged
+    leading digits are never touched again. Each frame then costs a single
+    masked copy of the block into the frame.
+
+    Not thread-safe: use one renderer per worker thread (the atlases are
+    shared).
+    """
+    def __init__(self, colors, font_size=0.8, font_thickness=2, line_height=35,
+                 margin=20, top=40, align="right"):
+        self.atlases = [get_atlas(tuple(c), font_size, font_thickness) for c in colors]
+        self.line_height = line_height
+        self.margin = margin
+        self.top = top
+        self.align = align
+        self.ascent = max(a.ascent for a in self.atlases)
+        row_height = max(a.height for a in self.atlases)
+        self.height = (len(colors) - 1) * line_height + row_height
+        self.width = 0
+        self.block = None
+        self.mask = None
+        self.texts = [None] * len(colors)
+        self.widths = [0] * len(colors)
+        self.lefts = [0] * len(colors)
+
+    def _resize(self, width):
+        self.width = width
+        self.block = np.zeros((self.height, width, 3), dtype=np.uint8)
+        self.mask = np.zeros((self.height, width), dtype=np.uint8)
+        self.texts = [None] * len(self.texts)
+
+    def _render_line(self, i, text, width):
+        atlas = self.atlases[i]
+        y = i * self.line_height
+        old = self.texts[i]
+        # Pen x of the line; every glyph patch starts one pixel left of its pen
+        left = self.width - width if self.align == "right" else 1
+
+        start = 0
+        if old is not None and self.widths[i] == width:
+            # Same overall width: keep the common prefix (labels, leading
+            # digits) and redraw only from the first changed character
+            common = min(len(old), len(text))
+            while start < common and old[start] == text[start]:
+                start += 1
+            if start == len(text) == len(old):
+                return
+            # Glyphs spill one pixel into their neighbours, so also redraw
+            # the last unchanged character, clearing from its pen position
+            start = max(start - 1, 0)
+            pen = left + atlas.advance(text[:start])
+            clear_from = pen - (1 if start == 0 else 0)
+        else:
+            pen = left
+            clear_from = (min(left, self.lefts[i]) if old is not None else left) - 1
+
+        rows = slice(y, y + atlas.height)
+        self.block[rows, clear_from:] = 0
+        self.mask[rows, clear_from:] = 0
+        x = pen - 1
+        for ch in text[start:]:
+            patch, mask, advance = atlas.glyphs.get(ch, atlas.glyphs["?"])
+            w = min(mask.shape[1], self.width - x)
+            if w > 0:
+                cv2.copyTo(patch[:, :w], mask[:, :w], self.block[rows, x:x + w])
+                self.mask[rows, x:x + w] |= mask[:, :w]
+            x += advance
+        self.texts[i] = text
+        self.widths[i] = width
+        self.lefts[i] = left
+
+    def draw(self, frame, texts):
+        """Draw one text per configured line into the frame (in place)"""
+        widths = [self.widths[i] if t == self.texts[i] else self.atlases[i].text_width(t)
+                  for i, t in enumerate(texts)]
+        needed = max(widths) + 2
+        if needed > self.width:
+            # Grow with some headroom so a growing frame counter does not
+            # force a full re-render every time it gains a digit
+            self._resize(needed + 40)
+        for i, text in enumerate(texts):
+            if text != self.texts[i]:
+                self._render_line(i, text, widths[i])
+
+        frame_h, frame_w = frame.shape[:2]
+        y0 = self.top - self.ascent - 1
+        x0 = frame_w - self.margin - self.width if self.align == "right" else self.margin - 1
+        # Clip the block to the frame
+        bx0, by0 = max(0, -x0), max(0, -y0)
+        fx0, fy0 = max(0, x0), max(0, y0)
+        w = min(self.width - bx0, frame_w - fx0)
+        h = min(self.height - by0, frame_h - fy0)
+        if w > 0 and h > 0:
+            # cv2.copyTo writes through into the frame view
+            cv2.copyTo(self.block[by0:by0 + h, bx0:bx0 + w], self.mask[by0:by0 + h, bx0:bx0 + w],
+                       frame[fy0:fy0 + h, fx0:fx0 + w])
+        return frame
+
+
+def _lerp_angle(a, b, f, period):
+    """Interpolate two angles the short way round"""
+    diff = (b - a + period / 2) % period - period / 2
+    return a + diff * f
+
+
+class TelemetryBuffer:
+    """
+    Recent MAVLink state indexed by time.monotonic(), so a frame can be
+    matched with the attitude at its capture time rather than "now".
+
+    A background thread polls the router's shared state (a cheap mmap read)
+    and appends a sample whenever the router has published something new.
+    """
+    ANGLES = {"roll": 2 * math.pi, "pitch": 2 * math.pi, "yaw": 2 * math.pi, "heading": 360.0}
+
+    def __init__(self, reader=None, history=10.0, poll_interval=0.005):
+        if reader is None:
+            from mav_router import MavStateReader
+            reader = MavStateReader()
+        self.reader = reader
+        self.history = history
+        self.poll_interval = poll_interval
+        self.times = []
+        self.states = []
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._poll, daemon=True)
+        self.thread.start()
+
+    def _poll(self):
+        last_t = None
+        while self.running:
+            state = self.reader.read()
+            if state is not None and state.t_mono == state.t_mono and state.t_mono != last_t:
+                last_t = state.t_mono
+                self.append(state.t_mono, state)
+            time.sleep(self.poll_interval)
+
+    def append(self, t, state):
+        with self.lock:
+            self.times.append(t)
+            self.states.append(state)
+            # Trim in batches so the common path stays an append
+            if t - self.times[0] > 2 * self.history:
+                cut = bisect_left(self.times, t - self.history)
+                del self.times[:cut]
+                del self.states[:cut]
+
+    def sample(self, t, max_gap=1.0):
+        """State at monotonic time t (interpolated), or None if nothing close"""
+        with self.lock:
+            if not self.times:
+                return None
+            i = bisect_left(self.times, t)
+            if i == 0:
+                before = after = 0
+            elif i >= len(self.times):
+                before = after = len(self.times) - 1
+            else:
+                before, after = i - 1, i
+            t0, s0 = self.times[before], self.states[before]
+            t1, s1 = self.times[after], self.states[after]
+
+        if min(abs(t - t0), abs(t - t1)) > max_gap:
+            return None
+        if after == before or t1 == t0:
+            return s0._asdict()
+        f = (t - t0) / (t1 - t0)
+        values = {}
+        for name, a, b in zip(s0._fields, s0, s1):
+            if name in self.ANGLES:
+                values[name] = _lerp_angle(a, b, f, self.ANGLES[name])
+            else:
+                values[name] = a + (b - a) * f
+        return values
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1)
+
+
+def _fmt(value, fmt):
+    return "--" if value is None or value != value else format(value, fmt)
+
+
+# Colors of the six stamp lines (frame, GPS time, system time, lat, lon, fps)
+STAMP_COLORS = [(0, 0, 255), (0, 255, 0), (0, 200, 200), (255, 0, 0), (255, 0, 0), (255, 255, 0)]
+
+
+def stamp_lines(fields):
+    """The text of the top-right stamp block from a frame's overlay fields"""
+    return [
+        f"Frame {fields['frame']}",
+        f"GPS Time: {fields['gps_time']}",
+        f"Sys Time: {fields['sys_time']}",
+        f"Lat: {fields['lat']}",
+        f"Lon: {fields['lon']}",
+        f"FPS: {fields['fps']:.2f}",
+    ]
+
+
+def stamp_renderer():
+    return OverlayRenderer(STAMP_COLORS, font_size=0.8, font_thickness=2,
+                           line_height=35, margin=20, top=40, align="right")
+
+
+class TelemetryOverlay:
+    """Roll, pitch, heading, baro altitude and airspeed drawn from glyph atlases"""
+    FIELDS = ("roll", "pitch", "heading", "alt", "airspeed")
+
+    def __init__(self, buffer=None, color=(255, 255, 255), font_size=0.8, font_thickness=2,
+                 line_height=35, margin=20):
+        # buffer may be None when only drawing previously recorded samples
+        self.buffer = buffer
+        self.renderer_args = dict(colors=[color] * 5, font_size=font_size, font_thickness=font_thickness,
+                                  line_height=line_height, margin=margin, align="left")
+        # Frames are processed on a thread pool, so each worker gets its own renderer
+        self._local = threading.local()
+
+    def sample(self, capture_time):
+        """The overlay values at capture_time, or None if there is no telemetry"""
+        state = self.buffer.sample(capture_time)
+        if state is None:
+            return None
+        return {name: (None if state[name] != state[name] else state[name]) for name in self.FIELDS}
+
+    @staticmethod
+    def format_lines(sample):
+        sample = sample or {}
+        roll = sample.get("roll")
+        pitch = sample.get("pitch")
+        return [
+            f"Roll: {_fmt(math.degrees(roll) if roll is not None else None, '+6.1f')}",
+            f"Pitch: {_fmt(math.degrees(pitch) if pitch is not None else None, '+6.1f')}",
+            f"Hdg: {_fmt(sample.get('heading'), '03.0f')}",
+            f"Alt: {_fmt(sample.get('alt'), '.1f')} m",
+            f"IAS: {_fmt(sample.get('airspeed'), '.1f')} m/s",
+        ]
+
+    def lines(self, capture_time):
+        return self.format_lines(self.sample(capture_time))
+
+    def draw_sample(self, frame, sample):
+        """Draw the telemetry block for an already taken sample"""
+        renderer = getattr(self._local, "renderer", None)
+        if renderer is None:
+            renderer = self._local.renderer = OverlayRenderer(**self.renderer_args)
+        return renderer.draw(frame, self.format_lines(sample))
+
+    def draw(self, frame, capture_time):
+        """Draw the telemetry block in the top-left corner of the frame"""
+        return self.draw_sample(frame, self.sample(capture_time))
+
+
+class OverlayLog:
+    """
+    Per-frame overlay fields of one recording as JSON lines (overlay.jsonl).
+
+    Used by the deferred overlay mode: frames are saved clean and the text is
+    burned in later by export_overlay.py. Lines are written through a buffer
+    that is flushed about once a second.
+    """
+    FILENAME = "overlay.jsonl"
+
+    def __init__(self, folder, flush_interval=1.0):
+        self.path = os.path.join(folder, self.FILENAME)
+        self.file = open(self.path, "a")
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def write(self, idx, fields):
+        self.file.write(json.dumps({"idx": idx, **fields}, separators=(",", ":")) + "\n")
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.last_flush = now
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_overlay_log(folder):
+    """Frame index -> overlay fields from a folder's overlay.jsonl ({} if missing)"""
+    path = os.path.join(folder, OverlayLog.FILENAME)
+    fields = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a power loss
+                fields[entry.pop("idx")] = entry
+    except FileNotFoundError:
+        pass
+    return fields
@@ -0,0 +1,140 @@
+"""
+Local harness for the adaptive preview controller.
+
+Streams synthetic renditions over a socketpair whose reader is throttled with
+a token bucket, steps the link rate through a schedule that mimics field
+Wi-Fi, and prints the tier the controller settles on at each step. It fails
+if a tier exceeds the link, or if the controller does not climb back to the
+best tier that fits once the throttle is lifted. No camera, OpenCV or Flask
+is needed.
+
+    python3 preview_harness.py
+    python3 preview_harness.py --step 8
+    python3 preview_harness.py --schedule 2000,300,60,800
+
+Below the 65 kbit/s the min tier needs, every upgrade probe sits behind
+the socket buffers for seconds, so such a step reports OVER BUDGET.
+"""
+import argparse
+import socket
+import threading
+import time
+
+from adaptive_preview import TIERS, TierController
+
+
+class ThrottledLink:
+    """A socketpair whose receiving end drains at a configurable rate"""
+    def __init__(self, rate_bps, buffer_bytes=32 * 1024):
+        self.send_sock, self.recv_sock = socket.socketpair()
+        # Small kernel buffers so the sender feels the throttle quickly,
+        # like a congested Wi-Fi link would
+        for sock in (self.send_sock, self.recv_sock):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_bytes)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_bytes)
+        self.rate_bps = rate_bps
+        self.received = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        tokens = 0.0
+        last = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            # Burst of 0.1 s, but at least one read's worth so slow links drain too
+            tokens = min(tokens + (now - last) * self.rate_bps, max(self.rate_bps * 0.1, 1024))
+            last = now
+            if tokens < 1024:
+                time.sleep(0.005)
+                continue
+            try:
+                data = self.recv_sock.recv(int(min(tokens, 64 * 1024)))
+            except OSError:
+                break
+            if not data:
+                break
+            tokens -= len(data)
+            self.received += len(data)
+
+    def close(self):
+        self.running = False
+        self.send_sock.close()
+        self.recv_sock.close()
+
+
+def synthetic_frame_size(tier):
+    """Encoded size of a rendition, close to what our 1080p footage produces"""
+    return int(TierController._guess_frame_size(tier))
+
+
+def best_fitting_tier(controller, kbps):
+    """The best tier that fits a link of kbps with the controller's upgrade margin to spare"""
+    for tier in TIERS:
+        if controller.required_bps(tier) * controller.upgrade_margin * 8 / 1000 <= kbps:
+            return tier
+    return TIERS[-1]
+
+
+def run(schedule_kbps, step_seconds):
+    controller = TierController(frame_size=synthetic_frame_size)
+    link = ThrottledLink(schedule_kbps[0] * 1000 / 8)
+    results = []
+    previous_kbps = None
+    try:
+        for kbps in schedule_kbps:
+            link.rate_bps = kbps * 1000 / 8
+            step_end = time.monotonic() + step_seconds
+            settle_at = time.monotonic() + step_seconds / 2
+            tier_time = {}
+            while time.monotonic() < step_end:
+                tier = controller.tier
+                frame_start = time.monotonic()
+                payload = bytes(synthetic_frame_size(tier))
+                link.send_sock.sendall(payload)
+                send_time = time.monotonic() - frame_start
+                controller.record_send(len(payload), send_time)
+                remaining = 1.0 / tier["fps"] - (time.monotonic() - frame_start)
+                if remaining > 0:
+                    time.sleep(remaining)
+                # Only judge the second half of each step, once it has settled;
+                # a send that blocks across it counts for the time it overlaps
+                settled = min(time.monotonic(), step_end) - max(frame_start, settle_at)
+                if settled > 0:
+                    tier_time[tier["name"]] = tier_time.get(tier["name"], 0.0) + settled
+
+            # The tier the client spent most of the settled time in
+            dominant = max(TIERS, key=lambda t: tier_time.get(t["name"], 0.0))
+            share = tier_time.get(dominant["name"], 0.0) / max(sum(tier_time.values()), 1e-6)
+            need_kbps = controller.required_bps(dominant) * 8 / 1000
+            fits = need_kbps <= kbps or dominant is TIERS[-1]
+            # Once the throttle is lifted the controller has to climb back,
+            # not just stay safely at the bottom
+            best = best_fitting_tier(controller, kbps)
+            recovered = previous_kbps is None or kbps <= previous_kbps or TIERS.index(dominant) <= TIERS.index(best)
+            results.append(fits and recovered)
+            verdict = "OVER BUDGET" if not fits else f"STUCK (best fit {best['name']})" if not recovered else "OK"
+            print(f"link {kbps:6d} kbit/s -> tier {dominant['name']:6s} {share:4.0%} of the time "
+                  f"(needs {need_kbps:6.0f} kbit/s, {controller.changes} tier changes so far, {verdict})")
+            previous_kbps = kbps
+    finally:
+        link.close()
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--schedule", default="4000,1500,400,120,1500,4000",
+                        help="comma separated link rates in kbit/s")
+    parser.add_argument("--step", type=float, default=20.0, help="seconds per schedule step")
+    args = parser.parse_args()
+    schedule = [int(x) for x in args.schedule.split(",")]
+    ok = run(schedule, args.step)
+    print("controller stayed within link budget and recovered" if ok
+          else "controller exceeded link budget or did not recover")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import signal
+from multiprocess import Process, Pipe
+from multiprocess.connection import wait
+
+# Set in each supervised child so heartbeat() knows where to report
+_heartbeat_conn = None
+_last_heartbeat = 0.0
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def heartbeat(min_interval=1.0):
+    """
+    Tell the supervisor this process is still making progress.
+
+    Safe to call from a hot loop: it only writes to the pipe once per
+    `min_interval` seconds, and does nothing when not running supervised.
+    """
+    global _last_heartbeat
+    if _heartbeat_conn is None:
+        return
+    now = time.monotonic()
+    if now - _last_heartbeat < min_interval:
+        return
+    _last_heartbeat = now
+    try:
+        _heartbeat_conn.send_bytes(b"")
+    except (BrokenPipeError, OSError):
+        pass
+
+
+def _child_main(target, conn):
+    """Entry point of a supervised child: wire up heartbeat() then run the target"""
+    global _heartbeat_conn
+    _heartbeat_conn = conn
+    # The supervisor owns SIGINT handling; children are stopped with SIGTERM,
+    # and must not inherit the supervisor's own SIGTERM handler
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    target()
+
+
+def read_proc_usage(pid):
+    """Return (cpu seconds, rss bytes) of a process from /proc, or (None, None)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, so split after its ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None, None
+    cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    return cpu, rss_pages * _PAGE_SIZE
+
+
+class ChildSpec:
+    """
+    How to run one supervised service.
+
+    Args:
+        name: Name used in logs and stats
+        target: Function run in the child process
+        heartbeat_timeout: Restart the child if it has not called heartbeat()
+            for this many seconds. None disables hang detection.
+        startup_grace: Extra time allowed before the first heartbeat
+        restart: "always", or "on-failure" for services that are expected to
+            exit cleanly once their work is handed off (e.g. gps_logger)
+    """
+    def __init__(self, name, target, heartbeat_timeout=None, startup_grace=30.0, restart="always"):
+        self.name = name
+        self.target = target
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_grace = startup_grace
+        self.restart = restart
+
+
+class _Child:
+    def __init__(self, spec, base_backoff):
+        self.spec = spec
+        self.process = None
+        self.conn = None
+        self.started_at = None
+        self.last_heartbeat = None
+        self.restarts = 0
+        self.hangs = 0
+        self.backoff = base_backoff
+        self.next_start = 0.0
+        self.last_exit = None
+        self.stopping_since = None
+        self.cpu_sample = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def heartbeat_deadline(self):
+        timeout = self.spec.heartbeat_timeout
+        if timeout is None or self.process is None or self.stopping_since is not None:
+            return None
+        if self.last_heartbeat is None:
+            return self.started_at + self.spec.startup_grace + timeout
+        return self.last_heartbeat + timeout
+
+
+class Supervisor:
+    """
+    Run services as child processes and keep them running.
+
+    Child exits are noticed immediately by waiting on the process sentinels,
+    children that stop sending heartbeats are treated as hung and restarted,
+    and restarts back off exponentially so a crash loop does not hammer the Pi.
+    """
+    def __init__(self, specs, base_backoff=1.0, max_backoff=60.0, stable_after=60.0,
+                 kill_grace=5.0, report_interval=60.0, status_path=None):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.kill_grace = kill_grace
+        self.report_interval = report_interval
+        self.status_path = status_path
+        self.children = {spec.name: _Child(spec, base_backoff) for spec in specs}
+        self.running = False
+        self._last_report = time.monotonic()
+
+    def _start(self, child):
+        parent_conn, child_conn = Pipe(duplex=False)
+        process = Process(target=_child_main, args=(child.spec.target, child_conn),
+                          name=child.spec.name)
+        process.daemon = True
+        process.start()
+        # Only the child needs the sending end
+        child_conn.close()
+        child.process = process
+        child.conn = parent_conn
+        child.started_at = time.monotonic()
+        child.last_heartbeat = None
+        child.stopping_since = None
+        child.cpu_sample = None
+        print(f"[supervisor] started {child.spec.name} (pid {process.pid})")
+
+    def _handle_exit(self, child, now):
+        # exitcode is only filled in once the process has been reaped
+        child.process.join(timeout=1.0)
+        exitcode = child.process.exitcode
+        uptime = now - child.started_at
+        child.conn.close()
+        child.process = None
+        child.conn = None
+        child.last_exit = exitcode
+
+        if child.spec.restart == "on-failure" and exitcode == 0:
+            print(f"[supervisor] {child.spec.name} finished cleanly after {uptime:.1f}s")
+            child.next_start = None
+            return
+
+        if uptime >= self.stable_after:
+            # It ran fine for a while, so this is not a crash loop
+            child.backoff = self.base_backoff
+        delay = child.backoff
+        child.backoff = min(child.backoff * 2, self.max_backoff)
+        child.next_start = now + delay
+        child.restarts += 1
+        print(f"[supervisor] {child.spec.name} exited with code {exitcode} after {uptime:.1f}s, "
+              f"restarting in {delay:.1f}s (restart #{child.restarts})")
+
+    def _check_hung(self, child, now):
+        if child.stopping_since is not None:
+            if now - child.stopping_since > self.kill_grace:
+                print(f"[supervisor] {child.spec.name} ignored SIGTERM, killing")
+                child.process.kill()
+                child.stopping_since = now
+            return
+        deadline = child.heartbeat_deadline()
+        if deadline is not None and now > deadline:
+            child.hangs += 1
+            print(f"[supervisor] {child.spec.name} missed its heartbeat, terminating hung process")
+            child.process.terminate()
+            child.stopping_since = now
+
+    def _next_timeout(self, now):
+        deadlines = [now + 1.0, self._last_report + self.report_interval]
+        for child in self.children.values():
+            if child.process is None and child.next_start is not None:
+                deadlines.append(child.next_start)
+            elif child.process is not None:
+                deadline = child.heartbeat_deadline()
+                if deadline is not None:
+                    deadlines.append(deadline)
+                if child.stopping_since is not None:
+                    deadlines.append(child.stopping_since + self.kill_grace)
+        return max(0.0, min(deadlines) - now)
+
+    def run(self):
+        """Start every child and supervise until interrupted or stop() is called"""
+        self.running = True
+        previous_sigterm = signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        try:
+            for child in self.children.values():
+                self._start(child)
+
+            while self.running:
+                now = time.monotonic()
+                waitables = {}
+                for child in self.children.values():
+                    if child.process is not None:
+                        waitables[child.process.sentinel] = child
+                        waitables[child.conn] = child
+
+                ready = wait(list(waitables), timeout=self._next_timeout(now))
+                now = time.monotonic()
+
+                for obj in ready:
+                    child = waitables[obj]
+                    if obj is child.conn:
+                        try:
+                            while child.conn.poll():
+                                child.conn.recv_bytes()
+                            child.last_heartbeat = now
+                        except (EOFError, OSError):
+                            pass  # The sentinel reports the exit
+
+                for obj in ready:
+                    child = waitables[obj]
+                    if obj is not child.conn and child.process is not None:
+                        self._handle_exit(child, now)
+
+                for child in self.children.values():
+                    if child.process is not None:
+                        self._check_hung(child, now)
+                    elif self.running and child.next_start is not None and now >= child.next_start:
+                        self._start(child)
+
+                if now - self._last_report >= self.report_interval:
+                    self._last_report = now
+                    self.report()
+        except KeyboardInterrupt:
+            print("[supervisor] interrupted")
+        finally:
+            signal.signal(signal.SIGTERM, previous_sigterm)
+            self.shutdown()
+
+    def stop(self):
+        self.running = False
+
+    def shutdown(self):
+        """Terminate every child, escalating to SIGKILL after kill_grace"""
+        self.running = False
+        for child in self.children.values():
+            if child.alive:
+                child.process.terminate()
+        deadline = time.monotonic() + self.kill_grace
+        for child in self.children.values():
+            if child.process is not None:
+                child.process.join(timeout=max(0.0, deadline - time.monotonic()))
+                if child.process.is_alive():
+                    child.process.kill()
+                    child.process.join()
+                child.process = None
+
+    def stats(self):
+        """Per-child pid, CPU %, RSS, restart count and heartbeat age"""
+        now = time.monotonic()
+        result = {}
+        for name, child in self.children.items():
+            entry = {
+                "alive": child.alive,
+                "pid": child.process.pid if child.process is not None else None,
+                "restarts": child.restarts,
+                "hangs": child.hangs,
+                "last_exit": child.last_exit,
+                "uptime_s": round(now - child.started_at, 1) if child.alive else None,
+                "heartbeat_age_s": (round(now - child.last_heartbeat, 1)
+                                    if child.alive and child.last_heartbeat else None),
+                "cpu_percent": None,
+                "rss_mb": None,
+            }
+            if child.alive:
+                cpu, rss = read_proc_usage(child.process.pid)
+                if cpu is not None:
+                    # CPU % since the previous stats() call for this child
+                    if child.cpu_sample is not None:
+                        prev_cpu, prev_time = child.cpu_sample
+                        entry["cpu_percent"] = round(100.0 * (cpu - prev_cpu) / max(now - prev_time, 1e-3), 1)
+                    child.cpu_sample = (cpu, now)
+                    entry["rss_mb"] = round(rss / (1024 * 1024), 1)
+            result[name] = entry
+        return result
+
+    def report(self):
+        stats = self.stats()
+        for name, entry in stats.items():
+            print(f"[supervisor] {name}: alive={entry['alive']} pid={entry['pid']} "
+                  f"cpu={entry['cpu_percent']}% rss={entry['rss_mb']}MB "
+                  f"restarts={entry['restarts']} hangs={entry['hangs']}")
+        if self.status_path:
+            tmp_path = self.status_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"time": time.time(), "children": stats}, f, indent=2)
+            os.replace(tmp_path, self.status_path)
+        return stats
@@ -0,0 +1,47 @@
+import json
+from collections import namedtuple
+
+# A named region in fractions of the frame, saved at full resolution
+ROI = namedtuple("ROI", ["name", "x", "y", "w", "h", "cameras", "quality"])
+
+# The regions the trackers look at (see the ROI code in each script)
+DEFAULT_ROIS = [
+    ROI("pedal", 0.80, 0.00, 0.20, 0.40, None, 95),      # pedal_tracking.py
+    ROI("stick", 0.00, 0.60, 0.35, 0.40, None, 95),      # stick_tracking.py
+    ROI("throttle", 0.68, 0.20, 0.32, 0.80, None, 95),   # throtte_tracking.py
+]
+
+
+def load_roi_profile(path):
+    """
+    Load an ROI recording profile from JSON:
+
+        {"full_every": 10, "full_quality": 80,
+         "rois": [{"name": "pedal", "x": 0.8, "y": 0.0, "w": 0.2, "h": 0.4,
+                   "cameras": [0], "quality": 95}, ...]}
+
+    Coordinates are fractions of the frame. "cameras" limits an ROI to some
+    cameras (default all); an empty list keeps it in the profile but records
+    it on no camera. The full frame is saved every `full_every` frames
+    at JPEG quality `full_quality`.
+    """
+    with open(path) as f:
+        profile = json.load(f)
+    rois = []
+    for entry in profile.get("rois", []):
+        roi = ROI(entry["name"], float(entry["x"]), float(entry["y"]), float(entry["w"]), float(entry["h"]),
+                  entry.get("cameras"), int(entry.get("quality", 95)))
+        if not (0 <= roi.x < 1 and 0 <= roi.y < 1 and 0 < roi.w <= 1 - roi.x + 1e-9 and 0 < roi.h <= 1 - roi.y + 1e-9):
+            raise ValueError(f"ROI {roi.name} does not fit in the frame")
+        rois.append(roi)
+    return {
+        "rois": rois or list(DEFAULT_ROIS),
+        "full_every": max(int(profile.get("full_every", 10)), 1),
+        "full_quality": int(profile.get("full_quality", 80)),
+    }
+
+
+def roi_pixels(roi, width, height):
+    """(x0, y0, x1, y1) of an ROI in a frame of the given size"""
+    x0, y0 = int(roi.x * width), int(roi.y * height)
+    return x0, y0, min(width, x0 + int(round(roi.w * width))), min(height, y0 + int(round(roi.h * height)))
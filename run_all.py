@@ -1,16 +1,20 @@
+import time
+_IMPORT_START = time.perf_counter()
 import subprocess
 import os
 import signal
 import sys
-from multiprocess import Process
+import argparse
+import importlib
 import datetime
-import time
-from video_stamp import stamp_video
-from flask import Flask, render_template_string, send_file
 import socket
 import glob
 import threading
 
+# Heavy dependencies (cv2, flask, piexif, pyserial, pynmea2, multiprocess) are
+# imported inside the subcommand that needs them, so each systemd service only
+# pays for its own imports.
+
 def increment_filename(filepath):
     base, ext = os.path.splitext(filepath)
     counter = 1
@@ -20,6 +24,14 @@ def increment_filename(filepath):
         counter += 1
     return new_filepath
 
+def stamp_video(display=False, overlay_mode=None, proxy_width=None, roi_profile=None, triggered=None,
+                suppress_static=None, staging=None, record_on_start=None, auto_exposure=None):
+    """Record both cameras with overlays (imports OpenCV, piexif and the GPS reader)"""
+    from video_stamp import stamp_video as _stamp_video
+    _stamp_video(display=display, overlay_mode=overlay_mode, proxy_width=proxy_width, roi_profile=roi_profile,
+                 triggered=triggered, suppress_static=suppress_static, staging=staging,
+                 record_on_start=record_on_start, auto_exposure=auto_exposure)
+
 def see_cam():
     output_file = increment_filename("Videos/see_cam.mjpeg")
     see_cam_cmd = f"sudo v4l2-ctl --device /dev/video0 --stream-mmap --stream-to={output_file} --stream-count=1000000 --set-fmt-video=width=1920,height=1080,pixelformat=MJPG --set-parm 30"
@@ -33,20 +45,8 @@ def web_cam():
     print(web_cam_cmd)
     subprocess.run(web_cam_cmd, shell=True)
 
-def mavproxy():
-    # First, kill any existing mavproxy processes
-    print("Checking for existing mavproxy processes...")
-    try:
-        # Find and kill any existing mavproxy processes
-        subprocess.run("pkill -f mavproxy.py", shell=True)
-        print("Terminated existing mavproxy processes")
-        # Small delay to ensure processes are fully terminated
-        time.sleep(1)
-    except Exception as e:
-        print(f"Note: Error when trying to kill existing mavproxy processes: {e}")
-    
-    folder_name = increment_filename("mav_logs")
-    
+def get_remote_ip():
+    """IP of the ground station: the SSH client, else the last one seen, else localhost"""
     # Get the remote IP address from SSH_CONNECTION
     ssh_connection = os.getenv("SSH_CONNECTION", "")
     if (ssh_connection):
@@ -66,13 +66,36 @@ def mavproxy():
             # Fallback to a default IP if remote_ip.txt is not available
             remote_ip = "127.0.0.1"
             print(f"SSH_CONNECTION not found, using default IP: {remote_ip}")
+    return remote_ip
 
-    subprocess.run(f"mkdir -p {folder_name}", shell=True)
-    output_file = increment_filename(f"{folder_name}/mavproxy.log")
-    mission = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    mavproxy_cmd = f"mavproxy.py --out {remote_ip}:14550 --non-interactive --baudrate=912000 --mission={mission} --state-basedir={folder_name} > {output_file} &"
-    print(mavproxy_cmd)
-    subprocess.run(mavproxy_cmd, shell=True)
+def mav_endpoints():
+    """UDP endpoints to forward MAVLink to: the ground station plus MAV_ENDPOINTS"""
+    endpoints = [(get_remote_ip(), 14550)]
+    # Extra endpoints as "host:port,host:port", e.g. a second laptop
+    for item in os.getenv("MAV_ENDPOINTS", "").split(","):
+        if ":" in item:
+            host, port = item.strip().rsplit(":", 1)
+            endpoints.append((host, int(port)))
+    return endpoints
+
+def mavproxy():
+    """Route the autopilot link in-process: tlog, UDP forwarding and shared state"""
+    from mav_router import MavRouter, default_tlog_path
+    from mav_rates import MessageRateManager, load_rate_profile
+
+    folder_name = increment_filename("mav_logs")
+    os.makedirs(folder_name, exist_ok=True)
+    router = MavRouter(device=os.getenv("MAV_DEVICE"), baud=921600,
+                       endpoints=mav_endpoints(), tlog_path=default_tlog_path(folder_name))
+    router.open()
+
+    # Spend the link on the messages we analyse (see mav_rates.json)
+    profile_path = os.getenv("MAV_RATE_PROFILE", "mav_rates.json")
+    rates = MessageRateManager(router.master,
+                               load_rate_profile(profile_path if os.path.exists(profile_path) else None))
+    router.add_message_hook(rates.observe)
+    router.add_tick_hook(rates.tick)
+    router.run()
 
 def gps_logger():
     """Log GPS data to a file"""
@@ -151,6 +174,16 @@ def gps_logger():
     except (PermissionError, IOError) as e:
         print(f"Error accessing GPS device: {e}")
 
+def compact_sessions():
+    """Re-encode finished camera sessions to video while nothing is recording"""
+    from compact_sessions import compact_sessions as _compact_sessions
+    _compact_sessions(watch=True)
+
+def storage_governor():
+    """Watch free space and prune offloaded sessions when it runs low"""
+    from storage_governor import StorageGovernor
+    StorageGovernor().watch()
+
 def get_local_ip():
     """Get the local IP address of this machine"""
     try:
@@ -168,6 +201,13 @@ def image_server():
     """
     Start a Flask web server that displays the latest images from both cameras
     """
+    from flask import Flask, render_template_string, send_file
+    from session_browser import register_session_routes
+    from adaptive_preview import register_preview_routes
+    from capture_monitor import register_capture_routes
+    from capture_control import register_control_routes
+    from storage_governor import register_storage_routes
+
     app = Flask(__name__)
     
     # Define the HTML template with improved JavaScript for smoother updates
@@ -493,6 +533,22 @@ def image_server():
         except Exception as e:
             print(f"Error serving camera 1 image: {e}")
             return str(e), 500
+
+    # Session listing, resumable file downloads and streamed archives
+    register_session_routes(app)
+
+    # Per-client adaptive MJPEG preview (/camera0_stream, /camera1_stream)
+    register_preview_routes(app)
+
+    # Live dropped-frame and capture-rate counters written by stamp_video
+    register_capture_routes(app)
+
+    # POST /trigger: save the buffered seconds and the next window at full rate;
+    # /session/start, /session/stop, /session/rotate: switch sessions
+    register_control_routes(app)
+
+    # Free space, predicted recording time left and offloaded-session marking
+    register_storage_routes(app)
     
     # Get the local IP address
     local_ip = get_local_ip()
@@ -505,7 +561,10 @@ def image_server():
     app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
 
 
-def main():
+def run_all():
+    """Start every service in its own process (the original run_all behaviour)"""
+    from multiprocess import Process
+
     p1 = Process(target=stamp_video)
     p2 = Process(target=image_server)  # Add the image server process
     p3 = Process(target=mavproxy)
@@ -526,5 +585,83 @@ def main():
         print("Stopping all processes...")
         # Add cleanup code here if needed
 
+
+# Subcommand -> (function, modules it imports when it starts). The module list
+# is what --imports-only loads, so the startup report measures the real cost.
+SUBCOMMANDS = {
+    "stamp_video": (stamp_video, ["video_stamp"]),
+    "image_server": (image_server, ["flask", "session_browser", "adaptive_preview",
+                                    "capture_monitor", "capture_control", "storage_governor"]),
+    "mavproxy": (mavproxy, ["mav_router", "mav_rates", "pymavlink.mavutil"]),
+    "gps_logger": (gps_logger, []),
+    "compact_sessions": (compact_sessions, ["compact_sessions", "frame_log"]),
+    "storage_governor": (storage_governor, ["storage_governor", "session_browser", "compact_sessions"]),
+    "see_cam": (see_cam, []),
+    "web_cam": (web_cam, []),
+    "all": (run_all, ["multiprocess", "video_stamp", "flask", "session_browser", "adaptive_preview",
+                      "capture_monitor", "capture_control", "storage_governor", "mav_router", "mav_rates",
+                      "pymavlink.mavutil"]),
+}
+
+
+def _peak_rss_mb():
+    import resource
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def startup_report(name, import_seconds):
+    """One line with the import time and peak RSS of a subcommand"""
+    line = f"[startup] {name}: imports {import_seconds * 1000:.1f} ms, peak rss {_peak_rss_mb():.1f} MB"
+    print(line, flush=True)
+    return line
+
+
+def compare_startup():
+    """Run every subcommand with --imports-only in a fresh interpreter and tabulate"""
+    print(f"{'subcommand':<14}{'wall ms':>10}{'import ms':>11}{'rss MB':>9}")
+    for name in SUBCOMMANDS:
+        t0 = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), name, "--imports-only"],
+                                capture_output=True, text=True)
+        wall = (time.perf_counter() - t0) * 1000
+        report = [l for l in result.stdout.splitlines() if l.startswith("[startup]")]
+        if result.returncode != 0 or not report:
+            error = (result.stderr.strip().splitlines() or ["failed"])[-1]
+            print(f"{name:<14}{wall:>10.0f}  {error}")
+            continue
+        # "[startup] name: imports X ms, peak rss Z MB"
+        parts = report[0].split()
+        import_ms = float(parts[parts.index("imports") + 1])
+        rss = float(parts[parts.index("rss") + 1])
+        print(f"{name:<14}{wall:>10.0f}{import_ms:>11.1f}{rss:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Start the black box services")
+    parser.add_argument("command", nargs="?", default="all",
+                        choices=list(SUBCOMMANDS) + ["startup_report"],
+                        help="service to run (default: all of them); "
+                             "startup_report compares the startup cost of each")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print import time and RSS before the service starts")
+    parser.add_argument("--imports-only", action="store_true",
+                        help="load the service's modules, print the startup report and exit")
+    args = parser.parse_args(argv)
+
+    if args.command == "startup_report":
+        compare_startup()
+        return
+
+    target, modules = SUBCOMMANDS[args.command]
+    if args.startup_report or args.imports_only:
+        for module in modules:
+            importlib.import_module(module)
+        # Counted from the first line of this module, so it includes run_all itself
+        startup_report(args.command, time.perf_counter() - _IMPORT_START)
+        if args.imports_only:
+            return
+    target()
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -2,40 +2,38 @@ import subprocess
 import os
 import signal
 import sys
-from multiprocess import Process
 import datetime
 import time
-from video_stamp import stamp_video
-from run_all import see_cam, web_cam, mavproxy, gps_logger
+# run_all's wrappers import each service's heavy modules inside the child,
+# so the supervisor itself stays small
+from run_all import stamp_video, see_cam, web_cam, mavproxy, gps_logger, compact_sessions, storage_governor, \
+    image_server
+from process_supervisor import ChildSpec, Supervisor
 
 def main():
-    def start_process(target):
-        """Start a process and return it."""
-        process = Process(target=target)
-        process.daemon = True  # Run as a daemon process
-        process.start()
-        return process
-
-    # Start the processes
-    processes = {
-        "stamp_video": start_process(stamp_video),
-        "mavproxy": start_process(mavproxy),
-        "gps_logger": start_process(gps_logger),
-    }
-
-    try:
-        while True:
-            # Monitor processes and restart if any of them exit
-            for name, process in processes.items():
-                if not process.is_alive():
-                    print(f"Process {name} has stopped. Restarting...")
-                    processes[name] = start_process(globals()[name])  # Restart the process
-
-            time.sleep(5)  # Check every 5 seconds
-    except KeyboardInterrupt:
-        print("Main program interrupted. Exiting...")
-        for process in processes.values():
-            process.terminate()
+    # stamp_video heartbeats once per written frame pair and the MAVLink router
+    # once a second, so a wedged camera or serial read shows up as a missed
+    # heartbeat instead of a process that looks alive. gps_logger hands off to
+    # a background process and returns, so it only needs restarting if it fails.
+    # compact_sessions heartbeats while it waits and while ffmpeg encodes, and
+    # exits cleanly when ffmpeg is not installed. storage_governor heartbeats
+    # after every 5 s sample, but deleting a large session can take a minute.
+    # image_server serves the sessions, preview, capture and storage routes;
+    # Flask only returns if it failed to start.
+    supervisor = Supervisor(
+        [
+            ChildSpec("stamp_video", stamp_video, heartbeat_timeout=15.0, startup_grace=30.0),
+            ChildSpec("mavproxy", mavproxy, heartbeat_timeout=10.0, startup_grace=10.0),
+            ChildSpec("gps_logger", gps_logger, restart="on-failure"),
+            ChildSpec("compact_sessions", compact_sessions, restart="on-failure", heartbeat_timeout=30.0,
+                      startup_grace=10.0),
+            ChildSpec("storage_governor", storage_governor, heartbeat_timeout=120.0, startup_grace=10.0),
+            ChildSpec("image_server", image_server, restart="on-failure"),
+        ],
+        status_path="supervisor_status.json",
+    )
+    supervisor.run()
+    print("Main program interrupted. Exiting...")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
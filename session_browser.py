@@ -0,0 +1,427 @@
+import os
+import glob
+import time
+import hashlib
+import tarfile
+import zipfile
+import datetime
+import re
+
+# Where each recorder leaves its output (relative to the repo root)
+SESSION_PATTERNS = [
+    ("camera", "Images/cam*_*"),
+    ("mavlink", "mav_logs*"),
+    ("gps", "gps_logs/*.log"),
+]
+
+# Written to in place while a camera session records or is compacted, so
+# adding to them does not touch the session folder's own mtime
+CAMERA_SUBFOLDERS = ("proxy", "roi", "video")
+CAMERA_SIDECARS = ("frames.bin", "sharpness.csv", "repeats.csv", "overlay.jsonl", "video/frames.csv")
+
+CHUNK_SIZE = 256 * 1024
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+def _session_start_from_name(name):
+    """Parse the YYYYmmdd_HHMMSS suffix that stamp_video puts on camera folders"""
+    match = re.search(r"(\d{8}_\d{6})", name)
+    if not match:
+        return None
+    try:
+        return datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+    except ValueError:
+        return None
+
+
+def _iso(ts):
+    if ts is None:
+        return None
+    return datetime.datetime.fromtimestamp(ts).isoformat(timespec="seconds")
+
+
+class SessionIndex:
+    """List recording sessions on disk and resolve files inside them safely"""
+    def __init__(self, root="."):
+        self.root = os.path.realpath(root)
+        # Scanning a camera folder with 100k images is not free, so cache the
+        # summary until the folder, one of its subfolders or a sidecar changes
+        self._summary_cache = {}
+
+    def _session_paths(self):
+        for kind, pattern in SESSION_PATTERNS:
+            for path in sorted(glob.glob(os.path.join(self.root, pattern))):
+                if kind == "gps" and not os.path.isfile(path):
+                    continue
+                if kind != "gps" and not os.path.isdir(path):
+                    continue
+                yield kind, os.path.relpath(path, self.root)
+
+    def _cache_key(self, kind, path):
+        """(mtime, size) of everything whose change means the summary is stale, or None to always rescan"""
+        st = os.stat(path)
+        if not os.path.isdir(path):
+            return st.st_mtime_ns, st.st_size
+        if kind != "camera":
+            # A few log files appended in place; rescanning is as cheap as checking
+            return None
+        paths = [os.path.join(path, name) for name in CAMERA_SUBFOLDERS + CAMERA_SIDECARS]
+        try:
+            with os.scandir(os.path.join(path, "roi")) as it:
+                paths += [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            pass
+        key = [(st.st_mtime_ns, st.st_size)]
+        for p in sorted(paths):
+            try:
+                sub = os.stat(p)
+            except OSError:
+                continue
+            key.append((p, sub.st_mtime_ns, sub.st_size))
+        return tuple(key)
+
+    def _summarize(self, kind, session_id):
+        path = os.path.join(self.root, session_id)
+        key = self._cache_key(kind, path)
+        cached = self._summary_cache.get(session_id)
+        if cached and key is not None and cached[0] == key:
+            return cached[1]
+
+        files = 0
+        size = 0
+        first = None
+        last = None
+        for name, file_size, mtime in self._walk(session_id):
+            files += 1
+            size += file_size
+            first = mtime if first is None else min(first, mtime)
+            last = mtime if last is None else max(last, mtime)
+
+        start = _session_start_from_name(session_id) or first
+        summary = {
+            "id": session_id,
+            "kind": kind,
+            "files": files,
+            "bytes": size,
+            "start": _iso(start),
+            "end": _iso(last),
+            "duration_s": round(last - start, 1) if start and last else None,
+            "last_write": last,
+        }
+        self._summary_cache[session_id] = (key, summary)
+        return summary
+
+    def list_sessions(self):
+        """Return one summary dict per session, newest first"""
+        sessions = []
+        for kind, sid in self._session_paths():
+            summary = dict(self._summarize(kind, sid))
+            last = summary.pop("last_write")
+            # Anything written in the last few seconds is still being recorded
+            summary["active"] = bool(last and time.time() - last < 10)
+            sessions.append(summary)
+        sessions.sort(key=lambda s: s["end"] or "", reverse=True)
+        return sessions
+
+    def resolve_session(self, session_id):
+        """Map a session id from the listing back to (kind, absolute path)"""
+        for kind, sid in self._session_paths():
+            if sid == os.path.normpath(session_id or ""):
+                return kind, os.path.join(self.root, sid)
+        return None, None
+
+    def _walk(self, session_id):
+        """Yield (relative name, size, mtime) for every regular file in a session"""
+        path = os.path.join(self.root, session_id)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            yield os.path.basename(path), st.st_size, st.st_mtime
+            return
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            with os.scandir(os.path.join(path, rel_dir)) as it:
+                for entry in it:
+                    rel = os.path.join(rel_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(rel)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat()
+                        yield rel, st.st_size, st.st_mtime
+
+    def list_files(self, session_id):
+        """Files of one session in a stable order (numeric frame order for images)"""
+        def sort_key(item):
+            digits = re.findall(r"\d+", item[0])
+            return (os.path.dirname(item[0]), int(digits[-1]) if digits else -1, item[0])
+        return sorted(self._walk(session_id), key=sort_key)
+
+    def resolve_file(self, session_id, name):
+        """Absolute path of a file inside a session, or None if it escapes the session"""
+        kind, path = self.resolve_session(session_id)
+        if path is None:
+            return None
+        if os.path.isfile(path):
+            return path if name == os.path.basename(path) else None
+        candidate = os.path.realpath(os.path.join(path, name))
+        if not candidate.startswith(os.path.realpath(path) + os.sep):
+            return None
+        return candidate if os.path.isfile(candidate) else None
+
+
+def parse_range(header, total):
+    """
+    Parse a single-range HTTP Range header against a body of `total` bytes.
+
+    Returns (start, end) inclusive, None if there is no usable range (serve the
+    whole body) or "unsatisfiable" if the range lies outside the body.
+    Multi-range requests are answered with the full body.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    spec = header[len("bytes="):].strip()
+    start_s, _, end_s = spec.partition("-")
+    try:
+        if start_s == "":
+            # Suffix range: last N bytes
+            length = int(end_s)
+            if length <= 0:
+                return "unsatisfiable"
+            start = max(0, total - length)
+            end = total - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else total - 1
+    except ValueError:
+        return None
+    if start >= total or start > end:
+        return "unsatisfiable"
+    return start, min(end, total - 1)
+
+
+class TarStream:
+    """
+    Uncompressed tar of a session, generated on the fly.
+
+    Every member is a fixed-size header plus the file padded to 512 bytes, so
+    the byte offset of every member is known up front. That gives the archive
+    an exact Content-Length and lets a client resume it with a Range request
+    without anything being staged on disk.
+    """
+    def __init__(self, index, session_id):
+        self.segments = []
+        digest = hashlib.sha1(session_id.encode())
+        prefix = os.path.basename(os.path.normpath(session_id))
+        if prefix.endswith(".log"):
+            prefix = os.path.splitext(prefix)[0]
+
+        _, session_path = index.resolve_session(session_id)
+        single_file = os.path.isfile(session_path)
+
+        offset = 0
+        for name, size, mtime in index.list_files(session_id):
+            info = tarfile.TarInfo(name=f"{prefix}/{name}")
+            info.size = size
+            info.mtime = int(mtime)
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.GNU_FORMAT)
+            path = session_path if single_file else os.path.join(session_path, name)
+            padding = (TAR_BLOCK - size % TAR_BLOCK) % TAR_BLOCK
+            self.segments.append((offset, header, path, size, padding))
+            offset += len(header) + size + padding
+            digest.update(f"{name}:{size}:{int(mtime)}".encode())
+
+        # Two zero blocks mark the end of the archive
+        self.trailer_offset = offset
+        self.size = offset + 2 * TAR_BLOCK
+        self.etag = digest.hexdigest()
+
+    def iter_range(self, start=0, end=None):
+        """Yield archive bytes [start, end] (inclusive)"""
+        end = self.size - 1 if end is None else end
+        for seg_offset, header, path, size, padding in self.segments:
+            seg_end = seg_offset + len(header) + size + padding
+            if seg_end <= start:
+                continue
+            if seg_offset > end:
+                return
+            yield from self._emit_segment(seg_offset, header, path, size, padding, start, end)
+        trailer_lo = max(start, self.trailer_offset)
+        if trailer_lo <= end:
+            yield bytes(end - trailer_lo + 1)
+
+    @staticmethod
+    def _emit_segment(seg_offset, header, path, size, padding, start, end):
+        # Header
+        lo = max(start - seg_offset, 0)
+        hi = min(end - seg_offset + 1, len(header))
+        if lo < hi:
+            yield header[lo:hi]
+
+        # File body, read with pread so the kernel can do straight sequential IO
+        body_offset = seg_offset + len(header)
+        lo = max(start - body_offset, 0)
+        hi = min(end - body_offset + 1, size)
+        if lo < hi:
+            sent = 0
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                fd = None
+            try:
+                pos = lo
+                while fd is not None and pos < hi:
+                    chunk = os.pread(fd, min(CHUNK_SIZE, hi - pos), pos)
+                    if not chunk:
+                        break
+                    yield chunk
+                    pos += len(chunk)
+                    sent += len(chunk)
+            finally:
+                if fd is not None:
+                    os.close(fd)
+            # A file that shrank (or vanished) since the listing is zero filled
+            # so the member offsets promised in the headers stay valid
+            if sent < hi - lo:
+                yield bytes(hi - lo - sent)
+
+        # Padding to the next block
+        pad_offset = body_offset + size
+        lo = max(start - pad_offset, 0)
+        hi = min(end - pad_offset + 1, padding)
+        if lo < hi:
+            yield bytes(hi - lo)
+
+
+class _ChunkSink:
+    """Minimal unseekable file object that zipfile can write into"""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip(index, session_id):
+    """
+    Stream a session as a stored (uncompressed) zip.
+
+    JPEGs do not compress, so ZIP_STORED keeps the Pi's CPU free. zipfile
+    writes data descriptors when the output is not seekable, so nothing is
+    buffered beyond one chunk. Zips cannot be resumed; use the tar format for
+    that.
+    """
+    sink = _ChunkSink()
+    prefix = os.path.splitext(os.path.basename(os.path.normpath(session_id)))[0]
+    _, session_path = index.resolve_session(session_id)
+    single_file = os.path.isfile(session_path)
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for name, size, mtime in index.list_files(session_id):
+            path = session_path if single_file else os.path.join(session_path, name)
+            info = zipfile.ZipInfo(f"{prefix}/{name}",
+                                   date_time=time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = size
+            try:
+                with open(path, "rb") as src, zf.open(info, "w", force_zip64=size > 0x7FFFFFFF) as dst:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        yield from sink.drain()
+            except OSError as e:
+                print(f"Skipping {path} in zip: {e}")
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def register_session_routes(app, root="."):
+    """Add the session browser endpoints to the image server Flask app"""
+    from flask import Response, abort, jsonify, request, send_file
+
+    index = SessionIndex(root)
+
+    @app.route('/sessions')
+    def sessions():
+        """List every recording session with sizes and time ranges"""
+        return jsonify(index.list_sessions())
+
+    @app.route('/sessions/files')
+    def session_files():
+        """List the files of one session"""
+        session_id = request.args.get("session", "")
+        kind, path = index.resolve_session(session_id)
+        if path is None:
+            abort(404)
+        files = [{"name": name, "bytes": size, "mtime": _iso(mtime)}
+                 for name, size, mtime in index.list_files(session_id)]
+        return jsonify({"session": session_id, "kind": kind, "files": files})
+
+    @app.route('/sessions/download')
+    def session_download():
+        """
+        Download one file. send_file answers Range/If-Range itself and hands the
+        file to the WSGI server's file_wrapper, which uses sendfile when the
+        server supports it.
+        """
+        path = index.resolve_file(request.args.get("session", ""), request.args.get("file", ""))
+        if path is None:
+            abort(404)
+        return send_file(path, conditional=True, etag=True, as_attachment=True,
+                         download_name=os.path.basename(path))
+
+    @app.route('/sessions/archive')
+    def session_archive():
+        """Stream a whole session as tar (resumable) or zip"""
+        session_id = request.args.get("session", "")
+        fmt = request.args.get("format", "tar")
+        kind, path = index.resolve_session(session_id)
+        if path is None:
+            abort(404)
+        base = os.path.splitext(os.path.basename(os.path.normpath(session_id)))[0]
+
+        if fmt == "zip":
+            return Response(iter_zip(index, session_id), mimetype="application/zip",
+                            headers={"Content-Disposition": f"attachment; filename={base}.zip"})
+        if fmt != "tar":
+            abort(400)
+
+        archive = TarStream(index, session_id)
+        headers = {
+            "Content-Disposition": f"attachment; filename={base}.tar",
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{archive.etag}"',
+        }
+        # A resumed download is only valid against the same file list
+        if_range = request.headers.get("If-Range")
+        byte_range = None
+        if not if_range or if_range.strip('"') == archive.etag:
+            byte_range = parse_range(request.headers.get("Range"), archive.size)
+
+        if byte_range == "unsatisfiable":
+            headers["Content-Range"] = f"bytes */{archive.size}"
+            return Response(status=416, headers=headers)
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{archive.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return Response(archive.iter_range(start, end), status=206,
+                            mimetype="application/x-tar", headers=headers)
+        headers["Content-Length"] = str(archive.size)
+        return Response(archive.iter_range(), mimetype="application/x-tar", headers=headers)
+
+    return index
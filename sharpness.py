@@ -0,0 +1,120 @@
+"""
+Per-frame sharpness scores, so the trackers can skip motion-blurred frames.
+
+stamp_video scores every saved frame (the variance of the Laplacian of a
+thumbnail, before the overlay is drawn) and writes sharpness.csv next to
+the JPEGs. The score depends on the scene as much as on blur, so frames
+are compared with the median of their neighbours rather than a fixed
+threshold.
+
+    python3 sharpness.py Images/cam0_20250421_101500            # summary
+    python3 sharpness.py Images/cam0_20250421_101500 --list     # blurry frame indices
+"""
+import argparse
+import io
+import os
+import time
+
+import cv2
+import numpy as np
+
+FILENAME = "sharpness.csv"
+
+
+def sharpness(frame, stride=4):
+    """
+    Variance of the Laplacian of every `stride`-th pixel of the green
+    channel (480x270 for 1080p, about 0.4 ms). Point sampling keeps the
+    edges a resize would average away, so blur still shows.
+    """
+    if frame.ndim == 3:
+        thumb = np.ascontiguousarray(frame[::stride, ::stride, 1])
+    else:
+        thumb = np.ascontiguousarray(frame[::stride, ::stride])
+    _, std = cv2.meanStdDev(cv2.Laplacian(thumb, cv2.CV_16S))
+    return float(std[0, 0]) ** 2
+
+
+class SharpnessLog:
+    """
+    Sidecar sharpness.csv: frame index and sharpness of each saved frame,
+    flushed about once a second like frames.bin
+    """
+    def __init__(self, folder, flush_interval=1.0):
+        self.path = os.path.join(folder, FILENAME)
+        new = not os.path.exists(self.path)
+        self.file = open(self.path, "a")
+        if new:
+            self.file.write("frame_idx,sharpness\n")
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def write(self, idx, score):
+        self.file.write(f"{idx},{score:.1f}\n")
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.last_flush = now
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_sharpness(folder):
+    """(frame indices, scores) as NumPy arrays, empty if the folder has no sharpness.csv"""
+    path = os.path.join(folder, FILENAME)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.empty(0, np.int64), np.empty(0)
+    with open(path) as f:
+        text = f.read()
+    if not text.endswith("\n"):
+        # Torn last line from a power cut
+        text = text[:text.rfind("\n") + 1]
+    if text.count("\n") < 2:
+        return np.empty(0, np.int64), np.empty(0)
+    data = np.loadtxt(io.StringIO(text), delimiter=",", skiprows=1, ndmin=2)
+    return data[:, 0].astype(np.int64), data[:, 1]
+
+
+def relative_sharpness(scores, window=41):
+    """Each score divided by the median of the `window` frames around it (1.0 = typical for that moment)"""
+    scores = np.asarray(scores, dtype=float)
+    if not len(scores):
+        return scores
+    half = window // 2
+    padded = np.pad(scores, half, mode="edge")
+    medians = np.median(np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1), axis=1)
+    # A featureless stretch (lens cap, flat sky) has no edges to lose: 1.0
+    return np.divide(scores, medians, out=np.ones_like(scores), where=medians > 0)
+
+
+def blurry_frames(folder, ratio=0.5, window=41):
+    """Indices of frames less than `ratio` as sharp as their neighbours"""
+    idx, scores = read_sharpness(folder)
+    return idx[relative_sharpness(scores, window) < ratio]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("folder", help="camera folder of a session")
+    parser.add_argument("--ratio", type=float, default=0.5,
+                        help="blurry below this fraction of the neighbouring frames' median")
+    parser.add_argument("--window", type=int, default=41, help="frames in the rolling median")
+    parser.add_argument("--list", action="store_true", help="print the blurry frame indices")
+    args = parser.parse_args()
+
+    idx, scores = read_sharpness(args.folder)
+    if not len(idx):
+        raise SystemExit(f"No {FILENAME} in {args.folder}")
+    blurry = idx[relative_sharpness(scores, args.window) < args.ratio]
+    if args.list:
+        print("\n".join(str(i) for i in blurry))
+        return
+    p10, p50, p90 = np.percentile(scores, [10, 50, 90])
+    print(f"{len(idx)} frames, sharpness p10 {p10:.0f} / median {p50:.0f} / p90 {p90:.0f}")
+    print(f"{len(blurry)} blurry ({100 * len(blurry) / len(idx):.1f}%) below {args.ratio:g}x "
+          f"the median of {args.window} neighbouring frames")
+
+
+if __name__ == '__main__':
+    main()
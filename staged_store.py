@@ -0,0 +1,188 @@
+import os
+import time
+from threading import Condition, Thread
+
+FSYNC_POLICIES = ("none", "chunk", "frame")
+
+
+class StagedFrameStore:
+    """
+    Stage encoded frames in RAM and write them to the SD card in large batches.
+
+    Writer threads hand over finished files (path, JPEG bytes) with put().
+    One flusher thread writes the staged files back to back, in the order
+    they arrived, once `chunk_bytes` are staged or the oldest file has waited
+    `max_delay` seconds. The card sees long sequential bursts from one
+    thread instead of a trickle of small writes from several, and a latency
+    spike on the card only grows the RAM backlog instead of stalling capture.
+
+    fsync policy:
+      "none"  - leave write-back to the kernel
+      "chunk" - once a batch is written, fdatasync its files and fsync their
+                folders (the default); other writers' dirty pages are left alone
+      "frame" - fdatasync every file before the next (slowest, safest)
+
+    Above `high_watermark` staged bytes the flusher is woken at once and
+    writes everything without syncing until the backlog is drained (an
+    emergency flush). At `limit` bytes put() blocks, the same back-pressure
+    the writer queue gave before. Anything still staged is lost on power
+    loss, so keep max_delay short.
+    """
+    def __init__(self, chunk_bytes=32 << 20, max_delay=2.0, high_watermark=128 << 20, limit=256 << 20,
+                 fsync="chunk"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.chunk_bytes = chunk_bytes
+        self.max_delay = max_delay
+        self.high_watermark = high_watermark
+        self.limit = limit
+        self.fsync = fsync
+        self.staged = []               # (path, data) in arrival order
+        self.staged_bytes = 0
+        self.oldest = None             # monotonic time the oldest staged file arrived
+        self.closing = False
+        self.cond = Condition()
+        self.dirs = set()
+        # Counters for stats()
+        self.started = None
+        self.bytes_flushed = 0
+        self.files_flushed = 0
+        self.flushes = 0
+        self.emergency_flushes = 0
+        self.write_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.peak_staged = 0
+        self.stall_seconds = 0.0
+        self.errors = 0
+        self.flusher = Thread(target=self._flush_thread, daemon=True)
+        self.flusher.start()
+
+    def put(self, path, data):
+        """Stage one file; blocks while `limit` bytes are already staged"""
+        with self.cond:
+            if self.started is None:
+                self.started = time.monotonic()
+            if self.staged_bytes >= self.limit:
+                t0 = time.monotonic()
+                while self.staged_bytes >= self.limit and not self.closing:
+                    self.cond.wait()
+                self.stall_seconds += time.monotonic() - t0
+            if not self.staged:
+                self.oldest = time.monotonic()
+            self.staged.append((path, data))
+            self.staged_bytes += len(data)
+            self.peak_staged = max(self.peak_staged, self.staged_bytes)
+            if self.staged_bytes >= self.chunk_bytes:
+                self.cond.notify_all()
+
+    def _flush_thread(self):
+        while True:
+            with self.cond:
+                while not self.closing and not self._due():
+                    timeout = None if self.oldest is None else self.oldest + self.max_delay - time.monotonic()
+                    self.cond.wait(timeout)
+                if not self.staged and self.closing:
+                    return
+                batch, self.staged = self.staged, []
+                size, self.staged_bytes = self.staged_bytes, 0
+                self.oldest = None
+                emergency = size >= self.high_watermark
+                # Writers blocked at the limit can stage the next batch while this one is written
+                self.cond.notify_all()
+            self._write_batch(batch, size, emergency)
+
+    def _due(self):
+        return (self.staged_bytes >= self.chunk_bytes
+                or (self.oldest is not None and time.monotonic() - self.oldest >= self.max_delay))
+
+    def _write_batch(self, batch, size, emergency):
+        t0 = time.monotonic()
+        sync_chunk = self.fsync == "chunk" and not emergency
+        written = []                   # open files of this batch, synced together at the end
+        folders = set()
+        for path, data in batch:
+            folder = os.path.dirname(path)
+            if folder not in self.dirs:
+                os.makedirs(folder or ".", exist_ok=True)
+                self.dirs.add(folder)
+            try:
+                f = open(path, "wb")
+            except OSError as e:
+                self.errors += 1
+                print(f"Error writing {path}: {e}")
+                continue
+            try:
+                f.write(data)
+                f.flush()
+                if self.fsync == "frame" and not emergency:
+                    os.fdatasync(f.fileno())
+            except OSError as e:
+                self.errors += 1
+                print(f"Error writing {path}: {e}")
+                f.close()
+                continue
+            if sync_chunk:
+                written.append((path, f))
+                folders.add(folder or ".")
+            else:
+                f.close()
+        # Synced only once the whole batch is written, so the files still
+        # reach the card back to back
+        for path, f in written:
+            try:
+                os.fdatasync(f.fileno())
+            except OSError as e:
+                self.errors += 1
+                print(f"Error syncing {path}: {e}")
+            finally:
+                f.close()
+        for folder in folders:
+            # New directory entries are only durable once their folder is synced
+            try:
+                fd = os.open(folder, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                self.errors += 1
+                print(f"Error syncing {folder}: {e}")
+        elapsed = time.monotonic() - t0
+
+        self.flushes += 1
+        self.emergency_flushes += emergency
+        self.bytes_flushed += size
+        self.files_flushed += len(batch)
+        self.write_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        if emergency:
+            print(f"Emergency flush: {size / 1e6:.1f} MB staged, written in {elapsed:.2f}s")
+
+    def stats(self):
+        """
+        Burst throughput is what the card managed while it was being written
+        to, sustained is what it absorbed over the whole session; the
+        difference is the headroom staging buys.
+        """
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        return {
+            "staged_mb": round(self.staged_bytes / 1e6, 1),
+            "peak_staged_mb": round(self.peak_staged / 1e6, 1),
+            "files": self.files_flushed,
+            "flushes": self.flushes,
+            "emergency_flushes": self.emergency_flushes,
+            "burst_mb_s": round(self.bytes_flushed / 1e6 / self.write_seconds, 1) if self.write_seconds else None,
+            "sustained_mb_s": round(self.bytes_flushed / 1e6 / elapsed, 1) if elapsed else None,
+            "max_flush_s": round(self.max_flush_seconds, 3),
+            "stall_s": round(self.stall_seconds, 2),
+            "fsync": self.fsync,
+            "errors": self.errors,
+        }
+
+    def close(self):
+        """Write everything still staged and stop the flusher"""
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.flusher.join()
+        print(f"Staged writes: {self.stats()}")
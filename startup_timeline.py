@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import subprocess
+from threading import Lock
+
+DEFAULT_TIMELINE_PATH = "startup_timeline.jsonl"
+
+
+def _process_age():
+    """Seconds since this process started, and since boot at that moment (None, None off Linux)"""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name can contain spaces, so count fields after the ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started, started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None, None
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=1, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+class StartupTimeline:
+    """
+    When each start-up step of a service finished, in ms since the process
+    started (interpreter and imports included).
+
+    Every mark() is printed as it happens. finish() marks the last step and
+    appends the whole timeline, with the git revision and how long after
+    boot the process started, as one line of startup_timeline.jsonl, so
+    boot-to-first-frame can be compared across releases.
+    """
+    def __init__(self, service, path=DEFAULT_TIMELINE_PATH):
+        self.service = service
+        self.path = path
+        age, self.boot_offset = _process_age()
+        self.t0 = time.monotonic() - (age or 0.0)
+        self.events = []
+        self.finished = False
+        self.lock = Lock()
+
+    def mark(self, event):
+        ms = (time.monotonic() - self.t0) * 1000
+        with self.lock:
+            self.events.append((event, round(ms, 1)))
+        print(f"[timeline] {self.service} +{ms:.0f} ms {event}")
+        return ms
+
+    def finish(self, event):
+        """Mark the final step and write the timeline (only the first call does anything)"""
+        if self.finished:
+            return
+        self.finished = True
+        self.mark(event)
+        record = {
+            "time": time.time(),
+            "service": self.service,
+            "revision": _revision(),
+            "started_after_boot_s": round(self.boot_offset, 1) if self.boot_offset is not None else None,
+            "events": dict(self.events),
+        }
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"Could not write {self.path}: {e}")
@@ -0,0 +1,115 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+class StaticSceneDetector:
+    """
+    Spot near-duplicate frames while the aircraft sits on the ground.
+
+    Every `step`th pixel of the green channel (120x68 samples of a 1080p
+    frame, no resize) is compared with the same samples of the last frame
+    that was kept. The frame counts as a repeat when fewer than
+    `changed_fraction` of the samples moved by more than `pixel_threshold`
+    levels; a threshold per sample rather than a mean keeps sensor noise from
+    adding up to a change while a small moving object still counts. A frame
+    is kept at least every `max_interval` seconds regardless.
+
+    `on_ground` is an optional callable; when it returns False (flying) no
+    frame is ever treated as a repeat, since the cockpit itself can look
+    static in cruise.
+    """
+    def __init__(self, step=16, pixel_threshold=12, changed_fraction=0.002, max_interval=10.0,
+                 on_ground=None):
+        self.step = step
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.max_interval = max_interval
+        self.on_ground = on_ground
+        self.reference = None
+        self.reference_time = 0.0
+        self.repeats = 0
+        self.kept = 0
+
+    def thumbnail(self, frame):
+        return np.ascontiguousarray(frame[::self.step, ::self.step, 1])
+
+    def is_repeat(self, frame, now=None):
+        """True if the frame adds nothing over the last kept one (and need not be saved)"""
+        now = time.monotonic() if now is None else now
+        thumb = self.thumbnail(frame)
+        if (self.reference is not None and self.reference.shape == thumb.shape
+                and now - self.reference_time < self.max_interval
+                and (self.on_ground is None or self.on_ground())):
+            changed = np.count_nonzero(cv2.absdiff(thumb, self.reference) > self.pixel_threshold)
+            if changed < self.changed_fraction * thumb.size:
+                self.repeats += 1
+                return True
+        self.reference = thumb
+        self.reference_time = now
+        self.kept += 1
+        return False
+
+
+class RepeatLog:
+    """
+    Sidecar repeats.csv: each kept frame that was followed by repeats, and
+    how many consecutive frames were skipped as identical to it.
+    """
+    FILENAME = "repeats.csv"
+
+    def __init__(self, folder):
+        self.path = f"{folder}/{self.FILENAME}"
+        new = not os.path.exists(self.path)
+        self.file = open(self.path, "a")
+        if new:
+            self.file.write("reference_idx,repeat_count\n")
+        self.reference = None
+        self.count = 0
+
+    def kept(self, idx):
+        self._flush_run()
+        self.reference = idx
+
+    def repeated(self, idx):
+        self.count += 1
+
+    def _flush_run(self):
+        if self.reference is not None and self.count:
+            self.file.write(f"{self.reference},{self.count}\n")
+            self.file.flush()
+        self.count = 0
+
+    def close(self):
+        self._flush_run()
+        self.file.close()
+
+
+def read_repeats(folder):
+    """reference frame index -> number of repeats that followed it ({} if none)"""
+    repeats = {}
+    try:
+        with open(f"{folder}/{RepeatLog.FILENAME}") as f:
+            next(f, None)
+            for line in f:
+                try:
+                    idx, count = line.split(",")
+                    repeats[int(idx)] = int(count)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return repeats
+
+
+def ground_check(buffer, max_speed=3.0):
+    """on_ground callable for StaticSceneDetector from a TelemetryBuffer"""
+    def on_ground():
+        state = buffer.sample(time.monotonic())
+        if state is None:
+            return True  # no telemetry, trust the image
+        speeds = [v for v in (state.get("groundspeed"), state.get("airspeed")) if v == v and v is not None]
+        return not speeds or max(speeds) < max_speed
+    return on_ground
@@ -2,6 +2,8 @@
 sudo systemctl stop stamp_video.service
 sudo systemctl stop mavproxy.service
 sudo systemctl stop gps_logger.service
+sudo systemctl stop image_server.service
 sudo systemctl status stamp_video.service
 sudo systemctl status mavproxy.service
-sudo systemctl status gps_logger.service
\ No newline at end of file
+sudo systemctl status gps_logger.service
+sudo systemctl status image_server.service
\ No newline at end of file
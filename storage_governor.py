@@ -0,0 +1,238 @@
+"""
+Keep the SD card from filling up mid-flight.
+
+Free space is sampled from statvfs, so the write rate it predicts from
+covers every writer at once: stamp_video, the MAVLink tlogs and the cat GPS
+logger. When the projected recording time runs low, stamp_video thins out
+the secondary camera (see DEGRADE), and this service deletes the oldest
+sessions that have been marked as offloaded. Nothing is deleted unless it
+was marked, and the newest session of each kind is always kept.
+
+    python3 storage_governor.py                              # print the status once
+    python3 storage_governor.py --watch                      # keep sampling and pruning
+    python3 storage_governor.py --mark-offloaded Images/cam0_20250421_101500
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import deque
+
+DEFAULT_STATUS_PATH = "storage_status.json"
+OFFLOADED_PATH = "offloaded.json"
+
+# What stamp_video does to the secondary camera at each level: JPEG quality
+# (None = unchanged) and save one full frame in `every`
+DEGRADE = {
+    "ok": {"quality": None, "every": 1},
+    "low": {"quality": 70, "every": 2},
+    "critical": {"quality": 50, "every": 5},
+}
+
+
+def load_offloaded(root="."):
+    """Session ids (as listed by the session browser) confirmed copied off the card"""
+    try:
+        with open(os.path.join(root, OFFLOADED_PATH)) as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+
+def mark_offloaded(session_ids, root="."):
+    offloaded = load_offloaded(root) | {os.path.normpath(s) for s in session_ids}
+    path = os.path.join(root, OFFLOADED_PATH)
+    with open(path + ".tmp", "w") as f:
+        json.dump(sorted(offloaded), f, indent=2)
+    os.replace(path + ".tmp", path)
+    return offloaded
+
+
+class StorageGovernor:
+    """
+    Predict the recording time left from the recent drop in free space.
+
+    The write rate is the fall in free bytes over the last `window` seconds.
+    Levels: "critical" below `reserve_mb` free or under `critical_minutes`
+    left, "low" under `low_minutes` left or below twice the reserve, "ok"
+    otherwise. The level only improves once the prediction clears the
+    threshold by 25%, so the cameras do not flap between settings.
+    """
+    def __init__(self, root=".", reserve_mb=1024, low_minutes=30.0, critical_minutes=10.0, window=120.0,
+                 prune="offloaded"):
+        if prune not in ("offloaded", "never"):
+            raise ValueError(f"Unknown prune policy {prune!r}")
+        self.root = root
+        self.reserve = reserve_mb * 1e6
+        self.low_minutes = low_minutes
+        self.critical_minutes = critical_minutes
+        self.window = window
+        self.prune_policy = prune
+        self.samples = deque()         # (monotonic time, free bytes)
+        self.level = "ok"
+        self.pruned = []               # (time.time(), session id, bytes) of everything deleted
+        self.status = None
+
+    def _classify(self, free, minutes_left, margin=1.0):
+        if free <= self.reserve or minutes_left < self.critical_minutes * margin:
+            return "critical"
+        if free < 2 * self.reserve * margin or minutes_left < self.low_minutes * margin:
+            return "low"
+        return "ok"
+
+    def sample(self, now=None):
+        """Measure free space and update the level; returns the status dict"""
+        now = time.monotonic() if now is None else now
+        usage = shutil.disk_usage(self.root)
+        self.samples.append((now, usage.free))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        t_first, free_first = self.samples[0]
+        rate = max(0.0, (free_first - usage.free) / (now - t_first)) if now > t_first else 0.0
+        minutes_left = (usage.free - self.reserve) / rate / 60 if rate > 0 else float("inf")
+
+        level = self._classify(usage.free, minutes_left)
+        order = list(DEGRADE)
+        if order.index(level) < order.index(self.level):
+            # Only step back up once comfortably clear of the threshold
+            level = max(level, self._classify(usage.free, minutes_left, margin=1.25), key=order.index)
+        if level != self.level:
+            print(f"Storage {self.level} -> {level}: {usage.free / 1e9:.1f} GB free, "
+                  f"{rate / 1e6:.2f} MB/s, {minutes_left:.0f} min left")
+        self.level = level
+        self.status = {
+            "time": time.time(),
+            "level": level,
+            "free_gb": round(usage.free / 1e9, 2),
+            "total_gb": round(usage.total / 1e9, 2),
+            "reserve_gb": round(self.reserve / 1e9, 2),
+            "write_mb_s": round(rate / 1e6, 3),
+            "minutes_left": round(minutes_left, 1) if rate > 0 else None,
+            "degrade": DEGRADE[level],
+            "prune": self.prune_policy,
+            "pruned": [{"time": t, "session": s, "bytes": b} for t, s, b in self.pruned[-20:]],
+        }
+        return self.status
+
+    def prune_candidates(self):
+        """Offloaded, inactive sessions (oldest first), never the newest of each kind"""
+        from session_browser import SessionIndex
+        from compact_sessions import recording_dirs
+        offloaded = load_offloaded(self.root)
+        if self.prune_policy == "never" or not offloaded:
+            return []
+        recording = recording_dirs(os.path.join(self.root, "Images"))
+        sessions = SessionIndex(self.root).list_sessions()
+        def started(session):
+            return session["start"] or session["end"] or ""
+        newest = {}
+        for session in sessions:
+            if session["kind"] not in newest or started(session) > started(newest[session["kind"]]):
+                newest[session["kind"]] = session
+        candidates = [
+            s for s in sessions
+            if s["id"] in offloaded and not s["active"] and s is not newest[s["kind"]]
+            and os.path.abspath(os.path.join(self.root, s["id"])) not in recording
+        ]
+        candidates.sort(key=started)
+        return candidates
+
+    def prune(self):
+        """Delete offloaded sessions until the level would be "ok" again; returns bytes freed"""
+        if self.status is None or self.level == "ok":
+            return 0
+        rate = self.status["write_mb_s"] * 1e6
+        target = max(2 * self.reserve, self.reserve + rate * self.low_minutes * 60) * 1.25
+        need = target - shutil.disk_usage(self.root).free
+        freed = 0
+        for session in self.prune_candidates():
+            if freed >= need:
+                break
+            path = os.path.join(self.root, session["id"])
+            print(f"Storage {self.level}: deleting offloaded session {session['id']} ({session['bytes'] / 1e6:.0f} MB)")
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    print(f"Error deleting {path}: {e}")
+                    continue
+            freed += session["bytes"]
+            self.pruned.append((time.time(), session["id"], session["bytes"]))
+        if freed:
+            # Deleting makes free space jump; measure the rate afresh
+            self.samples.clear()
+        return freed
+
+    def watch(self, interval=5.0, status_path=DEFAULT_STATUS_PATH):
+        from process_supervisor import heartbeat
+        while True:
+            self.sample()
+            if self.prune():
+                self.sample()
+            write_storage_status(self.status, status_path)
+            heartbeat()
+            time.sleep(interval)
+
+
+def write_storage_status(status, path=DEFAULT_STATUS_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def register_storage_routes(app, root=".", status_path=DEFAULT_STATUS_PATH):
+    """GET /storage: free space, predicted minutes left and level; POST /storage/offloaded?session=<id>"""
+    from flask import jsonify, request
+
+    @app.route('/storage')
+    def storage():
+        try:
+            with open(status_path) as f:
+                status = json.load(f)
+            status["age_s"] = round(time.time() - status.get("time", 0), 1)
+        except (OSError, ValueError):
+            # The governor is not running: a single sample, without a write rate
+            status = StorageGovernor(root).sample()
+            status["governor"] = "not running"
+        status["offloaded"] = sorted(load_offloaded(root))
+        return jsonify(status)
+
+    @app.route('/storage/offloaded', methods=['POST'])
+    def storage_offloaded():
+        from session_browser import SessionIndex
+        session_id = request.values.get("session", "")
+        kind, path = SessionIndex(root).resolve_session(session_id)
+        if path is None:
+            return jsonify({"ok": False, "error": f"unknown session {session_id!r}"}), 404
+        mark_offloaded([session_id], root)
+        return jsonify({"ok": True, "session": os.path.normpath(session_id)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--watch", action="store_true", help="keep sampling, pruning and writing the status")
+    parser.add_argument("--reserve-mb", type=float, default=1024, help="free space never to record into")
+    parser.add_argument("--low-minutes", type=float, default=30.0)
+    parser.add_argument("--critical-minutes", type=float, default=10.0)
+    parser.add_argument("--prune", choices=("offloaded", "never"), default="offloaded")
+    parser.add_argument("--mark-offloaded", nargs="+", metavar="SESSION",
+                        help="record sessions as copied off the card (ids as in /sessions)")
+    args = parser.parse_args()
+    if args.mark_offloaded:
+        print(f"Offloaded: {', '.join(sorted(mark_offloaded(args.mark_offloaded)))}")
+        return
+    governor = StorageGovernor(reserve_mb=args.reserve_mb, low_minutes=args.low_minutes,
+                               critical_minutes=args.critical_minutes, prune=args.prune)
+    if args.watch:
+        governor.watch()
+    else:
+        print(json.dumps(governor.sample(), indent=2))
+        print(f"Prunable: {[s['id'] for s in governor.prune_candidates()]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from mav_router import MavRouter, MavStatePublisher, MavStateReader, _SEQ
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def udp_socket():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    s.settimeout(2.0)
+    return s
+
+
+@pytest.fixture
+def mavutil():
+    pytest.importorskip("multiprocess")  # MavRouter.run() heartbeats through process_supervisor
+    return pytest.importorskip("pymavlink.mavutil")
+
+
+@pytest.fixture
+def routed(mavutil, tmp_path):
+    """
+    A MavRouter running on a thread, its autopilot link a UDP loopback
+    socket standing in for the flight controller and one GCS endpoint
+    """
+    port = free_udp_port()
+    gcs = udp_socket()
+    router = MavRouter(device=f"udpin:127.0.0.1:{port}", endpoints=[gcs.getsockname()],
+                       tlog_path=str(tmp_path / "logs" / "flight.tlog"),
+                       state_path=str(tmp_path / "mav_state"), flush_interval=0.1)
+    router.open()
+    thread = threading.Thread(target=router.run, daemon=True)
+    thread.start()
+
+    autopilot = udp_socket()
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+
+    def send(msg):
+        autopilot.sendto(msg.pack(mav), ("127.0.0.1", port))
+
+    yield router, send, autopilot, gcs, mav
+    router.stop()
+    thread.join(timeout=2.0)
+    autopilot.close()
+    gcs.close()
+
+
+def send_flight_state(mavutil, send, mav):
+    mavlink = mavutil.mavlink
+    send(mavlink.MAVLink_heartbeat_message(
+        mavlink.MAV_TYPE_FIXED_WING, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, 0, 3))
+    send(mavlink.MAVLink_attitude_message(12500, 0.1, -0.2, 1.5, 0.01, 0.02, 0.03))
+    send(mavlink.MAVLink_vfr_hud_message(21.0, 20.5, 90, 55, 120.0, 1.5))
+
+
+def test_forwards_autopilot_packets_to_endpoints(mavutil, routed):
+    router, send, _, gcs, mav = routed
+    send_flight_state(mavutil, send, mav)
+
+    parser = mavutil.mavlink.MAVLink(None)
+    received = []
+    while len(received) < 3:
+        data, _ = gcs.recvfrom(4096)
+        received += parser.parse_buffer(data) or []
+    assert [m.get_type() for m in received] == ["HEARTBEAT", "ATTITUDE", "VFR_HUD"]
+    assert received[1].roll == pytest.approx(0.1)
+    assert received[0].get_srcSystem() == 1
+    assert wait_for(lambda: router.stats["tx_udp"] == 3)
+
+
+def test_writes_tlog_records(mavutil, routed, tmp_path):
+    router, send, _, _, mav = routed
+    before = time.time()
+    send_flight_state(mavutil, send, mav)
+    assert wait_for(lambda: router.stats["rx_msgs"] == 3)
+    router.stop()
+    assert wait_for(lambda: router.tlog is None)
+
+    path = tmp_path / "logs" / "flight.tlog"
+    assert path.stat().st_size == router.stats["tlog_bytes"]
+    tlog = mavutil.mavlink_connection(str(path))
+    records = []
+    while True:
+        msg = tlog.recv_msg()
+        if msg is None:
+            break
+        records.append((msg._timestamp, msg.get_type()))
+    tlog.close()
+    assert [t for _, t in records] == ["HEARTBEAT", "ATTITUDE", "VFR_HUD"]
+    assert all(before - 1 <= t <= time.time() for t, _ in records)
+
+
+def test_passes_gcs_packets_to_autopilot(mavutil, routed):
+    router, send, autopilot, gcs, mav = routed
+    # The UDP link only knows where the autopilot is once it has heard from it
+    send_flight_state(mavutil, send, mav)
+    assert wait_for(lambda: router.stats["rx_msgs"] == 3)
+
+    gcs_mav = mavutil.mavlink.MAVLink(None, srcSystem=255, srcComponent=190)
+    command = gcs_mav.command_long_encode(1, 1, mavutil.mavlink.MAV_CMD_DO_SET_MODE, 0, 1, 10, 0, 0, 0, 0, 0)
+    packet = command.pack(gcs_mav)
+    gcs.sendto(packet, ("127.0.0.1", router.udp.getsockname()[1]))
+
+    data, _ = autopilot.recvfrom(4096)
+    assert data == packet
+    assert router.stats["rx_udp"] == 1
+
+
+def test_state_reader_sees_published_state(mavutil, routed, tmp_path):
+    router, send, _, _, mav = routed
+    reader = MavStateReader(str(tmp_path / "mav_state"))
+    send_flight_state(mavutil, send, mav)
+    assert wait_for(lambda: router.stats["rx_msgs"] == 3)
+
+    state = reader.read()
+    assert state.time_boot_s == pytest.approx(12.5)
+    assert (state.roll, state.pitch, state.yaw) == pytest.approx((0.1, -0.2, 1.5))
+    assert state.alt == pytest.approx(120.0)
+    assert state.heading == 90
+    assert state.zacc != state.zacc  # nothing streamed SCALED_IMU yet: NaN
+    reader.close()
+
+
+def test_state_reader_never_returns_a_torn_write(tmp_path):
+    path = str(tmp_path / "mav_state")
+    assert MavStateReader(path).read() is None  # router not running yet
+
+    publisher = MavStatePublisher(path)
+    reader = MavStateReader(path)
+    stop = threading.Event()
+
+    class Attitude:
+        def __init__(self, value):
+            self.time_boot_ms = 0
+            self.roll = self.pitch = self.yaw = value
+            self.rollspeed = self.pitchspeed = self.yawspeed = value
+
+        def get_type(self):
+            return "ATTITUDE"
+
+    def write():
+        value = 0.0
+        while not stop.is_set():
+            value += 1.0
+            publisher.update(Attitude(value))
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        reads = 0
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            state = reader.read()
+            if state is not None:
+                reads += 1
+                assert state.roll == state.pitch == state.yaw == state.yawspeed
+        assert reads
+    finally:
+        stop.set()
+        writer.join()
+
+    # A writer that died halfway through leaves the counter odd: no state
+    publisher.map[0:_SEQ.size] = _SEQ.pack(publisher.seq + 1)
+    assert reader.read() is None
+    reader.close()
+    publisher.close()
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("multiprocess")
+
+from process_supervisor import ChildSpec, Supervisor, heartbeat
+
+
+# Dummy workers (module level so any start method can pickle them)
+
+def crash():
+    sys.exit(1)
+
+
+def crash_after_a_while():
+    time.sleep(0.4)
+    sys.exit(1)
+
+
+def finish_cleanly():
+    sys.exit(0)
+
+
+def beat_forever():
+    while True:
+        heartbeat(min_interval=0.05)
+        time.sleep(0.05)
+
+
+def hang_after_first_beat():
+    heartbeat()
+    while True:
+        time.sleep(1)
+
+
+def hang_ignoring_sigterm():
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    heartbeat()
+    while True:
+        time.sleep(1)
+
+
+def run_for(supervisor, seconds):
+    """Run the supervisor on this (the main) thread for about `seconds`"""
+    timer = threading.Timer(seconds, supervisor.stop)
+    timer.start()
+    try:
+        supervisor.run()
+    finally:
+        timer.cancel()
+
+
+def restart_delays(output):
+    return [float(d) for d in re.findall(r"restarting in ([\d.]+)s", output)]
+
+
+def test_crash_restarts_with_exponential_backoff(capsys):
+    supervisor = Supervisor([ChildSpec("crash", crash)], base_backoff=0.1, max_backoff=0.4, stable_after=60)
+    run_for(supervisor, 2.0)
+    child = supervisor.children["crash"]
+    delays = restart_delays(capsys.readouterr().out)
+    assert delays[:4] == [0.1, 0.2, 0.4, 0.4]
+    assert child.restarts == len(delays)
+    assert child.last_exit == 1
+
+
+def test_backoff_resets_after_a_stable_run(capsys):
+    supervisor = Supervisor([ChildSpec("flaky", crash_after_a_while)], base_backoff=0.1, max_backoff=1.0,
+                            stable_after=0.3)
+    run_for(supervisor, 2.0)
+    delays = restart_delays(capsys.readouterr().out)
+    # Every run lasted longer than stable_after, so the delay never grows
+    assert len(delays) >= 2
+    assert set(delays) == {0.1}
+
+
+def test_missed_heartbeat_terminates_and_restarts(capsys):
+    spec = ChildSpec("hang", hang_after_first_beat, heartbeat_timeout=0.3, startup_grace=0.2)
+    supervisor = Supervisor([spec], base_backoff=0.1, kill_grace=0.5)
+    run_for(supervisor, 1.5)
+    child = supervisor.children["hang"]
+    assert child.hangs >= 1
+    assert child.restarts >= 1
+    assert child.last_exit == -signal.SIGTERM
+    assert "missed its heartbeat" in capsys.readouterr().out
+
+
+def test_hung_child_ignoring_sigterm_is_killed(capsys):
+    spec = ChildSpec("stubborn", hang_ignoring_sigterm, heartbeat_timeout=0.3, startup_grace=0.2)
+    supervisor = Supervisor([spec], base_backoff=0.1, kill_grace=0.2)
+    run_for(supervisor, 1.5)
+    assert supervisor.children["stubborn"].last_exit == -signal.SIGKILL
+    assert "ignored SIGTERM, killing" in capsys.readouterr().out
+
+
+def test_heartbeating_child_is_left_alone():
+    spec = ChildSpec("beat", beat_forever, heartbeat_timeout=0.3, startup_grace=0.2)
+    supervisor = Supervisor([spec], base_backoff=0.1)
+    run_for(supervisor, 1.5)
+    child = supervisor.children["beat"]
+    assert child.hangs == 0
+    assert child.restarts == 0
+
+
+def test_on_failure_child_is_not_restarted_after_a_clean_exit(capsys):
+    supervisor = Supervisor([ChildSpec("oneshot", finish_cleanly, restart="on-failure"),
+                             ChildSpec("always", finish_cleanly)], base_backoff=0.1)
+    run_for(supervisor, 1.0)
+    oneshot = supervisor.children["oneshot"]
+    assert oneshot.restarts == 0
+    assert oneshot.last_exit == 0
+    assert oneshot.next_start is None
+    assert "oneshot finished cleanly" in capsys.readouterr().out
+    # The same clean exit is restarted under the default policy
+    assert supervisor.children["always"].restarts >= 1
+
+
+def test_on_failure_child_is_restarted_after_a_crash():
+    supervisor = Supervisor([ChildSpec("oneshot", crash, restart="on-failure")], base_backoff=0.1)
+    run_for(supervisor, 1.0)
+    assert supervisor.children["oneshot"].restarts >= 1
+
+
+def test_stats_and_status_file(tmp_path):
+    status_path = str(tmp_path / "supervisor_status.json")
+    spec = ChildSpec("beat", beat_forever, heartbeat_timeout=5.0)
+    supervisor = Supervisor([spec, ChildSpec("crash", crash)], base_backoff=0.1, report_interval=0.3,
+                            status_path=status_path)
+    run_for(supervisor, 1.5)
+
+    with open(status_path) as f:
+        status = json.load(f)
+    assert not os.path.exists(status_path + ".tmp")
+    assert set(status["children"]) == {"beat", "crash"}
+    beat = status["children"]["beat"]
+    assert beat["alive"] is True
+    assert isinstance(beat["pid"], int)
+    assert beat["restarts"] == 0 and beat["hangs"] == 0
+    assert beat["heartbeat_age_s"] is not None and beat["heartbeat_age_s"] < 1.0
+    assert beat["uptime_s"] > 0
+    assert beat["rss_mb"] > 0
+    # Two reports a child was alive for give a CPU figure
+    assert beat["cpu_percent"] is not None
+    assert status["children"]["crash"]["restarts"] >= 1
+
+    # After shutdown nothing is left running
+    stats = supervisor.stats()
+    assert not any(entry["alive"] for entry in stats.values())
@@ -0,0 +1,113 @@
+import math
+import time
+from collections import deque
+
+
+class TriggeredRecorder:
+    """
+    Keep the last few seconds of encoded frames in RAM and only write them
+    to disk around a maneuver.
+
+    Outside a triggered window one frame in `idle_every` is written, so the
+    session still has a low-rate record of the cruise. When trigger() is
+    called, the frames still in the ring (the `pre_seconds` before the
+    trigger) are written and every frame is written until `post_seconds`
+    after the last trigger.
+
+    Frames leave through two hooks: write(payload) saves one to disk, and
+    log(payload, saved) is called for every frame in capture order once its
+    fate is known, so a frame log stays sorted.
+    """
+    def __init__(self, write, log, pre_seconds=5.0, post_seconds=10.0, idle_every=20):
+        self.write = write
+        self.log = log
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.idle_every = idle_every
+        self.ring = deque()            # [time, payload, written]
+        self.trigger_until = 0.0
+        self.frames = 0
+        self.written = 0
+        self.triggers = []             # (time.time(), reason) of every trigger
+
+    @property
+    def triggered(self):
+        return time.monotonic() < self.trigger_until
+
+    def trigger(self, reason="manual", duration=None, now=None):
+        """Start (or extend) a full-rate window; returns its end (monotonic)"""
+        now = time.monotonic() if now is None else now
+        if now >= self.trigger_until:
+            self.triggers.append((time.time(), reason))
+            print(f"Recording trigger ({reason}), saving {len(self.ring)} buffered frames")
+        self.trigger_until = max(self.trigger_until, now + (duration or self.post_seconds))
+        return self.trigger_until
+
+    def push(self, payload, now=None):
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        if now < self.trigger_until:
+            self.flush()
+            self.write(payload)
+            self.written += 1
+            self.log(payload, True)
+            return
+
+        written = (self.frames - 1) % self.idle_every == 0
+        if written:
+            self.write(payload)
+            self.written += 1
+        self.ring.append([now, payload, written])
+        while self.ring and now - self.ring[0][0] > self.pre_seconds:
+            _, old, old_written = self.ring.popleft()
+            self.log(old, old_written)
+
+    def flush(self, write=True):
+        """Empty the ring, writing the frames that were not written yet"""
+        while self.ring:
+            _, payload, written = self.ring.popleft()
+            if write and not written:
+                self.write(payload)
+                self.written += 1
+                written = True
+            self.log(payload, written)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "written": self.written,
+            "buffered": len(self.ring),
+            "triggered": self.triggered,
+            "triggers": len(self.triggers),
+        }
+
+
+class ManeuverTrigger:
+    """
+    Decide from the MAVLink state whether a maneuver is in progress.
+
+    Fires on roll or pitch rate above `rate_deg_s`, or a g-load (along the
+    body z axis, +1 in level flight) above `g_high` or below `g_low`.
+    """
+    def __init__(self, buffer, rate_deg_s=120.0, g_high=2.5, g_low=-0.5, max_age=1.0):
+        self.buffer = buffer
+        self.rate = math.radians(rate_deg_s)
+        self.g_high = g_high
+        self.g_low = g_low
+        self.max_age = max_age
+
+    def check(self, now=None):
+        """Reason string if the latest state is a maneuver, else None"""
+        now = time.monotonic() if now is None else now
+        state = self.buffer.sample(now, max_gap=self.max_age)
+        if state is None:
+            return None
+        roll_rate, pitch_rate, zacc = state["rollspeed"], state["pitchspeed"], state["zacc"]
+        if abs(roll_rate) > self.rate:
+            return f"roll rate {math.degrees(roll_rate):.0f} deg/s"
+        if abs(pitch_rate) > self.rate:
+            return f"pitch rate {math.degrees(pitch_rate):.0f} deg/s"
+        g_load = -zacc
+        if g_load > self.g_high or g_load < self.g_low:
+            return f"{g_load:.1f} g"
+        return None
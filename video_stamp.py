@@ -2,28 +2,76 @@ from __future__ import print_function
 import cv2
 import time
 from datetime import datetime
+import io
 import os
 import subprocess
 import glob
 from multiprocessing.pool import ThreadPool
 from collections import deque
 from queue import Queue
-from threading import Thread
+from threading import Thread, Lock, local
 import piexif
 from fractions import Fraction
 import numpy as np
 from gps_serial import GPSReader
+from process_supervisor import heartbeat
+from capture_monitor import CaptureMonitor, write_capture_status
+from roi_profile import load_roi_profile, roi_pixels
+from capture_control import CaptureControl
+from compact_sessions import clear_recording, mark_recording
+from triggered_recording import ManeuverTrigger, TriggeredRecorder
+from static_scene import RepeatLog, StaticSceneDetector, ground_check
+from staged_store import StagedFrameStore
+from storage_governor import DEGRADE, StorageGovernor
+from jpeg_encoder import OpenCVEncoder, encoder_from_env, with_quality
+from startup_timeline import StartupTimeline
+from sharpness import SharpnessLog, sharpness
+from frame_trace import FrameTracer
+from frame_bus import FrameBus
+from frame_log import FLAG_DROPPED, FLAG_NO_GPS, FLAG_REPEAT, FLAG_SKIPPED, FrameLog, gps_values
+from overlay import OverlayLog, TelemetryBuffer, TelemetryOverlay, stamp_lines, stamp_renderer
 
 class VideoProcessor:
-    def __init__(self, width=1280, height=720, fps=30):
+    def __init__(self, width=1280, height=720, fps=30, telemetry=None, overlay_mode="burn", monitor=None,
+                 proxy_width=None, proxy_quality=90, rois=None, encode=False, encoder=None):
         self.width = width
         self.height = height
         self.fps = fps
         self.frame_count = 0
         self.start_time = time.time()
+        # Optional TelemetryOverlay drawing MAVLink attitude/altitude
+        self.telemetry = telemetry
+        # "burn" draws the overlay into the frame, "deferred" leaves the
+        # pixels clean and only returns the fields (see export_overlay.py)
+        self.overlay_mode = overlay_mode
+        # Optional CaptureMonitor; the overlay then shows the rate the camera
+        # really delivers instead of frames processed / elapsed time
+        self.monitor = monitor
+        # Width of the downscaled analysis proxy saved next to each frame
+        # (None to save only the full frame)
+        self.proxy_width = proxy_width
+        self.proxy_params = [cv2.IMWRITE_JPEG_QUALITY, proxy_quality]
+        # Named regions (roi_profile.ROI) saved at full resolution every frame
+        self.rois = [(roi, [cv2.IMWRITE_JPEG_QUALITY, roi.quality]) for roi in (rois or [])]
+        # Return the frame JPEG-encoded (for the triggered recording ring buffer)
+        self.encode = encode
+        self.encoder = encoder or OpenCVEncoder()
+        self._local = local()
 
-    def process_frame(self, frame, t0):
-        """Process a single frame with GPS and timestamp overlay"""
+    def process_frame(self, frame, t0, capture_time=None, save_full=True, keep=True, encoder=None):
+        """Process a single frame with GPS and timestamp overlay
+
+        capture_time is the time.monotonic() at which the frame was read; it
+        selects the MAVLink sample the telemetry overlay shows. The overlay
+        fields are returned as well, so in deferred mode they can be logged
+        instead of drawn, together with the numeric record for the frame log,
+        any extra outputs (name -> (image, imwrite params)) to save under
+        the same frame index and the frame's sharpness score. With save_full False only the extras are kept
+        and None is returned in place of the frame; with keep False (a
+        repeat of a static scene) nothing is drawn or saved at all. encoder
+        overrides self.encoder for this frame (cam1 degraded by the storage
+        governor).
+        """
         # Access the global GPS reader instance
         global gps_reader
         
@@ -56,45 +104,51 @@ class VideoProcessor:
         self.frame_count += 1
         elapsed_time = int(time.time() - self.start_time)
         
-        # Get frame dimensions for positioning text on right side
-        height, width = frame.shape[:2]
-        
-        # Larger font size
-        font_size = 0.8
-        font_thickness = 2
-        line_height = 35  # Increased vertical spacing between lines
-        
-        # Position text on right side with right-aligned text
-        # Create text lines with positioning on right side
-        text_lines = [
-            (f"Frame {self.frame_count}", (0, 0, 255)),
-            (f"GPS Time: {gps_timestamp}", (0, 255, 0)),
-            (f"Sys Time: {sys_timestamp}", (0, 200, 200)),
-            (f"Lat: {latitude}", (255, 0, 0)),
-            (f"Lon: {longitude}", (255, 0, 0)),
-            (f"FPS: {self.frame_count / (time.time() - self.start_time):.2f}", (255, 255, 0))
-        ]
-        
-        # Draw text on right side
-        for i, (text, color) in enumerate(text_lines):
-            # Get text size to align right
-            (text_width, text_height), _ = cv2.getTextSize(
-                text, cv2.FONT_HERSHEY_SIMPLEX, font_size, font_thickness
-            )
-            
-            # Calculate position (20 pixels from right edge)
-            x_position = width - text_width - 20
-            y_position = 40 + (i * line_height)
-            
-            # Draw text with slight shadow for better visibility
-            cv2.putText(
-                frame, text, (x_position, y_position), 
-                cv2.FONT_HERSHEY_SIMPLEX, font_size, (0, 0, 0), font_thickness + 1
-            )
-            cv2.putText(
-                frame, text, (x_position, y_position), 
-                cv2.FONT_HERSHEY_SIMPLEX, font_size, color, font_thickness
-            )
+        # Everything the overlay shows for this frame
+        fields = {
+            "frame": self.frame_count,
+            "gps_time": gps_timestamp,
+            "sys_time": sys_timestamp,
+            "lat": latitude,
+            "lon": longitude,
+            "fps": round(self.monitor.fps if self.monitor and self.monitor.fps
+                         else self.frame_count / (time.time() - self.start_time), 3),
+        }
+        if self.telemetry:
+            fields["telemetry"] = self.telemetry.sample(
+                capture_time if capture_time is not None else time.monotonic())
+
+        extras = {}
+        if not keep:
+            frame = None
+            save_full = False
+        if keep and self.proxy_width:
+            # Downscale before the overlay is drawn so the trackers get clean
+            # pixels; INTER_AREA averages instead of aliasing
+            height, width = frame.shape[:2]
+            proxy_height = int(round(height * self.proxy_width / width / 2)) * 2
+            proxy = cv2.resize(frame, (self.proxy_width, proxy_height), interpolation=cv2.INTER_AREA)
+            extras["proxy"] = (proxy, self.proxy_params)
+        if keep and self.rois:
+            height, width = frame.shape[:2]
+            for roi, params in self.rois:
+                x0, y0, x1, y1 = roi_pixels(roi, width, height)
+                # Copy, the overlay is about to be drawn into the frame
+                extras[f"roi/{roi.name}"] = (frame[y0:y1, x0:x1].copy(), params)
+        # Scored before the overlay, whose text would count as sharp edges
+        score = sharpness(frame) if keep else None
+
+        if not save_full:
+            frame = None
+        elif self.overlay_mode == "burn":
+            # Composite from the cached glyph block instead of getTextSize/putText
+            # on the full frame; each pool thread keeps its own renderer
+            renderer = getattr(self._local, "renderer", None)
+            if renderer is None:
+                renderer = self._local.renderer = stamp_renderer()
+            renderer.draw(frame, stamp_lines(fields))
+            if self.telemetry:
+                self.telemetry.draw_sample(frame, fields["telemetry"])
 
         print(f"Frame {self.frame_count} processed in {time.time() - t0:.2f} seconds")
         print(f"GPS Time: {gps_timestamp}")
@@ -102,7 +156,19 @@ class VideoProcessor:
         print(f"Lat: {latitude} Lon: {longitude}")
         print(f"FPS: {self.frame_count / (time.time() - self.start_time):.2f}")
         
-        return frame, t0, (gps_time, latitude, longitude), system_time
+        if self.encode:
+            # Encoded here in the pool rather than in the writer, so the ring
+            # buffer holds a few hundred KB per frame instead of 6 MB; the
+            # proxy and ROI crops too, or they would be most of the ring
+            if frame is not None:
+                frame = np.frombuffer((encoder or self.encoder).encode(frame), np.uint8)
+            for name, (image, params) in extras.items():
+                extras[name] = (cv2.imencode('.jpg', image, params)[1].reshape(-1), params)
+
+        # Numeric times and position for frames.bin (see frame_log.py)
+        record = (capture_time if capture_time is not None else time.monotonic(), t0) + gps_values(gps_data, t0)
+
+        return frame, t0, (gps_time, latitude, longitude), system_time, fields, record, extras, score
 
     @staticmethod
     def parse_gngll(gngll_sentence):
@@ -208,8 +274,20 @@ class VideoProcessor:
             return None
 
 class AsyncFrameWriter:
-    def __init__(self, output_dir="Images", num_workers=2):
+    def __init__(self, output_dir="Images", num_workers=2, quality=None, store=None, encoder=None, tracer=None,
+                 camera=0):
         self.output_dir = output_dir
+        # FrameTracer to record the queue, encode, EXIF and write times in
+        self.tracer = tracer
+        self.camera = camera
+        # StagedFrameStore to hand encoded files to instead of writing them here
+        self.store = store
+        self.extra_dirs = set()
+        # JPEG encoder of the full frames (see jpeg_encoder.py; quality None for 95)
+        self.encoder = encoder or encoder_from_env(quality)
+        # Bytes written per output ("full", "proxy", "roi/pedal", ...)
+        self.bytes_written = {}
+        self.bytes_lock = Lock()
         # Limit queue size to prevent memory issues
         self.queue = Queue(maxsize=200)  
         self.workers = []
@@ -225,24 +303,79 @@ class AsyncFrameWriter:
             frame_data = self.queue.get()
             if frame_data is None:
                 break
-            frame, idx, gps_data, system_time = frame_data  # Updated to receive system_time
-            
-            # Save the image firstS
-            image_path = f'{self.output_dir}/opencv{str(idx)}.jpg'
-            cv2.imwrite(image_path, frame)
-            
-            # If GPS coordinates are available, add them as EXIF metadata
-            if gps_data and gps_data[1] and gps_data[2]:  # Check if we have valid lat/lon
-                try:
-                    self._add_gps_tags(image_path, gps_data[1], gps_data[2], idx, system_time)
-                except Exception as e:
-                    print(f"Error adding GPS tags: {e}")
-            
+            frame, idx, gps_data, system_time, extras, seq, encoder, queued = frame_data
+            tracer = self.tracer if seq is not None else None
+            t = time.monotonic()
+            if tracer:
+                tracer.span(seq, self.camera, "writer_queue", queued, t)
+
+            # Save the image firstS (frame is None when ROI recording skips it)
+            if frame is not None:
+                image_path = f'{self.output_dir}/opencv{str(idx)}.jpg'
+                # frame is already JPEG-encoded (ndim 1) when the processing pool did it
+                if frame.ndim == 1:
+                    data = frame.tobytes()
+                else:
+                    data = (encoder or self.encoder).encode(frame)
+                    if tracer:
+                        t, start = time.monotonic(), t
+                        tracer.span(seq, self.camera, "encode", start, t)
+                # If GPS coordinates are available, add them as EXIF metadata
+                # (in memory, so the file is written once)
+                if gps_data and gps_data[1] and gps_data[2]:  # Check if we have valid lat/lon
+                    data = self._add_gps_tags(data, gps_data[1], gps_data[2], idx, system_time)
+                    if tracer:
+                        t, start = time.monotonic(), t
+                        tracer.span(seq, self.camera, "exif", start, t)
+                if self.store is not None:
+                    # The store writes the file later, in a batch
+                    self.store.put(image_path, data)
+                else:
+                    with open(image_path, 'wb') as f:
+                        f.write(data)
+                if tracer:
+                    t, start = time.monotonic(), t
+                    tracer.span(seq, self.camera, "write", start, t)
+                self._count("full", size=len(data))
+
+            # Extra outputs (proxy, ...) go to subfolders under the same index
+            for name, (image, params) in (extras or {}).items():
+                folder = f'{self.output_dir}/{name}'
+                path = f'{folder}/opencv{str(idx)}.jpg'
+                # Already JPEG-encoded (ndim 1) when the processing pool did it
+                encoded = image.ndim == 1
+                if self.store is not None:
+                    data = image.tobytes() if encoded else cv2.imencode('.jpg', image, params)[1].tobytes()
+                    self.store.put(path, data)
+                    self._count(name, size=len(data))
+                    continue
+                if folder not in self.extra_dirs:
+                    os.makedirs(folder, exist_ok=True)
+                    self.extra_dirs.add(folder)
+                if encoded:
+                    with open(path, 'wb') as f:
+                        f.write(image.tobytes())
+                    self._count(name, size=image.nbytes)
+                else:
+                    cv2.imwrite(path, image, params)
+                    self._count(name, path)
+            if tracer and extras:
+                tracer.span(seq, self.camera, "extras", t, time.monotonic())
+
             print(f"Queue size {self.queue.qsize()}\n")
             self.queue.task_done()
 
+    def _count(self, name, path=None, size=None):
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+        with self.bytes_lock:
+            self.bytes_written[name] = self.bytes_written.get(name, 0) + size
+
     def _add_gps_tags(self, image_path, latitude_str, longitude_str, frame_idx=None, system_time=None):
-        """Add GPS EXIF metadata to an image"""
+        """Add GPS EXIF metadata to an image file, or to JPEG bytes (returns the tagged bytes)"""
         # Parse latitude and longitude strings into decimal values
         try:
             # Initialize variables with default values
@@ -312,13 +445,19 @@ class AsyncFrameWriter:
             
             # Insert the Exif tags
             exif_bytes = piexif.dump(exif_dict)
+            if isinstance(image_path, bytes):
+                tagged = io.BytesIO()
+                piexif.insert(exif_bytes, image_path, tagged)
+                return tagged.getvalue()
             piexif.insert(exif_bytes, image_path)
             print(f"Added GPS tags and frame number to image: {image_path}")
         except Exception as e:
             print(f"Error parsing GPS coordinates: {e}")
+        return image_path
 
-    def write_frame(self, frame, idx, gps_data=None, system_time=None):
-        self.queue.put((frame, idx, gps_data, system_time))
+    def write_frame(self, frame, idx, gps_data=None, system_time=None, extras=None, seq=None, encoder=None):
+        """Queue a frame; seq is its FrameTracer sequence id, if traced, and encoder overrides self.encoder"""
+        self.queue.put((frame, idx, gps_data, system_time, extras, seq, encoder, time.monotonic()))
     
     def stop(self):
         # Send stop signal to all workers
@@ -327,199 +466,706 @@ class AsyncFrameWriter:
         # Wait for all workers to finish
         for worker in self.workers:
             worker.join()
+        if self.bytes_written:
+            total = sum(self.bytes_written.values())
+            print(f"{self.output_dir}: {total / 1e6:.1f} MB written (" +
+                  ", ".join(f"{name} {size / 1e6:.1f} MB" for name, size in sorted(self.bytes_written.items())) + ")")
+
+class RecordingSession:
+    """
+    Everything that belongs to one recording: the cam0/cam1 folders, their
+    writers and sidecar logs, and the frame counters.
+
+    stamp_video opens and closes sessions while the cameras keep streaming
+    (the start/stop/rotate control commands), so switching only costs
+    creating folders and files. close() returns at once; the writers drain
+    their queues in the background.
+    """
+    def __init__(self, root="Images", encoders=(None, None), store=None, suppress_static=False, on_ground=None,
+                 overlay_mode="burn", triggered=False, tracer=None):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Two rotations within a second get a suffix
+        name, n = timestamp, 1
+        while os.path.exists(f"{root}/cam0_{name}") or os.path.exists(f"{root}/cam1_{name}"):
+            name, n = f"{timestamp}_{n}", n + 1
+        self.name = name
+        self.dirs = (f"{root}/cam0_{name}", f"{root}/cam1_{name}")
+        for folder in self.dirs:
+            os.makedirs(folder, exist_ok=True)
+        self.started = time.time()
+        self.frame_idx = 0
+        # Frames come out in read order, so read_idx is the frame_idx they
+        # will be saved under
+        self.read_idx = 0
+
+        self.writers = tuple(AsyncFrameWriter(output_dir=folder, store=store, encoder=encoder, tracer=tracer,
+                                              camera=cam)
+                             for cam, (folder, encoder) in enumerate(zip(self.dirs, encoders)))
+        self.frame_logs = tuple(FrameLog(folder, camera=cam) for cam, folder in enumerate(self.dirs))
+        self.detectors = self.repeat_logs = None
+        if suppress_static:
+            self.detectors = (StaticSceneDetector(on_ground=on_ground), StaticSceneDetector(on_ground=on_ground))
+            self.repeat_logs = tuple(RepeatLog(folder) for folder in self.dirs)
+        self.sharpness_logs = tuple(SharpnessLog(folder) for folder in self.dirs)
+        self.overlay_logs = None
+        if overlay_mode == "deferred":
+            self.overlay_logs = tuple(OverlayLog(folder) for folder in self.dirs)
+        self.recorder = None
+        if triggered:
+            self.recorder = TriggeredRecorder(self.save_frames, self.log_frames)
+            print(f"Triggered recording: {self.recorder.pre_seconds:g}s before and {self.recorder.post_seconds:g}s "
+                  f"after each maneuver, 1 in {self.recorder.idle_every} frames otherwise")
+
+    def save_frames(self, payload):
+        idx, outputs, seq = payload
+        for cam, frame, gps_data, system_time, extras, *_, repeat, _, encoder in outputs:
+            if not repeat:
+                self.writers[cam].write_frame(frame, idx, gps_data, system_time, extras, seq, encoder)
+
+    def log_frames(self, payload, saved):
+        idx, outputs, _ = payload
+        for cam, _, _, _, _, record, kernel_ts, dropped, fields, score, repeat, full, _ in outputs:
+            flags = FLAG_NO_GPS if record[3] != record[3] else 0
+            if dropped:
+                flags |= FLAG_DROPPED
+            if repeat:
+                flags |= FLAG_REPEAT
+            elif not (saved and full):
+                # Triggered recording left it out, or only its ROI/proxy
+                # extras were written (full_every, cam1 degraded)
+                flags |= FLAG_SKIPPED
+            self.frame_logs[cam].write(idx, flags, *record, kernel_ts, dropped)
+            if self.repeat_logs:
+                if repeat:
+                    self.repeat_logs[cam].repeated(idx)
+                elif saved:
+                    self.repeat_logs[cam].kept(idx)
+            if saved and full and not repeat:
+                self.sharpness_logs[cam].write(idx, score)
+                if self.overlay_logs:
+                    self.overlay_logs[cam].write(idx, fields)
+
+    def push(self, outputs, seq=None):
+        """Save and log one processed frame pair under the next index"""
+        payload = (self.frame_idx, outputs, seq)
+        if self.recorder:
+            self.recorder.push(payload)
+        else:
+            self.save_frames(payload)
+            self.log_frames(payload, True)
+        self.frame_idx += 1
+
+    def status(self):
+        return {"session": self.name, "dirs": list(self.dirs), "frames": self.frame_idx,
+                "seconds": round(time.time() - self.started, 1)}
+
+    def close(self, on_done=None):
+        """
+        Close the logs now and stop the writers on a background thread;
+        returns the thread. on_done is called once the last frame is written.
+        """
+        if self.recorder:
+            # Log what is left in the ring; those frames are not saved
+            self.recorder.flush(write=False)
+            print(f"Triggered recording: {self.recorder.stats()}")
+        for frame_log in self.frame_logs:
+            frame_log.close()
+        for sharpness_log in self.sharpness_logs:
+            sharpness_log.close()
+        if self.repeat_logs:
+            for repeat_log in self.repeat_logs:
+                repeat_log.close()
+            print(f"Static scene suppression skipped {self.detectors[0].repeats} + {self.detectors[1].repeats} "
+                  f"repeated frames")
+        if self.overlay_logs:
+            for log in self.overlay_logs:
+                log.close()
+
+        def drain():
+            for writer in self.writers:
+                writer.stop()
+            if on_done:
+                on_done(self)
+        closer = Thread(target=drain, daemon=True)
+        closer.start()
+        return closer
 
 class AutoExposureController:
-    def __init__(self, target_brightness=125, step_size=1, min_exposure=-10, max_exposure=10,
-                 update_interval=10, stability_threshold=5):
+    def __init__(self, target_brightness=125, exposure=3, min_exposure=1, max_exposure=400, kp=0.2, ki=1.0,
+                 stability_threshold=5, stride=8, set_interval=0.5, settle_time=0.3, enabled=True):
         """
-        Controller for auto-exposure based on a specific region of the frame
-        
+        PI controller for one camera's exposure, from the brightness of the
+        bottom half of the frame (the ground, not the sky).
+
+        update() runs on a frame bus thread: it samples every `stride`-th
+        pixel of the region, which takes well under a millisecond at 1080p,
+        and works out the exposure the camera should have. apply() runs on
+        the capture thread (V4L2 controls are not set while another thread
+        reads the device) and calls camera.set() at most every
+        `set_interval` seconds.
+
         Args:
             target_brightness: Target average brightness (0-255)
-            step_size: How much to adjust exposure per step
-            min_exposure: Minimum exposure value
-            max_exposure: Maximum exposure value
-            update_interval: Only update exposure every N frames
-            stability_threshold: Don't adjust if within this range of target
+            exposure: The camera's exposure when the controller starts
+            min_exposure, max_exposure: Range in CAP_PROP_EXPOSURE units
+                (100 us on UVC cameras, so 400 is a whole 20 fps frame)
+            kp, ki: Gains on log2(target / brightness), i.e. in stops. The
+                camera answers a change within a frame, so the integral
+                term does the work; a large kp makes it ring
+            stability_threshold: Corrections start when brightness is off
+                by twice this and stop once within it
+            stride: Sample every stride-th row and column
+            set_interval: Minimum seconds between camera.set() calls
+            settle_time: Ignore frames captured this soon after a change
+            enabled: False only measures brightness
         """
         self.target_brightness = target_brightness
-        self.step_size = step_size
         self.min_exposure = min_exposure
         self.max_exposure = max_exposure
-        self.current_exposure = 0  # Will be read from camera
-        self.frame_count = 0
-        self.update_interval = update_interval
+        self.kp = kp
+        self.ki = ki
         self.stability_threshold = stability_threshold
-        
+        self.stride = stride
+        self.set_interval = set_interval
+        self.settle_time = settle_time
+        self.enabled = enabled
+        self.current_exposure = min(max(exposure, min_exposure), max_exposure)
+        self.log_exposure = float(np.log2(self.current_exposure))
+        self.brightness = None
+        self.correcting = False
+        self.last_error = 0.0
+        self.last_update = None
+        self.last_set = float("-inf")
+        self.pending = None
+        self.sets = 0
+
     def calculate_brightness(self, frame, region="bottom_half"):
-        """Calculate the average brightness of a region in the frame"""
+        """Average brightness (0-255) of a region, from a strided sample of its pixels"""
         if frame is None:
             return None
-            
+
         if region == "bottom_half":
-            height, width = frame.shape[:2]
-            roi = frame[height//2:, :]  # Bottom half of the frame
+            height = frame.shape[0]
+            roi = frame[height//2::self.stride, ::self.stride]
         else:
-            roi = frame  # Use full frame
-            
-        # Convert to grayscale if needed
+            roi = frame[::self.stride, ::self.stride]
+        if not roi.size:
+            return None
+
+        # Luma is linear in B, G and R, so weight the channel means rather
+        # than converting every pixel (cv2.mean is ~3x faster than NumPy's
+        # on a strided view)
+        means = cv2.mean(roi)
         if len(roi.shape) == 3:
-            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = roi
-            
-        # Calculate average brightness
-        avg_brightness = np.mean(gray)
-        return avg_brightness
-        
-    def update_exposure(self, frame, camera):
-        """Update camera exposure based on bottom half brightness"""
-        self.frame_count += 1
-        
-        # Only update every update_interval frames
-        if self.frame_count % self.update_interval != 0:
-            return
-            
-        # Read current camera exposure
-        self.current_exposure = camera.get(cv2.CAP_PROP_EXPOSURE)
-        
-        # Calculate brightness of bottom half
-        brightness = self.calculate_brightness(frame, "bottom_half")
+            return 0.114 * means[0] + 0.587 * means[1] + 0.299 * means[2]
+        return means[0]
+
+    def update(self, frame, capture_time, region="bottom_half"):
+        """Measure a frame and set the exposure apply() should give the camera; returns the status"""
+        brightness = self.calculate_brightness(frame, region)
         if brightness is None:
+            return self.status()
+        self.brightness = brightness
+        if not self.enabled or capture_time < self.last_set + self.settle_time:
+            # Frames from before the last change still show the old exposure
+            return self.status()
+
+        # Hysteresis: start correcting at twice the threshold, stop inside it.
+        # At short exposures one step changes brightness by more than that,
+        # so half a step counts as close enough
+        off_by = abs(self.target_brightness - brightness)
+        tolerance = max(self.stability_threshold, brightness / max(self.current_exposure, 1) / 2)
+        if self.correcting and off_by < tolerance:
+            self.correcting = False
+        elif not self.correcting and off_by > 2 * tolerance:
+            self.correcting = True
+        if not self.correcting:
+            self.last_error = 0.0
+            self.last_update = capture_time
+            return self.status()
+
+        # Velocity-form PI in stops: brightness is about linear in exposure,
+        # and clamping the output is all the anti-windup it needs
+        error = np.log2(self.target_brightness / max(brightness, 1.0))
+        dt = min(capture_time - self.last_update, 1.0) if self.last_update is not None else 0.0
+        self.log_exposure += self.kp * (error - self.last_error) + self.ki * error * dt
+        self.log_exposure = float(np.clip(self.log_exposure, np.log2(self.min_exposure), np.log2(self.max_exposure)))
+        self.last_error = error
+        self.last_update = capture_time
+        # Exposures are integers: only move once clearly past the halfway
+        # point, so a target between two steps does not flip between them
+        exposure = int(round(2 ** self.log_exposure))
+        if abs(2 ** self.log_exposure - self.current_exposure) >= 0.75:
+            self.pending = exposure
+        return self.status()
+
+    def apply(self, camera):
+        """Set the pending exposure on the camera, if any and not too soon after the last one"""
+        if self.pending is None:
             return
-            
-        # Determine if adjustment is needed
-        brightness_diff = self.target_brightness - brightness
-        
-        # Only adjust if difference exceeds the stability threshold
-        if abs(brightness_diff) < self.stability_threshold:
+        now = time.monotonic()
+        if now - self.last_set < self.set_interval:
             return
-            
-        # Calculate new exposure value
-        adjustment = np.sign(brightness_diff) * self.step_size
-        new_exposure = self.current_exposure + adjustment
-        
-        # Clamp to valid range
-        new_exposure = max(self.min_exposure, min(new_exposure, self.max_exposure))
-        
-        # Apply new exposure if different
-        if new_exposure != self.current_exposure:
-            print(f"Adjusting exposure: {self.current_exposure} -> {new_exposure} (brightness: {brightness:.1f})")
-            camera.set(cv2.CAP_PROP_EXPOSURE, new_exposure)
-            self.current_exposure = new_exposure
+        exposure, self.pending = self.pending, None
+        camera.set(cv2.CAP_PROP_EXPOSURE, exposure)
+        self.current_exposure = exposure
+        self.last_set = now
+        self.sets += 1
+
+    def status(self):
+        return {
+            "brightness": round(float(self.brightness), 1) if self.brightness is not None else None,
+            "exposure": self.current_exposure,
+            "correcting": self.correcting,
+            "sets": self.sets,
+        }
+
+
+def open_camera(device, width, height, fps, exposure=None, name=None, timeout=5.0, timeline=None):
+    """
+    Open and configure a V4L2 camera, then wait for its first valid frame.
+
+    Returns the capture, or None if it cannot be opened or delivers nothing
+    but empty or black frames for `timeout` seconds.
+    """
+    name = name or f"camera{device}"
+    camera = cv2.VideoCapture(device, apiPreference=cv2.CAP_V4L2)
+    if not camera.isOpened():
+        print(f"Error: Could not open {name}.")
+        return None
+    if timeline:
+        timeline.mark(f"{name}_opened")
+
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    camera.set(cv2.CAP_PROP_FPS, fps)
+    camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+    if exposure is not None:
+        # Fixed exposure instead of the camera's auto exposure
+        camera.set(cv2.CAP_PROP_EXPOSURE, exposure)
+        print(f"Fixed {name} exposure: {camera.get(cv2.CAP_PROP_EXPOSURE)}")
+    if timeline:
+        timeline.mark(f"{name}_configured")
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ret, frame = camera.read()
+        # The first buffers after stream-on can be empty or black
+        if ret and frame is not None and frame.size and frame.any():
+            if timeline:
+                timeline.mark(f"{name}_first_frame")
+            return camera
+    print(f"Error: no valid frame from {name} within {timeout:g}s.")
+    camera.release()
+    return None
+
+
+def stamp_video(display=False, overlay_mode=None, proxy_width=None, roi_profile=None, triggered=None,
+                suppress_static=None, staging=None, record_on_start=None, auto_exposure=None):
+    """
+    Record both cameras.
+
+    overlay_mode "burn" (the default, or the OVERLAY_MODE environment
+    variable) draws the stamp and telemetry text into every frame. "deferred"
+    saves clean frames plus an overlay.jsonl per folder, and the text is
+    burned in afterwards with export_overlay.py.
+
+    proxy_width (or PROXY_WIDTH, e.g. 640) also saves a downscaled copy of
+    every frame without overlay in a proxy/ subfolder for the trackers.
+
+    roi_profile (or ROI_PROFILE, e.g. rois.json) switches to ROI recording:
+    the named control regions are saved at full resolution every frame under
+    roi/<name>/, and the full frame only every few frames at lower quality.
+
+    triggered (or TRIGGERED_RECORDING=1) keeps the last seconds of encoded
+    frames in RAM and saves at full rate only around maneuvers (roll/pitch
+    rate, g-load, or POST /trigger), at a low rate otherwise.
 
+    suppress_static (or STATIC_SUPPRESSION=1) skips frames that are near
+    duplicates of the last saved one while the aircraft is on the ground,
+    recording the repeat counts in repeats.csv.
 
+    staging (or STAGED_WRITES=1) keeps encoded frames in RAM and writes
+    them to the card in large batches from one thread. STAGED_WRITES=none
+    or =frame picks the fsync policy instead of the default sync per batch.
+
+    Recording starts right away unless record_on_start (or RECORD_ON_START)
+    is 0. Sessions are started, stopped and rotated with the start/stop/
+    rotate commands on the control socket (POST /session/... on the image
+    server) without touching the cameras, and rotated automatically every
+    SESSION_MAX_FRAMES (100000) frames.
+
+    auto_exposure (or AUTO_EXPOSURE=1) adjusts each camera's exposure to
+    keep the bottom half of the frame at AE_TARGET (125) brightness,
+    instead of the fixed exposure.
+
+    Every frame's stage timings are traced (see frame_trace.py) and dumped
+    to FRAME_TRACE_DIR (Traces) on the trace command and at shutdown.
+    """
+    overlay_mode = overlay_mode or os.getenv("OVERLAY_MODE", "burn")
+    proxy_width = proxy_width if proxy_width is not None else int(os.getenv("PROXY_WIDTH", "0"))
+    roi_profile = roi_profile or os.getenv("ROI_PROFILE")
+    if triggered is None:
+        triggered = os.getenv("TRIGGERED_RECORDING", "0") not in ("", "0")
+    if suppress_static is None:
+        suppress_static = os.getenv("STATIC_SUPPRESSION", "0") not in ("", "0")
+    if auto_exposure is None:
+        auto_exposure = os.getenv("AUTO_EXPOSURE", "0") not in ("", "0")
+    if staging is None:
+        staging = os.getenv("STAGED_WRITES", "0")
+    if staging in ("", "0", False):
+        staging = None
+    elif staging in ("1", True):
+        staging = "chunk"
+    roi_config = load_roi_profile(roi_profile) if roi_profile else None
+    if roi_config:
+        print(f"ROI recording: {', '.join(roi.name for roi in roi_config['rois'])}, full frame every "
+              f"{roi_config['full_every']} frames at quality {roi_config['full_quality']}")
+
+    def rois_for(camera):
+        if not roi_config:
+            return None
+        return [roi for roi in roi_config["rois"] if roi.cameras is None or camera in roi.cameras]
+    if overlay_mode not in ("burn", "deferred"):
+        raise ValueError(f"Unknown overlay mode {overlay_mode!r}")
+    print(f"Overlay mode: {overlay_mode}")
+
+    timeline = StartupTimeline("stamp_video")
+    timeline.mark("stamp_video")
+    W, H = 1920, 1080
+
+    # Open, configure and probe both cameras in parallel; each thread returns
+    # once its camera has delivered a valid frame
+    cameras = [None, None]
+
+    def start_camera(cam, device):
+        cameras[cam] = open_camera(device, W, H, 20, exposure=3, name=f"cam{cam}", timeline=timeline)
+    camera_threads = [Thread(target=start_camera, args=(0, 0)), Thread(target=start_camera, args=(1, 2))]
+    for thread in camera_threads:
+        thread.start()
 
-def stamp_video(display=False):
     # Initialize GPS reader (global so it can be accessed from process_frame)
     global gps_reader
     gps_reader = GPSReader()
-    
-    # Initialize video captures
-    camera0 = cv2.VideoCapture(0, apiPreference=cv2.CAP_V4L2)
-    camera1 = cv2.VideoCapture(2, apiPreference=cv2.CAP_V4L2)
-    
-    if not camera0.isOpened():
-        print("Error: Could not open camera0.")
-    if not camera1.isOpened():
-        print("Error: Could not open camera1 .")
-    
-    if not camera0.isOpened() or not camera1.isOpened():
+    gps_started = time.monotonic()
+    timeline.mark("gps_opened")
+
+    # Attitude/altitude from the MAVLink router, indexed by capture time
+    telemetry_buffer = TelemetryBuffer()
+
+    # Dropped frames and real capture rate from the V4L2 buffer timestamps
+    monitor0 = CaptureMonitor("cam0", nominal_fps=20)
+    monitor1 = CaptureMonitor("cam1", nominal_fps=20)
+    # One encoder per camera (JPEG_BACKEND, JPEG_QUALITY, ...), shared by the
+    # processing pool and the writer. A degraded cam1 gets a copy at lower
+    # quality that travels with each frame, so frames already in flight keep
+    # the quality they were captured at.
+    full_quality = roi_config["full_quality"] if roi_config else None
+    encoder0 = encoder_from_env(full_quality)
+    encoder1 = encoder_from_env(full_quality)
+    print(f"JPEG encoder: {encoder0!r}")
+    processor0 = VideoProcessor(W, H, 20, telemetry=TelemetryOverlay(telemetry_buffer),
+                                overlay_mode=overlay_mode, monitor=monitor0, proxy_width=proxy_width or None,
+                                rois=rois_for(0), encode=triggered, encoder=encoder0)
+    processor1 = VideoProcessor(W, H, 20, telemetry=TelemetryOverlay(telemetry_buffer),
+                                overlay_mode=overlay_mode, monitor=monitor1, proxy_width=proxy_width or None,
+                                rois=rois_for(1), encode=triggered, encoder=encoder1)
+
+    for thread in camera_threads:
+        thread.join()
+    camera0, camera1 = cameras
+    if camera0 is None or camera1 is None:
         print("Exiting...")
+        for camera in cameras:
+            if camera is not None:
+                camera.release()
+        telemetry_buffer.close()
+        gps_reader.close()
         return
+    timeline.mark("cameras_ready")
 
-    # Set up video parameters
-    W, H = 1920, 1080
-    processor0 = VideoProcessor(W, H, 20)
-    processor1 = VideoProcessor(W, H, 20)
-
-    # Configure both cameras
-    camera0.set(cv2.CAP_PROP_FRAME_WIDTH, W)
-    camera0.set(cv2.CAP_PROP_FRAME_HEIGHT, H)
-    camera0.set(cv2.CAP_PROP_FPS, 20)
-    camera0.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
-    
-    # Disable auto exposure - set a fixed exposure value for camera0
-    camera0.set(cv2.CAP_PROP_EXPOSURE, 3)  # Using same value as camera1
-    
-    # Read exposure value to confirm
-    fixed_exposure = camera0.get(cv2.CAP_PROP_EXPOSURE)
-    print(f"Fixed camera0 exposure: {fixed_exposure}")
-
-    # Configure camera1
-    camera1.set(cv2.CAP_PROP_FRAME_WIDTH, W)
-    camera1.set(cv2.CAP_PROP_FRAME_HEIGHT, H)
-    camera1.set(cv2.CAP_PROP_FPS, 20)
-    camera1.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
-    camera1.set(cv2.CAP_PROP_EXPOSURE, 3) 
+    # Wait for a GPS fix, but not longer than GPS_READY_TIMEOUT from when
+    # the reader started (the cameras were starting meanwhile)
+    gps_timeout = float(os.getenv("GPS_READY_TIMEOUT", "10"))
+    if gps_reader.wait_for_fix(max(0.0, gps_started + gps_timeout - time.monotonic())):
+        timeline.mark("gps_fix")
+    else:
+        timeline.mark("gps_timeout")
+        print(f"No GPS fix within {gps_timeout:g}s, recording without one")
 
     # Initialize threading
     threadn = cv2.getNumberOfCPUs()
     pool = ThreadPool(processes=threadn)
     pending0 = deque()
     pending1 = deque()
-    
-    # Create output directories with date and timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir0 = f"Images/cam0_{timestamp}"
-    output_dir1 = f"Images/cam1_{timestamp}"
-    os.makedirs(output_dir0, exist_ok=True)
-    os.makedirs(output_dir1, exist_ok=True)
-
-    # Initialize async frame writers
-    frame_writer0 = AsyncFrameWriter(output_dir=output_dir0)
-    frame_writer1 = AsyncFrameWriter(output_dir=output_dir1)
-
-    time.sleep(10)
-    frame_idx = 0
+
+    # One store for both cameras, so the card sees a single sequential writer
+    store = StagedFrameStore(fsync=staging) if staging else None
+    if store:
+        print(f"Staged writes: {store.chunk_bytes >> 20} MB batches, fsync {store.fsync}")
+    on_ground = ground_check(telemetry_buffer) if suppress_static else None
+    # Per-frame stage timings and queue depths, dumped to FRAME_TRACE_DIR on
+    # the "trace" command and at shutdown
+    tracer = FrameTracer()
+    trace_dir = os.getenv("FRAME_TRACE_DIR", "Traces")
+    trace_name = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Analyzers get decimated, read-only views of the raw frames on their
+    # own threads. The bottom half is metered at 2 Hz; with auto exposure
+    # on, the capture thread applies the exposure each controller asks for
+    bus = FrameBus()
+    exposure = [AutoExposureController(exposure=camera.get(cv2.CAP_PROP_EXPOSURE),
+                                       target_brightness=int(os.getenv("AE_TARGET", "125")),
+                                       enabled=auto_exposure)
+                for camera in (camera0, camera1)]
+    bus.subscribe("exposure", lambda cam, view, t: exposure[cam].update(view, t, region="full"),
+                  rate_hz=2, roi=(0, 0.5, 1, 0.5))
+    if auto_exposure:
+        print(f"Auto exposure: brightness {exposure[0].target_brightness}, starting at "
+              f"{exposure[0].current_exposure:g}/{exposure[1].current_exposure:g}")
+
+    # Sessions are opened and closed from the control socket while the
+    # cameras keep streaming. Folders still being written (the current
+    # session and any that are draining) are listed in Images/.recording,
+    # so background compaction leaves them alone.
+    session = None
+    draining = []
+    closers = []
+    marker_lock = Lock()
+
+    def update_marker():
+        with marker_lock:
+            dirs = [d for s in ([session] if session else []) + draining for d in s.dirs]
+            if dirs:
+                mark_recording(dirs)
+            else:
+                clear_recording()
+
+    def drained(old):
+        with marker_lock:
+            draining.remove(old)
+        update_marker()
+
+    def open_session():
+        new = RecordingSession(encoders=(encoder0, encoder1), store=store, suppress_static=suppress_static,
+                               on_ground=on_ground, overlay_mode=overlay_mode, triggered=triggered, tracer=tracer)
+        print(f"Recording to {new.dirs[0]} and {new.dirs[1]}")
+        return new
+
+    def close_session(old):
+        with marker_lock:
+            draining.append(old)
+        closers.append(old.close(on_done=drained))
+        print(f"Closed session {old.name} after {old.frame_idx} frames")
+
+    maneuver = ManeuverTrigger(telemetry_buffer) if triggered else None
+    control = CaptureControl()
+
+    def collect(wait=False):
+        """Hand finished frame pairs to the session; with wait, every pending pair"""
+        nonlocal display
+        while pending0 and pending1 and (wait or (pending0[0][0].ready() and pending1[0][0].ready())):
+            task0, (kernel_ts0, dropped0), repeat0, full0, enc0, owner, seq = pending0.popleft()
+            task1, (kernel_ts1, dropped1), repeat1, full1, enc1, _, _ = pending1.popleft()
+            result0, done0 = task0.get()
+            result1, done1 = task1.get()
+            processed_frame0, _, gps_data0, system_time0, fields0, record0, extras0, score0 = result0
+            processed_frame1, _, gps_data1, system_time1, fields1, record1, extras1, score1 = result1
+            # Time from process_frame returning to the pair being handed on in order
+            collected = time.monotonic()
+            tracer.span(seq, 0, "collect", done0, collected)
+            tracer.span(seq, 1, "collect", done1, collected)
+
+            try:
+                if display and processed_frame0 is not None and processed_frame0.ndim == 3:
+                    cv2.imshow('camera0', processed_frame0)
+                    cv2.imshow('camera1', processed_frame1)
+            except cv2.error as e:
+                display = False
+                print(f"Error displaying frames: {e}")
+
+            owner.push((
+                (0, processed_frame0, gps_data0, system_time0, extras0, record0, kernel_ts0, dropped0, fields0,
+                 score0, repeat0, full0, enc0),
+                (1, processed_frame1, gps_data1, system_time1, extras1, record1, kernel_ts1, dropped1, fields1,
+                 score1, repeat1, full1, enc1),
+            ), seq)
+            timeline.finish("first_frame_queued")
+            heartbeat()
+
+    def switch(start):
+        """Close the current session (if any) and open a new one if start; returns the reply"""
+        nonlocal session
+        t0 = time.perf_counter()
+        previous = session
+        if previous:
+            # The few frames still in the pool belong to the old session
+            collect(wait=True)
+            session = None
+            close_session(previous)
+        if start:
+            session = open_session()
+        update_marker()
+        reply = {"ok": True, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+        if previous:
+            reply["previous"] = previous.status()
+        if session:
+            reply.update(session.status())
+        return reply
+
+    record_on_start = record_on_start if record_on_start is not None else \
+        os.getenv("RECORD_ON_START", "1") not in ("", "0")
+    # A session is rotated rather than recording stopping at this many frames
+    max_frames = int(os.getenv("SESSION_MAX_FRAMES", "100000"))
+    if record_on_start:
+        switch(True)
+        timeline.mark("recording")
+    else:
+        timeline.finish("ready")
+    last_status = time.monotonic()
+    last_depth = 0.0
+    full_every = roi_config["full_every"] if roi_config else 1
+    # cam1 is thinned out and compressed harder when the card is running out
+    governor = StorageGovernor()
+    secondary = DEGRADE["ok"]
+    secondary_encoder = encoder1
+    last_storage = 0.0
     try:
         while True:
             # Process frames in parallel for both cameras
             if len(pending0) < threadn:
+                read0 = time.monotonic()
                 ret0, frame0 = camera0.read()
+                capture0 = time.monotonic()
                 ret1, frame1 = camera1.read()
+                capture1 = time.monotonic()
                 if not ret0 or not ret1:
                     break
-                
-                # Auto-exposure updates removed
-                
-                task0 = pool.apply_async(processor0.process_frame, (frame0.copy(), time.time()))
-                task1 = pool.apply_async(processor1.process_frame, (frame1.copy(), time.time()))
-                pending0.append(task0)
-                pending1.append(task1)
+                seq = tracer.new_frame()
+                tracer.span(seq, 0, "read", read0, capture0)
+                tracer.span(seq, 1, "read", capture0, capture1)
+                buffer0 = monitor0.observe(camera0, capture0)
+                buffer1 = monitor1.observe(camera1, capture1)
+                bus.publish(0, frame0, capture0)
+                bus.publish(1, frame1, capture1)
+                exposure[0].apply(camera0)
+                exposure[1].apply(camera1)
+                if session is None:
+                    # Not recording: keep reading so the cameras stay warm and
+                    # their buffers fresh, but process nothing
+                    heartbeat()
+                else:
+                    # Static scene check on the capture thread: it compares with
+                    # the last kept frame, so it has to see frames in order
+                    detectors = session.detectors
+                    repeat0 = detectors[0].is_repeat(frame0) if detectors else False
+                    repeat1 = detectors[1].is_repeat(frame1) if detectors else False
+
+                    save_full = session.read_idx % full_every == 0
+                    save_full1 = save_full and session.read_idx % secondary["every"] == 0
+                    session.read_idx += 1
+                    queued = time.monotonic()
+                    task0 = pool.apply_async(tracer.call, (seq, 0, "pool_queue", "process", queued,
+                                                           processor0.process_frame, frame0.copy(), time.time(),
+                                                           capture0, save_full, not repeat0))
+                    task1 = pool.apply_async(tracer.call, (seq, 1, "pool_queue", "process", queued,
+                                                           processor1.process_frame, frame1.copy(), time.time(),
+                                                           capture1, save_full1, not repeat1, secondary_encoder))
+                    pending0.append((task0, buffer0, repeat0, save_full, None, session, seq))
+                    pending1.append((task1, buffer1, repeat1, save_full1, secondary_encoder, session, seq))
 
             # Get processed frames from both cameras
-            while pending0 and pending0[0].ready() and pending1 and pending1[0].ready():
-                processed_frame0, _, gps_data0, system_time0 = pending0.popleft().get()
-                processed_frame1, _, gps_data1, system_time1 = pending1.popleft().get()
-                
-                try:
-                    if display:
-                        cv2.imshow('camera0', processed_frame0)
-                        cv2.imshow('camera1', processed_frame1)
-                except cv2.error as e:
-                    display = False
-                    print(f"Error displaying frames: {e}")
+            collect()
+            now = time.monotonic()
+            if now - last_depth >= 0.05:
+                # The loop spins while the pool is full; 20 samples a second is plenty
+                last_depth = now
+                tracer.depth("pool", len(pending0) + len(pending1), now)
+                if session:
+                    tracer.depth("writer0", session.writers[0].queue.qsize(), now)
+                    tracer.depth("writer1", session.writers[1].queue.qsize(), now)
+                if store:
+                    tracer.depth("staged", len(store.staged), now)
 
-                
-                frame_writer0.write_frame(processed_frame0, frame_idx, gps_data0, system_time0)
-                frame_writer1.write_frame(processed_frame1, frame_idx, gps_data1, system_time1)
-                frame_idx += 1
+            for command, addr in control.poll():
+                cmd = command.get("cmd")
+                if cmd == "trigger":
+                    if not triggered:
+                        control.reply(addr, {"ok": False, "error": "triggered recording is off"})
+                        continue
+                    if session is None:
+                        control.reply(addr, {"ok": False, "error": "not recording"})
+                        continue
+                    until = session.recorder.trigger(command.get("reason", "manual"), command.get("duration"))
+                    control.reply(addr, {"ok": True, "seconds_left": round(until - time.monotonic(), 1)})
+                elif cmd in ("start", "rotate"):
+                    if cmd == "start" and session:
+                        control.reply(addr, {"ok": False, "error": "already recording", **session.status()})
+                        continue
+                    reply = switch(True)
+                    print(f"Session {cmd}: {reply['session']} ready in {reply['ms']} ms")
+                    control.reply(addr, reply)
+                elif cmd == "stop":
+                    if session is None:
+                        control.reply(addr, {"ok": False, "error": "not recording"})
+                        continue
+                    control.reply(addr, switch(False))
+                elif cmd == "trace":
+                    # Snapshot here, write on a background thread
+                    paths = tracer.dump(os.path.join(trace_dir, f"trace_{trace_name}_{tracer.frames}"),
+                                        background=True)
+                    control.reply(addr, {"ok": True, "paths": list(paths), **tracer.stats()})
+                elif cmd == "status":
+                    control.reply(addr, {"ok": True, "recording": session is not None,
+                                         "draining": [s.name for s in draining],
+                                         **(session.status() if session else {})})
+                else:
+                    control.reply(addr, {"ok": False, "error": f"unknown command {cmd!r}"})
+
+            if maneuver and session and not session.recorder.triggered:
+                reason = maneuver.check()
+                if reason:
+                    session.recorder.trigger(reason)
+
+            now = time.monotonic()
+            if now - last_status >= 1.0:
+                last_status = now
+                write_capture_status((monitor0, monitor1), storage=store.stats() if store else None,
+                                     analyzers=bus.stats())
+            if now - last_storage >= 5.0:
+                last_storage = now
+                degrade = DEGRADE[governor.sample(now)["level"]]
+                if degrade != secondary:
+                    secondary = degrade
+                    secondary_encoder = with_quality(encoder1, degrade["quality"])
+                    print(f"Storage {governor.level}: cam1 saves 1 in {degrade['every']} frames at quality "
+                          f"{secondary_encoder.quality}")
 
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
-            if frame_idx >= 100000:
-                break
+            if session and session.frame_idx >= max_frames:
+                switch(True)
 
     finally:
         # Clean up
         camera0.release()
         camera1.release()
         cv2.destroyAllWindows()
-        frame_writer0.stop()
-        frame_writer1.stop()
-        
+        control.close()
+        bus.close()
+        if session:
+            close_session(session)
+            session = None
+        for closer in closers:
+            closer.join()
+        if store:
+            store.close()
+        tracer.print_summary()
+        tracer.dump(os.path.join(trace_dir, f"trace_{trace_name}"))
+        clear_recording()
+        telemetry_buffer.close()
+
         # Close GPS reader
         if gps_reader:
             gps_reader.close()